@@ -2,12 +2,16 @@
 Django settings for backend project.
 """
 
+from importlib.util import find_spec
 from pathlib import Path
 import os
+import sys
 from dotenv import load_dotenv
 
 # 1. Diretórios e Variáveis de Ambiente
 BASE_DIR = Path(__file__).resolve().parent.parent
+# Módulos em Python puro compartilhados com o agente (ex.: device_identity.py) ficam na raiz do repositório
+sys.path.append(str(BASE_DIR.parent))
 env_path = BASE_DIR / '.env'
 load_dotenv(env_path)
 
@@ -27,6 +31,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres', # Lookups de trigrama usados pela busca (core/search.py)
     
     # Bibliotecas Necessárias
     'rest_framework',
@@ -39,6 +44,11 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware', # Deve ser o primeiro
     'django.middleware.security.SecurityMiddleware',
+    'core.middleware.RequestDecompressionMiddleware', # Corpos gzip/zstd (lotes dos agentes), antes de qualquer leitura
+    'core.middleware.AgentFastPathMiddleware', # check-auth/heartbeat dos agentes sem sessão, CSRF e DRF
+    'core.middleware.ReplicaPinMiddleware', # Leituras do primário logo após uma escrita do mesmo cliente
+    'django.middleware.gzip.GZipMiddleware', # Comprime respostas grandes (ex.: snapshot da Whitelist)
+    'core.middleware.ZstdMiddleware', # zstd no lugar do gzip para quem aceitar (roda antes dele na resposta)
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -70,6 +80,24 @@ CORS_ALLOW_HEADERS = [
     "x-requested-with",
 ]
 
+# --- FORMATOS DA API (core/wire.py) ---
+# JSON continua o padrão; MessagePack é negociado por Accept/Content-Type quando o pacote msgpack está instalado
+MSGPACK_ENABLED = find_spec('msgpack') is not None
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        *(['core.wire.MessagePackRenderer'] if MSGPACK_ENABLED else []),
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'rest_framework.parsers.JSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+        *(['core.wire.MessagePackParser'] if MSGPACK_ENABLED else []),
+    ],
+    'DEFAULT_CONTENT_NEGOTIATION_CLASS': 'core.wire.MessagePackNegotiation',
+}
+
 ROOT_URLCONF = 'backend.urls'
 
 TEMPLATES = [
@@ -98,9 +126,53 @@ DATABASES = {
         'PASSWORD': os.getenv('DB_PASSWORD'),
         'HOST': os.getenv('DB_HOST', 'localhost'),
         'PORT': os.getenv('DB_PORT', '5432'),
+        # Conexões persistentes (por thread), validadas antes de reutilizar
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
     }
 }
 
+# --- RÉPLICAS DE LEITURA (core/db_router.py) ---
+# DB_REPLICA_HOSTS="host1,host2:5433" liga o roteamento das leituras do dashboard.
+# Sem réplicas o alias 'replica' aponta para o próprio primário (espelho nos testes),
+# então o roteamento pode ser testado localmente com dois aliases.
+REPLICA_HOSTS = [host.strip() for host in os.getenv('DB_REPLICA_HOSTS', '').split(',') if host.strip()]
+for index, address in enumerate(REPLICA_HOSTS or [f"{DATABASES['default']['HOST']}:{DATABASES['default']['PORT']}"], start=1):
+    host, _, port = address.partition(':')
+    DATABASES['replica' if index == 1 else f'replica_{index}'] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['core.db_router.PrimaryReplicaRouter']
+DATABASE_READ_REPLICAS = [alias for alias in DATABASES if alias != 'default'] if REPLICA_HOSTS else []
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', 10)) # janela de read-your-writes após uma escrita
+REPLICA_RETRY_SECONDS = 30 # réplica que recusou conexão fica fora do sorteio por esse tempo
+
+# --- RETENÇÃO E PARTICIONAMENTO DO USBLOG (manage_log_partitions) ---
+USBLOG_PARTITION_MONTHS_AHEAD = int(os.getenv('USBLOG_PARTITION_MONTHS_AHEAD', 3))
+# Dias mantidos na tabela ativa; vazio = manter todo o histórico
+USBLOG_RETENTION_DAYS = int(os.getenv('USBLOG_RETENTION_DAYS')) if os.getenv('USBLOG_RETENTION_DAYS') else None
+# 'archive' move o mês para o schema usblog_archive; 'drop' apaga
+USBLOG_RETENTION_MODE = os.getenv('USBLOG_RETENTION_MODE', 'archive')
+
+# --- HEARTBEAT DOS AGENTES ---
+AGENT_HEARTBEAT_INTERVAL = int(os.getenv('AGENT_HEARTBEAT_INTERVAL', 30)) # segundos entre beats do agente
+AGENT_OFFLINE_AFTER = int(os.getenv('AGENT_OFFLINE_AFTER', 90)) # sem beat há mais que isso = offline
+AGENT_HEARTBEAT_JITTER = 0.2 # o agente sorteia cada intervalo em +/-20% (jittered() do monitor.py)
+HEARTBEAT_FLUSH_INTERVAL = 5 # segundos entre gravações em lote dos beats
+# Agente já online: regrava last_seen no máximo a cada X segundos. Descontados dois
+# intervalos no jitter máximo e um flush, o last_seen gravado nunca passa de
+# AGENT_OFFLINE_AFTER para um agente vivo (conferido na inicialização)
+HEARTBEAT_PERSIST_INTERVAL = max(0, AGENT_OFFLINE_AFTER - 2 * AGENT_HEARTBEAT_INTERVAL * (1 + AGENT_HEARTBEAT_JITTER) - HEARTBEAT_FLUSH_INTERVAL)
+
+# --- CACHE DE VEREDICTOS DO CHECK_AUTH ---
+CHECK_AUTH_CACHE_SIZE = 10000 # veredictos mantidos no LRU de cada processo
+CHECK_AUTH_CACHE_TTL = 5 # segundos entre conferências do diário da Whitelist (atraso máximo entre processos)
+# Alias de CACHES (ex.: Redis) para compartilhar veredictos entre processos; vazio = só o LRU local
+CHECK_AUTH_CACHE_ALIAS = os.getenv('CHECK_AUTH_CACHE_ALIAS') or None
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator'},
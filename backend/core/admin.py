@@ -1,21 +1,106 @@
-from django.contrib import admin
-from .models import Agent, USBLog, WhitelistedDevice
+from django.contrib import admin, messages
+from django.contrib.admin.views.main import ORDER_VAR, ChangeList
+from . import search
+from .models import Agent, DeviceInventory, DeviceSighting, USBLog, WhitelistedDevice, WhitelistChange
+from .pagination import EstimatedCountPaginator
+
+class RankedChangeList(ChangeList):
+    """ Resultados de busca anotados com search_rank vêm primeiro por relevância (salvo ordenação por coluna) """
+
+    def get_ordering(self, request, queryset):
+        ordering = super().get_ordering(request, queryset)
+        if 'search_rank' in queryset.query.annotations and ORDER_VAR not in self.params:
+            return ['-search_rank', *ordering]
+        return ordering
+
+class IndexedSearchMixin:
+    """
+    Busca do admin pelo core.search (índices trigram em vez de ILIKE sequencial)
+    e paginação com contagem estimada. 'search_fields' só habilita a caixa de
+    busca; os campos pesquisados são os de search.SEARCH_FIELDS[search_kind].
+    Com rank_results os resultados vêm ordenados pela relevância.
+    """
+    search_kind = None
+    rank_results = True
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False # Evita um segundo COUNT(*) na tabela inteira
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        if len(term) < search.MIN_TERM_LENGTH:
+            self.message_user(request, f"Use pelo menos {search.MIN_TERM_LENGTH} caracteres na busca.", messages.WARNING)
+            return queryset.none(), False
+        queryset = search.matching(queryset, self.search_kind, term)
+        if self.rank_results:
+            queryset = search.ranked(queryset, self.search_kind, term)
+        return queryset, False
+
+    def get_changelist(self, request, **kwargs):
+        return RankedChangeList
 
 # Registro do modelo de Agentes (Computadores monitorados)
 @admin.register(Agent)
-class AgentAdmin(admin.ModelAdmin):
+class AgentAdmin(IndexedSearchMixin, admin.ModelAdmin):
     list_display = ('hostname', 'ip_address', 'policy', 'last_seen')
-    search_fields = ('hostname', 'ip_address')
+    search_fields = ('hostname',)
+    search_kind = 'agents'
 
 # Registro do modelo de Logs (Histórico de detecções e bloqueios)
 @admin.register(USBLog)
-class USBLogAdmin(admin.ModelAdmin):
+class USBLogAdmin(IndexedSearchMixin, admin.ModelAdmin):
     list_display = ('timestamp', 'device_name', 'action_taken', 'agent', 'username')
     list_filter = ('action_taken', 'timestamp')
-    search_fields = ('device_name', 'device_id', 'agent__hostname')
+    list_select_related = ('agent',)
+    search_fields = ('device_name', 'device_id', 'username', 'agent__hostname')
+    search_kind = 'logs'
+    rank_results = False # Num log de auditoria a ordem cronológica vale mais que a relevância
 
 # Registro da Whitelist (Dispositivos autorizados)
 @admin.register(WhitelistedDevice)
-class WhitelistedDeviceAdmin(admin.ModelAdmin):
+class WhitelistedDeviceAdmin(IndexedSearchMixin, admin.ModelAdmin):
     list_display = ('device_name', 'device_id', 'added_at')
-    search_fields = ('device_name', 'device_id')
\ No newline at end of file
+    search_fields = ('device_name', 'device_id')
+    search_kind = 'whitelist'
+
+# Diário de versões da Whitelist (somente leitura, alimentado por sinais)
+@admin.register(WhitelistChange)
+class WhitelistChangeAdmin(admin.ModelAdmin):
+    list_display = ('id', 'op', 'device_id', 'changed_at')
+    list_filter = ('op',)
+    search_fields = ('device_id',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+# Inventário de dispositivos (mantido pela ingestão de logs; somente leitura)
+class DeviceSightingInline(admin.TabularInline):
+    model = DeviceSighting
+    fields = ('agent', 'username', 'first_seen', 'last_seen', 'total_events', 'blocked_events')
+    readonly_fields = fields
+    extra = 0
+    can_delete = False
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+@admin.register(DeviceInventory)
+class DeviceInventoryAdmin(IndexedSearchMixin, admin.ModelAdmin):
+    list_display = ('device_name', 'device_id', 'last_seen', 'total_events', 'blocked_events')
+    search_fields = ('device_name', 'device_id')
+    search_kind = 'devices'
+    readonly_fields = ('device_id', 'device_name', 'first_seen', 'last_seen', 'total_events', 'blocked_events')
+    inlines = [DeviceSightingInline]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
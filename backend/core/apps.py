@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from . import signals  # noqa: F401 (registra os receivers da Whitelist)
+        from .heartbeats import check_heartbeat_settings
+        check_heartbeat_settings()
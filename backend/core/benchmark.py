@@ -0,0 +1,331 @@
+"""
+Benchmark do protocolo agente <-> servidor.
+
+Uma frota de agentes virtuais percorre o mesmo ciclo do monitor.py (registro,
+sync da Whitelist, check_auth, envio em lote pela outbox, heartbeat) enquanto
+o Dashboard consulta /logs/ e dashboard_stats, tudo contra os viewsets reais
+do core e o banco configurado. Para cada endpoint mede latência (p50/p99),
+vazão e número de consultas SQL; compare() transforma um relatório salvo
+em gate de regressão. WireBenchmark compara os formatos de fio (JSON x
+MessagePack, sem compressão x gzip x zstd) em bytes e CPU do servidor.
+"""
+import io
+import json
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from datetime import datetime, timedelta, timezone
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test.utils import CaptureQueriesContext
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from bulk_session import hoist_session
+from . import wire
+from .db_router import replicas
+from .models import WhitelistedDevice
+from .serializers import WhitelistedDeviceSerializer
+from .verdicts import verdicts
+
+# Endpoint -> status HTTP considerados sucesso (check_auth responde 403 para bloqueados)
+EXPECTED_STATUS = {
+    'register': {200, 201},
+    'whitelist_sync': {200},
+    'check_auth': {200, 403},
+    'logs_bulk': {201},
+    'heartbeat': {204},
+    'logs_list': {200},
+    'dashboard_stats': {200},
+}
+
+# Folga na média de consultas: recargas periódicas de cache não contam como regressão
+QUERY_SLACK = 0.1
+
+def percentile(values, fraction):
+    """ Percentil por posição (nearest-rank) de uma lista não vazia """
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def device_id(index):
+    return f"BE{index % 16:02X}:{index:04X}:BENCH{index:08d}"
+
+class FleetBenchmark:
+    """
+    'agents' agentes virtuais, cada um com 'events' dispositivos sorteados
+    entre 'devices'; 'whitelist' desses dispositivos são autorizados.
+    Com workers > 1 os agentes rodam em paralelo (cada thread usa sua
+    própria conexão; prefira Postgres, o SQLite serializa as escritas).
+    """
+
+    def __init__(self, agents=50, events=10, devices=500, whitelist=100, batch_size=100, workers=1, seed=0):
+        self.agents = agents
+        self.events = events
+        self.devices = devices
+        self.whitelist = whitelist
+        self.batch_size = batch_size
+        self.workers = workers
+        self.seed = seed
+        self.samples = {name: [] for name in EXPECTED_STATUS}
+        self.errors = {name: 0 for name in EXPECTED_STATUS}
+
+    def seed_whitelist(self):
+        WhitelistedDevice.objects.bulk_create(
+            [WhitelistedDevice(device_id=device_id(i), device_name=f"Bench {i}") for i in range(self.whitelist)],
+            ignore_conflicts=True,
+        )
+        # bulk_create não dispara sinais: recomeça o cache de veredictos já com o Bloom montado
+        verdicts.reset()
+        verdicts.warm()
+
+    def call(self, client, endpoint, method, path, data=None):
+        with ExitStack() as stack:
+            # Primário e réplicas: leituras do dashboard podem ir para uma réplica
+            captures = [stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in [DEFAULT_DB_ALIAS, *replicas()]]
+            start = time.perf_counter()
+            if method == 'get':
+                response = client.get(path, data)
+            else:
+                response = client.post(path, data, format='json')
+            elapsed = (time.perf_counter() - start) * 1000
+        # list.append é atômico: as threads compartilham as listas sem lock
+        self.samples[endpoint].append((elapsed, sum(len(ctx.captured_queries) for ctx in captures)))
+        if response.status_code not in EXPECTED_STATUS[endpoint]:
+            self.errors[endpoint] += 1
+        return response
+
+    def run_agent(self, index):
+        client = APIClient()
+        rng = random.Random(self.seed * 100003 + index)
+        try:
+            registered = self.call(client, 'register', 'post', '/api/agents/register/', {
+                "hostname": f"BENCH-{index:05}",
+                "mac_address": f"02:BE:{index >> 16 & 0xff:02X}:{index >> 8 & 0xff:02X}:{index & 0xff:02X}:00",
+                "ip_address": f"10.{index >> 16 & 0xff}.{index >> 8 & 0xff}.{index & 0xff}",
+                "policy": "BLOCK_ALL",
+            })
+            agent_id = registered.json()['id']
+            self.call(client, 'whitelist_sync', 'get', '/api/whitelist/sync/', {"since": 0})
+
+            outbox = []
+            for _ in range(self.events):
+                hw_id = device_id(rng.randrange(self.devices))
+                verdict = self.call(client, 'check_auth', 'get', f'/api/agents/check-auth/{hw_id}/')
+                outbox.append({
+                    "agent": agent_id,
+                    "device_name": "Pendrive Bench",
+                    "device_id": hw_id,
+                    "action_taken": "AUTHORIZED" if verdict.status_code == 200 else "BLOCKED",
+                    "username": "bench",
+                })
+                if len(outbox) >= self.batch_size:
+                    self.call(client, 'logs_bulk', 'post', '/api/logs/bulk/', {"events": outbox})
+                    outbox = []
+            if outbox:
+                self.call(client, 'logs_bulk', 'post', '/api/logs/bulk/', {"events": outbox})
+
+            self.call(client, 'heartbeat', 'post', '/api/agents/heartbeat/', {"agent": agent_id})
+
+            # Um Dashboard aberto fazendo polling a cada ciclo de agente
+            self.call(client, 'logs_list', 'get', '/api/logs/')
+            self.call(client, 'dashboard_stats', 'get', '/api/agents/dashboard_stats/')
+        finally:
+            if self.workers > 1:
+                connection.close() # Conexão própria da thread
+
+    def run(self):
+        self.seed_whitelist()
+        # Os 403 esperados do check_auth não devem inundar o log nem pesar na medição
+        request_logger = logging.getLogger('django.request')
+        previous_level = request_logger.level
+        request_logger.setLevel(logging.ERROR)
+        start = time.perf_counter()
+        try:
+            if self.workers > 1:
+                with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                    list(pool.map(self.run_agent, range(self.agents)))
+            else:
+                for index in range(self.agents):
+                    self.run_agent(index)
+        finally:
+            request_logger.setLevel(previous_level)
+        return self.report(time.perf_counter() - start)
+
+    def report(self, wall_seconds):
+        endpoints = {}
+        for name, samples in self.samples.items():
+            if not samples:
+                continue
+            latencies = [ms for ms, _ in samples]
+            queries = [q for _, q in samples]
+            endpoints[name] = {
+                "requests": len(samples),
+                "errors": self.errors[name],
+                "p50_ms": round(percentile(latencies, 0.50), 3),
+                "p99_ms": round(percentile(latencies, 0.99), 3),
+                "throughput_per_s": round(len(samples) / wall_seconds, 1),
+                "queries_mean": round(sum(queries) / len(queries), 2),
+                "queries_max": max(queries),
+            }
+        total = sum(item["requests"] for item in endpoints.values())
+        return {
+            "config": {
+                "agents": self.agents, "events": self.events, "devices": self.devices,
+                "whitelist": self.whitelist, "batch_size": self.batch_size, "workers": self.workers,
+            },
+            "wall_seconds": round(wall_seconds, 3),
+            "throughput_per_s": round(total / wall_seconds, 1),
+            "endpoints": endpoints,
+        }
+
+def compare(report, baseline, tolerance=0.25):
+    """
+    Regressões do relatório em relação a um baseline salvo: média de consultas
+    SQL por requisição acima do baseline (uma consulta a mais por requisição
+    sempre estoura a folga) ou p99 acima do baseline + tolerância.
+    """
+    regressions = []
+    for name, base in baseline.get('endpoints', {}).items():
+        current = report['endpoints'].get(name)
+        if current is None:
+            continue
+        if current['queries_mean'] > base['queries_mean'] + QUERY_SLACK:
+            regressions.append(f"{name}: {current['queries_mean']} consultas/req (baseline {base['queries_mean']})")
+        if current['p99_ms'] > base['p99_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p99 {current['p99_ms']} ms (baseline {base['p99_ms']} ms)")
+        if current['errors'] > base['errors']:
+            regressions.append(f"{name}: {current['errors']} erros (baseline {base['errors']})")
+    return regressions
+
+# --- FORMATO DE FIO ---
+DEVICE_NAMES = [
+    "Kingston DataTraveler 3.0 USB Device", "SanDisk Cruzer Blade USB Device",
+    "Generic Mass Storage USB Device", "Seagate Expansion Desk USB Device",
+    "Logitech USB Receiver", "WD Elements 25A2 USB Device",
+]
+
+# (nome, media type, Content-Encoding, campos da sessão uma vez por lote)
+# 'json' é o caminho atual: requests.post(json=...) com todos os campos em cada evento
+WIRE_FORMATS = [
+    ('json', 'json', None, False),
+    ('json+gzip', 'json', 'gzip', True),
+    ('json+zstd', 'json', 'zstd', True),
+    ('msgpack', 'msgpack', None, True),
+    ('msgpack+gzip', 'msgpack', 'gzip', True),
+    ('msgpack+zstd', 'msgpack', 'zstd', True),
+]
+
+class WireBenchmark:
+    """
+    Bytes no fio e CPU do servidor por item em cada formato de WIRE_FORMATS,
+    sem banco e sem rede:
+    - upload: lotes de 'batch_size' eventos como os da outbox do agente;
+      mede a descompressão e o parser do DRF (o que o servidor faz antes do serializer);
+    - whitelist: lista do WhitelistedDeviceSerializer com 'whitelist' regras;
+      mede o renderer do DRF e a compressão da resposta.
+    Formatos cujo pacote opcional (msgpack, zstandard) falta ficam em 'unavailable'.
+    """
+
+    def __init__(self, events=2000, batch_size=100, whitelist=1000, repeat=20, seed=0):
+        self.events = events
+        self.batch_size = batch_size
+        self.whitelist = whitelist
+        self.repeat = repeat
+        self.seed = seed
+
+    def make_events(self):
+        rng = random.Random(self.seed)
+        start = datetime(2026, 1, 5, 8, 0, tzinfo=timezone.utc)
+        return [{
+            "agent": 42,
+            "device_name": rng.choice(DEVICE_NAMES),
+            "device_id": f"{rng.randrange(0x10000):04X}:{rng.randrange(0x10000):04X}:{rng.getrandbits(48):012X}",
+            "action_taken": rng.choice(["BLOCKED", "AUTHORIZED"]),
+            "username": "maria.souza",
+            "ip_address": "10.20.30.40",
+            "timestamp": (start + timedelta(seconds=i * 7)).isoformat(),
+        } for i in range(self.events)]
+
+    def make_whitelist(self):
+        added_at = datetime(2026, 1, 5, 8, 0, tzinfo=timezone.utc)
+        devices = [
+            WhitelistedDevice(id=i + 1, device_id=device_id(i), device_name=DEVICE_NAMES[i % len(DEVICE_NAMES)],
+                              added_at=added_at, description="Liberado pelo TI" if i % 3 == 0 else None)
+            for i in range(self.whitelist)
+        ]
+        return WhitelistedDeviceSerializer(devices, many=True).data
+
+    @staticmethod
+    def available(media, encoding):
+        if media == 'msgpack' and wire.msgpack is None:
+            return False
+        return encoding != 'zstd' or wire.zstandard is not None
+
+    @staticmethod
+    def codec(media):
+        if media == 'msgpack':
+            return wire.MessagePackRenderer(), wire.MessagePackParser()
+        return JSONRenderer(), JSONParser()
+
+    def cpu(self, work):
+        """ Segundos de CPU do processo para 'repeat' execuções de work() """
+        start = time.process_time()
+        for _ in range(self.repeat):
+            work()
+        return (time.process_time() - start) / self.repeat
+
+    def measure_upload(self, batches, media, encoding, hoist):
+        renderer, parser = self.codec(media)
+        bodies = []
+        for batch in batches:
+            payload = hoist_session(batch) if hoist else {"events": batch}
+            # JSON como o agente envia hoje (json.dumps do requests); MessagePack pelo renderer
+            body = json.dumps(payload).encode() if media == 'json' else renderer.render(payload)
+            bodies.append(wire.compress(body, encoding) if encoding else body)
+
+        def server():
+            for body in bodies:
+                data = parser.parse(io.BytesIO(wire.decompress(body, encoding) if encoding else body))
+                session = data.get('session') or {}
+                [{**session, **event} for event in data['events']]
+
+        return sum(len(body) for body in bodies), self.cpu(server)
+
+    def measure_whitelist(self, data, media, encoding):
+        renderer, _ = self.codec(media)
+        body = renderer.render(data)
+        size = len(wire.compress(body, encoding)) if encoding else len(body)
+
+        def server():
+            body = renderer.render(data)
+            if encoding:
+                wire.compress(body, encoding)
+
+        return size, self.cpu(server)
+
+    def run(self):
+        events = self.make_events()
+        batches = [events[i:i + self.batch_size] for i in range(0, len(events), self.batch_size)]
+        whitelist = self.make_whitelist()
+
+        upload, downloads, unavailable = {}, {}, []
+        for name, media, encoding, hoist in WIRE_FORMATS:
+            if not self.available(media, encoding):
+                unavailable.append(name)
+                continue
+            size, seconds = self.measure_upload(batches, media, encoding, hoist)
+            upload[name] = {"bytes_per_event": round(size / len(events), 1), "server_us_per_event": round(seconds / len(events) * 1e6, 3)}
+            size, seconds = self.measure_whitelist(whitelist, media, encoding)
+            downloads[name] = {"bytes_per_item": round(size / len(whitelist), 1), "server_us_per_item": round(seconds / len(whitelist) * 1e6, 3)}
+
+        # Proporção frente ao caminho atual (JSON puro)
+        for rows, key in ((upload, 'bytes_per_event'), (downloads, 'bytes_per_item')):
+            for row in rows.values():
+                row["bytes_vs_json"] = round(row[key] / rows['json'][key], 3)
+        return {
+            "config": {"events": self.events, "batch_size": self.batch_size, "whitelist": self.whitelist, "repeat": self.repeat},
+            "upload": upload,
+            "whitelist": downloads,
+            "unavailable": unavailable,
+        }
@@ -0,0 +1,85 @@
+import asyncio
+import json
+import threading
+from asgiref.sync import sync_to_async
+
+# Tamanho máximo da fila de cada assinante antes de ser considerado lento
+SUBSCRIBER_QUEUE_SIZE = 100
+# Intervalo mínimo entre dois envios de estatísticas (coalesce rajadas de logs)
+STATS_INTERVAL = 1.0
+
+def format_sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+class Broadcaster:
+    """
+    Difusor em processo para o stream do dashboard (SSE sobre o ASGI).
+    Cada mensagem é serializada uma única vez e copiada para a fila de
+    cada assinante. Assinantes lentos não seguram os demais: quando a fila
+    enche, ela é descartada e o cliente recebe 'resync' para buscar o que
+    perdeu via /logs/?since=. As estatísticas são recalculadas no máximo uma
+    vez por STATS_INTERVAL, independente de quantos navegadores estão abertos.
+    """
+
+    def __init__(self):
+        self._subscribers = set()
+        self._loop = None
+        self._lock = threading.Lock()
+        self._stats_dirty = False
+        self._stats_task = None
+
+    @property
+    def has_subscribers(self):
+        return bool(self._subscribers)
+
+    def subscribe(self):
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        with self._lock:
+            self._loop = asyncio.get_running_loop()
+            self._subscribers.add(queue)
+        if self._stats_task is None or self._stats_task.done():
+            self._stats_task = self._loop.create_task(self._stats_ticker())
+        return queue
+
+    def unsubscribe(self, queue):
+        with self._lock:
+            self._subscribers.discard(queue)
+
+    def publish(self, event, data):
+        """ Pode ser chamado de qualquer thread (views síncronas, sinais) """
+        with self._lock:
+            loop = self._loop
+            if loop is None or not self._subscribers:
+                return
+        message = format_sse(event, data)
+        loop.call_soon_threadsafe(self._fanout, message)
+
+    def mark_stats_dirty(self):
+        self._stats_dirty = True
+
+    def _fanout(self, message):
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # Contrapressão: descarta o atraso do assinante lento e pede ressincronização
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(format_sse('resync', {}))
+
+    async def _stats_ticker(self):
+        from .stats import get_dashboard_stats
+        while self._subscribers:
+            await asyncio.sleep(STATS_INTERVAL)
+            if not self._stats_dirty:
+                continue
+            self._stats_dirty = False
+            stats = await sync_to_async(get_dashboard_stats, thread_sensitive=False)()
+            self._fanout(format_sse('stats', stats))
+
+broadcaster = Broadcaster()
+
+def publish_logs(logs):
+    """ Envia novos logs (já serializados) aos dashboards e agenda a atualização das estatísticas """
+    broadcaster.publish('logs', logs)
+    broadcaster.mark_stats_dirty()
@@ -0,0 +1,82 @@
+"""
+Roteamento entre o primário e as réplicas de leitura.
+
+Por padrão tudo vai para o primário (escritas, check_auth, heartbeats, o
+cache de veredictos). Só as leituras pesadas do dashboard marcadas com
+replica_reads() (listagem de logs, dashboard_stats, busca, inventário,
+exportações) vão para uma réplica de DATABASE_READ_REPLICAS, e mesmo
+essas voltam ao primário quando:
+- a própria requisição já escreveu algo (o resto dela lê do primário);
+- o cliente escreveu há menos de REPLICA_PIN_SECONDS: o ReplicaPinMiddleware
+  marca a resposta de uma escrita com um cookie e o cliente lê o que acabou
+  de gravar mesmo com atraso de replicação;
+- a réplica sorteada não respondeu há pouco (fica fora por REPLICA_RETRY_SECONDS).
+"""
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+
+PIN_COOKIE = 'sentinel_primary_pin'
+
+_replica = ContextVar('sentinel_replica', default=None) # Alias do bloco replica_reads() atual
+_pinned = ContextVar('sentinel_pinned', default=False) # Cliente escreveu há pouco (cookie)
+_wrote = ContextVar('sentinel_wrote', default=False) # Esta requisição já escreveu
+_down_until = {} # alias -> monotonic até quando a réplica fica fora do sorteio
+
+def replicas():
+    return getattr(settings, 'DATABASE_READ_REPLICAS', [])
+
+def begin_request(pinned):
+    """ Chamado pelo middleware no início de cada requisição (os ContextVars sobrevivem entre requisições da mesma thread) """
+    _pinned.set(pinned)
+    _wrote.set(False)
+
+def request_wrote():
+    return _wrote.get()
+
+def choose_replica():
+    """ Réplica saudável sorteada, ou None para ler do primário """
+    if _pinned.get() or _wrote.get():
+        return None
+    now = time.monotonic()
+    candidates = [alias for alias in replicas() if _down_until.get(alias, 0) <= now]
+    random.shuffle(candidates)
+    for alias in candidates:
+        try:
+            # Com CONN_MAX_AGE a conexão persiste; CONN_HEALTH_CHECKS descarta uma conexão morta antes do uso
+            connections[alias].ensure_connection()
+        except OperationalError:
+            _down_until[alias] = now + getattr(settings, 'REPLICA_RETRY_SECONDS', 30)
+            continue
+        return alias
+    return None
+
+@contextmanager
+def replica_reads():
+    """ Leituras dentro do bloco (ou da view decorada com @replica_reads()) podem ir para uma réplica """
+    token = _replica.set(choose_replica())
+    try:
+        yield
+    finally:
+        _replica.reset(token)
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        alias = _replica.get()
+        if alias is None or _wrote.get():
+            return DEFAULT_DB_ALIAS
+        return alias
+
+    def db_for_write(self, model, **hints):
+        _wrote.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Réplicas são cópias físicas do primário: objetos de qualquer alias se relacionam
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
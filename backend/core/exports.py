@@ -0,0 +1,136 @@
+"""
+Exportações em streaming (Whitelist e auditoria do USBLog).
+
+As linhas vêm de .iterator(chunk_size=...) — cursor no servidor no Postgres —
+e são convertidas em blocos de texto/bytes à medida que são lidas, então a
+memória fica constante independente do número de linhas. Parquet é opcional
+(requer pyarrow) e é escrito em row groups de CHUNK_SIZE linhas.
+"""
+import csv
+import io
+import json
+from datetime import datetime
+from itertools import islice
+try:
+    import pyarrow as pa # Opcional: só para o formato Parquet
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+CHUNK_SIZE = 2000
+FLUSH_BYTES = 64 * 1024 # tamanho aproximado de cada pedaço enviado ao cliente
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+# Colunas do export de auditoria: (nome no arquivo, campo do ORM)
+USBLOG_COLUMNS = [
+    ('id', 'id'),
+    ('timestamp', 'timestamp'),
+    ('agent_id', 'agent_id'),
+    ('hostname', 'agent__hostname'),
+    ('device_name', 'device_name'),
+    ('device_id', 'device_id'),
+    ('action_taken', 'action_taken'),
+    ('username', 'username'),
+    ('ip_address', 'ip_address'),
+]
+
+def plain(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def stream_csv(header, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(header)
+    for row in rows:
+        writer.writerow([plain(value) for value in row])
+        if buffer.tell() > FLUSH_BYTES:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+def stream_ndjson(header, rows):
+    lines = []
+    size = 0
+    for row in rows:
+        line = json.dumps({key: plain(value) for key, value in zip(header, row)}) + "\n"
+        lines.append(line)
+        size += len(line)
+        if size > FLUSH_BYTES:
+            yield ''.join(lines)
+            lines, size = [], 0
+    yield ''.join(lines)
+
+class ParquetSink:
+    """ Destino só-escrita do ParquetWriter: guarda os bytes até serem repassados ao cliente """
+
+    closed = False
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+def usblog_parquet_schema():
+    return pa.schema([
+        ('id', pa.int64()),
+        ('timestamp', pa.timestamp('us', tz='UTC')),
+        ('agent_id', pa.int64()),
+        ('hostname', pa.string()),
+        ('device_name', pa.string()),
+        ('device_id', pa.string()),
+        ('action_taken', pa.string()),
+        ('username', pa.string()),
+        ('ip_address', pa.string()),
+    ])
+
+def stream_parquet(schema, rows, chunk_size=CHUNK_SIZE):
+    """ Um row group por bloco de linhas; o rodapé do Parquet sai no último pedaço """
+    sink = ParquetSink()
+    writer = pq.ParquetWriter(sink, schema)
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            break
+        columns = list(zip(*chunk))
+        writer.write_table(pa.Table.from_arrays([pa.array(col, type=field.type) for col, field in zip(columns, schema)], schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+def usblog_rows(queryset, chunk_size=CHUNK_SIZE):
+    """ Linhas do USBLog em ordem cronológica, lidas em blocos pelo cursor do servidor """
+    fields = [field for _, field in USBLOG_COLUMNS]
+    return queryset.order_by('timestamp', 'id').values_list(*fields).iterator(chunk_size=chunk_size)
+
+def stream_usblog(queryset, file_type, chunk_size=CHUNK_SIZE):
+    header = [name for name, _ in USBLOG_COLUMNS]
+    rows = usblog_rows(queryset, chunk_size)
+    if file_type == 'parquet':
+        return stream_parquet(usblog_parquet_schema(), rows, chunk_size)
+    if file_type == 'ndjson':
+        return stream_ndjson(header, rows)
+    return stream_csv(header, rows)
@@ -0,0 +1,103 @@
+import threading
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.utils import timezone
+from .broadcast import broadcaster
+from .models import Agent
+
+class HeartbeatBuffer:
+    """
+    Agrega os heartbeats dos agentes em memória e grava em lote.
+    Cada beat só atualiza um dicionário; a cada HEARTBEAT_FLUSH_INTERVAL a
+    requisição que cruza o prazo grava tudo com um único bulk_update (linhas
+    em ordem de id, sem disputa de lock entre processos). Um agente já
+    online só tem o last_seen regravado depois de HEARTBEAT_PERSIST_INTERVAL,
+    então o banco vê bem menos escritas do que o número de beats. Quem o
+    sweeper marcou offline (em qualquer processo) é regravado no beat seguinte.
+    """
+
+    def __init__(self):
+        self._pending = {}
+        self._persisted = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        self._last_sweep = time.monotonic()
+
+    def beat(self, agent_id, ip_address=None):
+        with self._lock:
+            self._pending[agent_id] = (timezone.now(), ip_address)
+            due = time.monotonic() - self._last_flush >= settings.HEARTBEAT_FLUSH_INTERVAL
+        if due:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+            sweep_due = time.monotonic() - self._last_sweep >= settings.AGENT_OFFLINE_AFTER / 3
+            if sweep_due:
+                self._last_sweep = time.monotonic()
+
+        persist_after = timedelta(seconds=settings.HEARTBEAT_PERSIST_INTERVAL)
+        recent = set()
+        for agent_id, (seen_at, ip_address) in pending.items():
+            persisted_at, persisted_ip = self._persisted.get(agent_id, (None, None))
+            if persisted_at and seen_at - persisted_at < persist_after and ip_address in (None, persisted_ip):
+                recent.add(agent_id)
+        if recent:
+            # Só pula quem a linha confirma online: o sweeper pode ter marcado offline depois da última gravação
+            recent -= set(Agent.objects.filter(id__in=recent, is_online=False).values_list('id', flat=True))
+
+        updates = []
+        for agent_id in sorted(pending):
+            if agent_id in recent:
+                continue
+            seen_at, ip_address = pending[agent_id]
+            persisted_ip = self._persisted.get(agent_id, (None, None))[1]
+            agent = Agent(id=agent_id, last_seen=seen_at, is_online=True, ip_address=ip_address or persisted_ip)
+            updates.append(agent)
+
+        if updates:
+            with transaction.atomic():
+                fields = ['last_seen', 'is_online']
+                with_ip = [a for a in updates if a.ip_address]
+                without_ip = [a for a in updates if not a.ip_address]
+                Agent.objects.bulk_update(with_ip, fields + ['ip_address'], batch_size=1000)
+                Agent.objects.bulk_update(without_ip, fields, batch_size=1000)
+            for agent in updates:
+                self._persisted[agent.id] = (agent.last_seen, agent.ip_address)
+            broadcaster.mark_stats_dirty()
+
+        if sweep_due:
+            mark_stale_agents_offline()
+        return len(updates)
+
+def check_heartbeat_settings():
+    """
+    Pior caso até o last_seen de um agente vivo ser regravado: o intervalo de
+    persistência, mais dois beats no jitter máximo, mais um flush. Precisa
+    caber em AGENT_OFFLINE_AFTER, senão o sweeper derruba agentes vivos.
+    """
+    worst_lag = (
+        settings.HEARTBEAT_PERSIST_INTERVAL
+        + 2 * settings.AGENT_HEARTBEAT_INTERVAL * (1 + settings.AGENT_HEARTBEAT_JITTER)
+        + settings.HEARTBEAT_FLUSH_INTERVAL
+    )
+    if worst_lag > settings.AGENT_OFFLINE_AFTER:
+        raise ImproperlyConfigured(
+            f"Heartbeat: last_seen pode atrasar {worst_lag:.0f} s, mais que AGENT_OFFLINE_AFTER "
+            f"({settings.AGENT_OFFLINE_AFTER} s); reduza HEARTBEAT_PERSIST_INTERVAL ou o intervalo dos beats"
+        )
+
+def mark_stale_agents_offline():
+    """ Marca offline quem não mandou heartbeat dentro de AGENT_OFFLINE_AFTER (um UPDATE indexado) """
+    cutoff = timezone.now() - timedelta(seconds=settings.AGENT_OFFLINE_AFTER)
+    stale = Agent.objects.filter(is_online=True, last_seen__lt=cutoff).update(is_online=False)
+    if stale:
+        broadcaster.mark_stats_dirty()
+    return stale
+
+heartbeats = HeartbeatBuffer()
@@ -0,0 +1,137 @@
+"""
+Inventário de dispositivos da frota (DeviceInventory + DeviceSighting).
+
+Cada gravação de logs agrega o lote em memória e faz dois upserts em massa
+(INSERT ... ON CONFLICT DO UPDATE): um por dispositivo e um por dispositivo,
+agente e usuário, somando contadores e alargando first_seen/last_seen. O custo
+é proporcional aos dispositivos distintos do lote, não ao tamanho do USBLog.
+As linhas vão em ordem de chave, então lotes concorrentes não entram em deadlock.
+"""
+from itertools import islice
+from django.db import connections, router, transaction
+from .models import DeviceInventory, DeviceSighting, USBLog
+
+BLOCKED = 'BLOCKED'
+UPSERT_BATCH = 500 # linhas por INSERT (limite de parâmetros do SQLite)
+BACKFILL_CHUNK_SIZE = 5000
+
+# Colunas lidas do USBLog, na ordem esperada por aggregate()
+LOG_FIELDS = ('device_id', 'device_name', 'agent_id', 'username', 'action_taken', 'timestamp')
+
+def aggregate(rows):
+    """ Agrupa linhas (LOG_FIELDS) por dispositivo e por (dispositivo, agente, usuário) """
+    devices, sightings = {}, {}
+    for device_id, device_name, agent_id, username, action, timestamp in rows:
+        blocked = 1 if action == BLOCKED else 0
+        device = devices.get(device_id)
+        if device is None:
+            devices[device_id] = [device_name, timestamp, timestamp, 1, blocked]
+        else:
+            if timestamp >= device[2]:
+                device[0], device[2] = device_name, timestamp
+            device[1] = min(device[1], timestamp)
+            device[3] += 1
+            device[4] += blocked
+
+        key = (device_id, agent_id, username or '')
+        sighting = sightings.get(key)
+        if sighting is None:
+            sightings[key] = [timestamp, timestamp, 1, blocked]
+        else:
+            sighting[0] = min(sighting[0], timestamp)
+            sighting[1] = max(sighting[1], timestamp)
+            sighting[2] += 1
+            sighting[3] += blocked
+    return devices, sightings
+
+def _upsert(cursor, ops, table, columns, conflict, rows):
+    """ INSERT em lote somando contadores e alargando o intervalo visto quando a linha já existe """
+    qn = ops.quote_name
+    table = qn(table)
+    merge = {
+        'device_name': f"CASE WHEN EXCLUDED.{qn('last_seen')} >= {table}.{qn('last_seen')} "
+                       f"THEN EXCLUDED.{qn('device_name')} ELSE {table}.{qn('device_name')} END",
+        'first_seen': f"CASE WHEN EXCLUDED.{qn('first_seen')} < {table}.{qn('first_seen')} "
+                      f"THEN EXCLUDED.{qn('first_seen')} ELSE {table}.{qn('first_seen')} END",
+        'last_seen': f"CASE WHEN EXCLUDED.{qn('last_seen')} > {table}.{qn('last_seen')} "
+                     f"THEN EXCLUDED.{qn('last_seen')} ELSE {table}.{qn('last_seen')} END",
+        'total_events': f"{table}.{qn('total_events')} + EXCLUDED.{qn('total_events')}",
+        'blocked_events': f"{table}.{qn('blocked_events')} + EXCLUDED.{qn('blocked_events')}",
+    }
+    updates = ", ".join(f"{qn(column)} = {merge[column]}" for column in columns if column in merge)
+    placeholders = "(" + ", ".join(["%s"] * len(columns)) + ")"
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, UPSERT_BATCH))
+        if not batch:
+            break
+        cursor.execute(
+            f"INSERT INTO {table} ({', '.join(qn(column) for column in columns)}) "
+            f"VALUES {', '.join([placeholders] * len(batch))} "
+            f"ON CONFLICT ({', '.join(qn(column) for column in conflict)}) DO UPDATE SET {updates}",
+            [value for row in batch for value in row],
+        )
+
+def record(rows):
+    """ Soma as linhas de log (LOG_FIELDS) ao inventário; chamar dentro da transação da escrita """
+    devices, sightings = aggregate(rows)
+    if not devices:
+        return
+    connection = connections[router.db_for_write(DeviceInventory)]
+    ops = connection.ops
+    when = ops.adapt_datetimefield_value
+    with connection.cursor() as cursor:
+        _upsert(
+            cursor, ops, DeviceInventory._meta.db_table,
+            ['device_id', 'device_name', 'first_seen', 'last_seen', 'total_events', 'blocked_events'],
+            ['device_id'],
+            ((device_id, name, when(first), when(last), total, blocked)
+             for device_id, (name, first, last, total, blocked) in sorted(devices.items())),
+        )
+        _upsert(
+            cursor, ops, DeviceSighting._meta.db_table,
+            ['device_id', 'agent_id', 'username', 'first_seen', 'last_seen', 'total_events', 'blocked_events'],
+            ['device_id', 'agent_id', 'username'],
+            ((device_id, agent_id, username, when(first), when(last), total, blocked)
+             for (device_id, agent_id, username), (first, last, total, blocked) in sorted(sightings.items())),
+        )
+
+def record_logs(logs):
+    record([tuple(getattr(log, field) for field in LOG_FIELDS) for log in logs])
+
+def backfill(chunk_size=BACKFILL_CHUNK_SIZE):
+    """
+    Reconstrói o inventário a partir do USBLog, em blocos de chunk_size linhas
+    por ordem de id (uma transação por bloco). Gera o total processado após
+    cada bloco. Logs gravados depois da limpeza já entram pelo caminho normal
+    de escrita, por isso só são lidos os ids existentes naquele momento.
+
+    No PostgreSQL a limpeza trava o USBLog em SHARE MODE: espera as gravações
+    em andamento e segura as novas até o corte, para que nenhum log com id
+    abaixo dele commite depois e seja somado duas vezes (escrita + replay).
+    Gravações fora de transação (ex.: USBLog.objects.create no shell) não são
+    cobertas pela trava; se houver alguma em curso, rode com a ingestão parada.
+    """
+    connection = connections[router.db_for_write(DeviceInventory)]
+    qn = connection.ops.quote_name
+    with transaction.atomic(using=connection.alias):
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute(f"LOCK TABLE {qn(USBLog._meta.db_table)} IN SHARE MODE")
+            for model in (DeviceSighting, DeviceInventory):
+                cursor.execute(f"DELETE FROM {qn(model._meta.db_table)}")
+        upto = USBLog.objects.using(connection.alias).order_by('-id').values_list('id', flat=True).first() or 0
+
+    last_id, processed = 0, 0
+    while last_id < upto:
+        rows = list(
+            USBLog.objects.using(connection.alias).filter(id__gt=last_id, id__lte=upto)
+            .order_by('id').values_list('id', *LOG_FIELDS)[:chunk_size]
+        )
+        if not rows:
+            break
+        with transaction.atomic(using=connection.alias):
+            record(row[1:] for row in rows)
+        last_id = rows[-1][0]
+        processed += len(rows)
+        yield processed
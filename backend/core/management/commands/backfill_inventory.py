@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+from core import inventory
+
+class Command(BaseCommand):
+    help = (
+        "Reconstrói o inventário de dispositivos (DeviceInventory/DeviceSighting) a partir do "
+        "USBLog, lendo em blocos. Necessário uma vez após a migração; depois é mantido na escrita. "
+        "No PostgreSQL a ingestão pode continuar durante a reconstrução; em outros bancos, ou com "
+        "gravações fora de transação, pare a ingestão antes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=inventory.BACKFILL_CHUNK_SIZE, help="Logs lidos por bloco")
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError("--chunk-size deve ser positivo")
+
+        processed = 0
+        for processed in inventory.backfill(options['chunk_size']):
+            self.stderr.write(f"{processed} logs processados...")
+        self.stdout.write(self.style.SUCCESS(f"Inventário reconstruído a partir de {processed} logs"))
@@ -0,0 +1,66 @@
+import json
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from core.benchmark import FleetBenchmark, compare
+
+class Command(BaseCommand):
+    help = (
+        "Simula uma frota de agentes contra a API (registro, check_auth, logs em lote, heartbeat) "
+        "e mede p50/p99, vazão e consultas SQL por endpoint. Com --baseline funciona como gate de regressão."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--agents', type=int, default=50, help="Agentes virtuais")
+        parser.add_argument('--events', type=int, default=10, help="Dispositivos inseridos por agente")
+        parser.add_argument('--devices', type=int, default=500, help="Dispositivos distintos na frota")
+        parser.add_argument('--whitelist', type=int, default=100, help="Quantos desses dispositivos são autorizados")
+        parser.add_argument('--workers', type=int, default=1, help="Agentes em paralelo (threads)")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help="Grava o relatório JSON neste arquivo (use como baseline)")
+        parser.add_argument('--baseline', help="Relatório anterior: falha se houver regressão")
+        parser.add_argument('--tolerance', type=float, default=0.25, help="Folga relativa do p99 frente ao baseline")
+        parser.add_argument('--in-place', action='store_true',
+                            help="Usa o banco configurado em vez de um banco de teste descartável (grava dados!)")
+
+    def handle(self, *args, **options):
+        bench = FleetBenchmark(
+            agents=options['agents'], events=options['events'], devices=options['devices'],
+            whitelist=options['whitelist'], workers=options['workers'], seed=options['seed'],
+        )
+
+        setup_test_environment()
+        old_name = None if options['in_place'] else connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            # As réplicas não enxergam o banco de teste descartável: nesse caso tudo vai para o primário
+            replicas = settings.DATABASE_READ_REPLICAS if old_name is None else []
+            with override_settings(DATABASE_READ_REPLICAS=replicas):
+                report = bench.run()
+        finally:
+            if old_name is not None:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        self.print_report(report)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+
+        if options['baseline']:
+            with open(options['baseline'], 'r', encoding='utf-8') as f:
+                regressions = compare(report, json.load(f), options['tolerance'])
+            if regressions:
+                raise CommandError("Regressões em relação ao baseline:\n" + "\n".join(regressions))
+            self.stdout.write(self.style.SUCCESS("Sem regressões em relação ao baseline"))
+
+    def print_report(self, report):
+        self.stdout.write(f"{'endpoint':<16} {'req':>6} {'err':>4} {'p50 ms':>9} {'p99 ms':>9} {'req/s':>8} {'sql':>6} {'sql máx':>8}")
+        for name, row in report['endpoints'].items():
+            self.stdout.write(
+                f"{name:<16} {row['requests']:>6} {row['errors']:>4} {row['p50_ms']:>9.2f} {row['p99_ms']:>9.2f} "
+                f"{row['throughput_per_s']:>8.1f} {row['queries_mean']:>6.2f} {row['queries_max']:>8}"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"{report['config']['agents']} agentes em {report['wall_seconds']} s ({report['throughput_per_s']} req/s)"
+        ))
@@ -0,0 +1,42 @@
+import json
+from django.core.management.base import BaseCommand, CommandError
+from core.benchmark import WireBenchmark
+
+class Command(BaseCommand):
+    help = (
+        "Compara os formatos de fio da API (JSON, MessagePack; sem compressão, gzip, zstd): "
+        "bytes e CPU do servidor por evento no upload em lote e por regra no snapshot da Whitelist."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--events', type=int, default=2000, help="Eventos enviados (em lotes de --batch-size)")
+        parser.add_argument('--batch-size', type=int, default=100, help="Eventos por lote, como na outbox do agente")
+        parser.add_argument('--whitelist', type=int, default=1000, help="Regras no snapshot da Whitelist")
+        parser.add_argument('--repeat', type=int, default=20, help="Repetições de cada medição de CPU")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help="Grava o relatório JSON neste arquivo")
+
+    def handle(self, *args, **options):
+        if min(options['events'], options['batch_size'], options['whitelist'], options['repeat']) < 1:
+            raise CommandError("--events, --batch-size, --whitelist e --repeat devem ser positivos")
+
+        report = WireBenchmark(
+            events=options['events'], batch_size=options['batch_size'], whitelist=options['whitelist'],
+            repeat=options['repeat'], seed=options['seed'],
+        ).run()
+
+        self.print_table("Upload em lote (por evento)", report['upload'], 'bytes_per_event', 'server_us_per_event')
+        self.print_table("Snapshot da Whitelist (por regra)", report['whitelist'], 'bytes_per_item', 'server_us_per_item')
+        if report['unavailable']:
+            self.stdout.write(self.style.WARNING(
+                f"Indisponíveis (instale msgpack/zstandard): {', '.join(report['unavailable'])}"
+            ))
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent=2)
+
+    def print_table(self, title, rows, size_key, cpu_key):
+        self.stdout.write(self.style.MIGRATE_HEADING(title))
+        self.stdout.write(f"{'formato':<14} {'bytes':>9} {'x JSON':>7} {'CPU µs':>9}")
+        for name, row in rows.items():
+            self.stdout.write(f"{name:<14} {row[size_key]:>9.1f} {row['bytes_vs_json']:>7.3f} {row[cpu_key]:>9.3f}")
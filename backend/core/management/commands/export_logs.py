@@ -0,0 +1,57 @@
+import sys
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from core import exports
+from core.db_router import replica_reads
+from core.models import USBLog
+
+class Command(BaseCommand):
+    help = "Exporta o histórico do USBLog (CSV, NDJSON ou Parquet) em streaming, com memória constante"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(exports.CONTENT_TYPES), default='csv')
+        parser.add_argument('--output', help="Arquivo de saída (padrão: stdout; obrigatório para parquet)")
+        parser.add_argument('--start', help="Início (ISO 8601, inclusivo)")
+        parser.add_argument('--end', help="Fim (ISO 8601, exclusivo)")
+        parser.add_argument('--agent', type=int, help="ID do agente")
+        parser.add_argument('--action', help="Ação registrada (ex.: BLOCKED)")
+        parser.add_argument('--chunk-size', type=int, default=exports.CHUNK_SIZE, help="Linhas lidas do cursor por vez")
+
+    def handle(self, *args, **options):
+        file_type = options['format']
+        if file_type == 'parquet':
+            if exports.pq is None:
+                raise CommandError("Exportação Parquet indisponível: instale o pyarrow")
+            if not options['output']:
+                raise CommandError("--output é obrigatório para parquet")
+
+        queryset = USBLog.objects.all()
+        for option, lookup in (('start', 'timestamp__gte'), ('end', 'timestamp__lt')):
+            if options[option]:
+                queryset = queryset.filter(**{lookup: self.parse(options[option])})
+        if options['agent']:
+            queryset = queryset.filter(agent_id=options['agent'])
+        if options['action']:
+            queryset = queryset.filter(action_taken=options['action'])
+
+        with replica_reads():
+            queryset = queryset.using(queryset.db) # Réplica de leitura, se configurada
+        chunks = exports.stream_usblog(queryset, file_type, options['chunk_size'])
+        mode = 'wb' if file_type == 'parquet' else 'w'
+        out = open(options['output'], mode, encoding=None if mode == 'wb' else 'utf-8', newline='' if mode == 'w' else None) if options['output'] else sys.stdout
+        try:
+            for chunk in chunks:
+                out.write(chunk)
+        finally:
+            if out is not sys.stdout:
+                out.close()
+
+        if options['output']:
+            self.stderr.write(self.style.SUCCESS(f"Export gravado em {options['output']}"))
+
+    def parse(self, value):
+        dt = parse_datetime(value)
+        if dt is None:
+            raise CommandError(f"Data inválida: {value}")
+        return dt if timezone.is_aware(dt) else timezone.make_aware(dt)
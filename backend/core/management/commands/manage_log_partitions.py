@@ -0,0 +1,62 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+from core import partitions
+from core.models import USBLogCounter
+from core.rollups import rollup_range
+
+class Command(BaseCommand):
+    help = (
+        "Mantém as partições mensais do USBLog: cria os próximos meses e aplica a "
+        "retenção (arquiva ou remove meses antigos depois de consolidar os agregados). "
+        "Rodar diariamente."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--months-ahead', type=int, default=settings.USBLOG_PARTITION_MONTHS_AHEAD)
+        parser.add_argument('--retention-days', type=int, default=settings.USBLOG_RETENTION_DAYS,
+                            help="Meses inteiramente mais antigos que isso saem da tabela ativa (vazio = manter tudo)")
+        parser.add_argument('--mode', choices=['archive', 'drop'], default=settings.USBLOG_RETENTION_MODE)
+        parser.add_argument('--dry-run', action='store_true', help="Apenas mostra o que seria feito")
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError("O particionamento do USBLog requer PostgreSQL.")
+
+        dry_run = options['dry_run']
+        with connection.cursor() as cursor:
+            if not partitions.is_partitioned(cursor):
+                raise CommandError("core_usblog não está particionada; aplique as migrações primeiro.")
+
+            # Meses à frente + meses que acumularam linhas na partição DEFAULT
+            current = partitions.month_start(timezone.now())
+            existing = set(partitions.list_partitions(cursor))
+            wanted = {partitions.add_months(current, offset) for offset in range(options['months_ahead'] + 1)}
+            wanted.update(partitions.default_partition_months(cursor))
+            for month in sorted(wanted - existing):
+                if not dry_run:
+                    with transaction.atomic():
+                        partitions.create_month_partition(cursor, month)
+                self.stdout.write(f"+ partição {partitions.partition_name(month)}")
+
+            if options['retention_days'] is None:
+                return
+
+            cutoff = timezone.now() - timedelta(days=options['retention_days'])
+            for month in partitions.list_partitions(cursor):
+                month_end = partitions.add_months(month, 1)
+                if month_end > cutoff:
+                    break
+                name = partitions.partition_name(month)
+                if dry_run:
+                    self.stdout.write(f"- {options['mode']} {name}")
+                    continue
+                with transaction.atomic():
+                    # Consolida o mês nos agregados antes de tirá-lo da tabela ativa
+                    rollup_range(month, month_end)
+                    counts = partitions.partition_action_counts(cursor, month)
+                    partitions.retire_partition(cursor, month, archive=options['mode'] == 'archive')
+                    USBLogCounter.bump({action: -total for action, total in counts.items()})
+                self.stdout.write(self.style.SUCCESS(f"- {options['mode']} {name} ({sum(counts.values())} logs)"))
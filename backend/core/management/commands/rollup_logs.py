@@ -0,0 +1,31 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from core.rollups import rollup_range
+
+class Command(BaseCommand):
+    help = "Recalcula os agregados horários/diários do USBLog (rodar periodicamente, ex.: a cada hora)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help="Início (ISO 8601). Padrão: agora menos --hours")
+        parser.add_argument('--end', help="Fim (ISO 8601). Padrão: agora")
+        parser.add_argument('--hours', type=int, default=48, help="Janela recalculada quando --start não é informado")
+
+    def handle(self, *args, **options):
+        end = self.parse(options['end']) if options['end'] else timezone.now()
+        start = self.parse(options['start']) if options['start'] else end - timedelta(hours=options['hours'])
+        if start >= end:
+            raise CommandError("--start deve ser anterior a --end")
+
+        written = rollup_range(start, end)
+        self.stdout.write(self.style.SUCCESS(
+            f"Agregados atualizados de {start:%Y-%m-%d %H:%M} a {end:%Y-%m-%d %H:%M}: "
+            f"{written['HOUR']} horários, {written['DAY']} diários"
+        ))
+
+    def parse(self, value):
+        dt = parse_datetime(value)
+        if dt is None:
+            raise CommandError(f"Data inválida: {value}")
+        return dt if timezone.is_aware(dt) else timezone.make_aware(dt)
@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from core.heartbeats import mark_stale_agents_offline
+
+class Command(BaseCommand):
+    help = "Marca como offline os agentes sem heartbeat recente (rodar a cada minuto via cron/agendador)"
+
+    def handle(self, *args, **options):
+        stale = mark_stale_agents_offline()
+        self.stdout.write(self.style.SUCCESS(f"{stale} agente(s) marcado(s) como offline"))
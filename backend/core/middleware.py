@@ -0,0 +1,140 @@
+import io
+import json
+import re
+from django.conf import settings
+from django.http import HttpResponse, JsonResponse
+from django.utils.cache import patch_vary_headers
+from . import db_router, wire
+from .heartbeats import heartbeats
+from .verdicts import verdicts
+
+CHECK_AUTH_RE = re.compile(r'^/api/agents/check-auth/(?P<hw_id>.+)/$')
+HEARTBEAT_PATH = '/api/agents/heartbeat/'
+ACCEPTS_ZSTD_RE = re.compile(r'\bzstd\b')
+ZSTD_MIN_LENGTH = 200 # mesmo piso do GZipMiddleware: respostas curtas não compensam
+
+class AgentFastPathMiddleware:
+    """
+    Caminho enxuto para as chamadas de máquina dos agentes (check-auth e heartbeat):
+    respondidas aqui, antes de sessão, CSRF, autenticação, mensagens e do DRF.
+    As respostas são as mesmas das actions do AgentViewSet, que seguem
+    atendendo o que não cair neste atalho (ex.: heartbeat em form-data).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.method == 'GET':
+            match = CHECK_AUTH_RE.match(request.path_info)
+            if match:
+                return self.check_auth(match['hw_id'])
+        elif request.method == 'POST' and request.path_info == HEARTBEAT_PATH and request.content_type == 'application/json':
+            return self.heartbeat(request)
+        return self.get_response(request)
+
+    def check_auth(self, hw_id):
+        if verdicts.is_authorized(hw_id):
+            return JsonResponse({"status": "authorized"})
+        return JsonResponse({"status": "blocked"}, status=403)
+
+    def heartbeat(self, request):
+        try:
+            data = json.loads(request.body)
+            agent_id = int(data.get('agent'))
+        except (ValueError, TypeError, AttributeError):
+            return JsonResponse({"error": "agent deve ser o ID do agente"}, status=400)
+
+        heartbeats.beat(agent_id, data.get('ip_address') or None)
+        return HttpResponse(status=204)
+
+class ReplicaPinMiddleware:
+    """
+    Read-your-writes com réplicas: uma resposta cuja requisição escreveu no
+    primário leva um cookie curto, e enquanto ele existir as leituras do
+    cliente ficam no primário (ver core/db_router.py).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        db_router.begin_request(pinned=db_router.PIN_COOKIE in request.COOKIES)
+        response = self.get_response(request)
+        if db_router.request_wrote() and db_router.replicas():
+            response.set_cookie(
+                db_router.PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite='Lax',
+            )
+        return response
+
+class RequestDecompressionMiddleware:
+    """
+    Aceita corpos de requisição comprimidos (Content-Encoding: gzip ou zstd),
+    como os lotes de eventos dos agentes. O corpo é descomprimido aqui, antes
+    de qualquer parser, limitado a DATA_UPLOAD_MAX_MEMORY_SIZE.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        encoding = request.META.get('HTTP_CONTENT_ENCODING', '').strip().lower()
+        if encoding and encoding != 'identity':
+            if encoding not in wire.encodings():
+                return JsonResponse(
+                    {"error": f"Content-Encoding não suportado: {encoding}", "supported": list(wire.encodings())},
+                    status=415,
+                )
+            try:
+                body = wire.decompress(request.body, encoding, settings.DATA_UPLOAD_MAX_MEMORY_SIZE)
+            except wire.BodyTooLarge as e:
+                return JsonResponse({"error": str(e)}, status=413)
+            except ValueError as e:
+                return JsonResponse({"error": str(e)}, status=400)
+            # Daqui em diante a requisição se comporta como se tivesse chegado sem compressão
+            request._body = body
+            request._stream = io.BytesIO(body)
+            request.META['CONTENT_LENGTH'] = str(len(body))
+            del request.META['HTTP_CONTENT_ENCODING']
+        return self.get_response(request)
+
+class ZstdMiddleware:
+    """
+    Comprime respostas com zstd quando o cliente aceita (Accept-Encoding: zstd),
+    com menos CPU e bytes que o gzip. Fica depois do GZipMiddleware na lista:
+    processa a resposta antes dele, que então não recomprime. Sem o pacote
+    zstandard, ou para clientes sem zstd, o gzip segue como antes.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if wire.zstandard is None or response.has_header('Content-Encoding'):
+            return response
+        # Streaming assíncrono (SSE) fica com o GZipMiddleware
+        if response.streaming and response.is_async:
+            return response
+        if not response.streaming and len(response.content) < ZSTD_MIN_LENGTH:
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if not ACCEPTS_ZSTD_RE.search(request.META.get('HTTP_ACCEPT_ENCODING', '')):
+            return response
+
+        if response.streaming:
+            response.streaming_content = wire.compress_stream(response.streaming_content)
+            del response.headers['Content-Length']
+        else:
+            compressed = wire.compress(response.content, 'zstd')
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response.headers['Content-Length'] = str(len(compressed))
+
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag # ETag forte não vale para o corpo comprimido
+        response.headers['Content-Encoding'] = 'zstd'
+        return response
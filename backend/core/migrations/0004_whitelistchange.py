@@ -0,0 +1,36 @@
+# Generated by Django 5.2.9 on 2026-01-08 10:14
+
+from django.db import migrations, models
+
+
+def seed_journal(apps, schema_editor):
+    # Dispositivos já autorizados entram no diário como versão inicial
+    WhitelistedDevice = apps.get_model('core', 'WhitelistedDevice')
+    WhitelistChange = apps.get_model('core', 'WhitelistChange')
+    WhitelistChange.objects.bulk_create(
+        WhitelistChange(device_id=device_id, op='ADD')
+        for device_id in WhitelistedDevice.objects.values_list('device_id', flat=True)
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_alter_usblog_options_usblog_ip_address_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WhitelistChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('device_id', models.CharField(max_length=255)),
+                ('op', models.CharField(choices=[('ADD', 'Adicionado'), ('REMOVE', 'Removido')], max_length=10)),
+                ('changed_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['id'],
+            },
+        ),
+        migrations.RunPython(seed_journal, migrations.RunPython.noop),
+    ]
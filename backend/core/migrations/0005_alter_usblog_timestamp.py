@@ -0,0 +1,19 @@
+# Generated by Django 5.2.9 on 2026-10-18 00:03
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_whitelistchange'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='usblog',
+            name='timestamp',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
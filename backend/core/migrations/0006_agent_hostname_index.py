@@ -0,0 +1,18 @@
+# Generated by Django 5.2.9 on 2026-10-18 00:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_alter_usblog_timestamp'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='agent',
+            name='hostname',
+            field=models.CharField(db_index=True, max_length=100),
+        ),
+    ]
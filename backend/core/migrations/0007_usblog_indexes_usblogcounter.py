@@ -0,0 +1,41 @@
+# Generated by Django 5.2.9 on 2026-10-18 00:06
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def seed_counters(apps, schema_editor):
+    # Contagem inicial a partir dos logs existentes (única vez que o USBLog é varrido)
+    USBLog = apps.get_model('core', 'USBLog')
+    USBLogCounter = apps.get_model('core', 'USBLogCounter')
+    USBLogCounter.objects.bulk_create(
+        USBLogCounter(action_taken=row['action_taken'], total=row['total'])
+        for row in USBLog.objects.order_by().values('action_taken').annotate(total=Count('id'))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_agent_hostname_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='USBLogCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action_taken', models.CharField(max_length=50, unique=True)),
+                ('total', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='usblog',
+            index=models.Index(fields=['-timestamp'], name='usblog_ts_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usblog',
+            index=models.Index(fields=['action_taken', '-timestamp'], name='usblog_action_ts_idx'),
+        ),
+        migrations.RunPython(seed_counters, migrations.RunPython.noop),
+    ]
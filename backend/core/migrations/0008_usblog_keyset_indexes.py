@@ -0,0 +1,25 @@
+# Generated by Django 5.2.9 on 2026-10-18 00:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_usblog_indexes_usblogcounter'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='usblog',
+            name='usblog_ts_idx',
+        ),
+        migrations.AddIndex(
+            model_name='usblog',
+            index=models.Index(fields=['-timestamp', '-id'], name='usblog_ts_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usblog',
+            index=models.Index(fields=['agent', '-timestamp'], name='usblog_agent_ts_idx'),
+        ),
+    ]
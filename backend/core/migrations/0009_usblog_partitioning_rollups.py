@@ -0,0 +1,106 @@
+# Generated by Django 5.2.9 on 2026-10-18 00:13
+
+from datetime import datetime, timezone
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.migrations.exceptions import IrreversibleError
+
+# SQL congelado nesta migração: mudanças futuras em core.partitions não alteram o que ela faz
+MONTHS_AHEAD = 3
+
+
+def add_months(month, amount):
+    index = month.year * 12 + month.month - 1 + amount
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=timezone.utc)
+
+
+def partition_usblog(apps, schema_editor):
+    """
+    Converte a core_usblog comum em particionada por RANGE(timestamp), uma
+    partição por mês (UTC) mais a DEFAULT, preservando dados, ids, índices e a FK.
+    """
+    # Particionamento nativo só existe no PostgreSQL; outros bancos seguem com a tabela comum
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('SELECT MIN("timestamp"), COALESCE(MAX(id), 0) FROM core_usblog')
+        oldest, max_id = cursor.fetchone()
+        cursor.execute(
+            "SELECT indexname, indexdef FROM pg_indexes WHERE tablename = 'core_usblog' AND indexname <> 'core_usblog_pkey'"
+        )
+        indexes = cursor.fetchall()
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = 'core_usblog'::regclass AND contype = 'f'"
+        )
+        foreign_keys = cursor.fetchall()
+
+        cursor.execute('ALTER TABLE core_usblog RENAME TO core_usblog_legacy')
+        cursor.execute('ALTER TABLE core_usblog_legacy RENAME CONSTRAINT core_usblog_pkey TO core_usblog_legacy_pkey')
+        for index_name, _ in indexes:
+            cursor.execute(f'DROP INDEX "{index_name}"')
+        for constraint_name, _ in foreign_keys:
+            cursor.execute(f'ALTER TABLE core_usblog_legacy DROP CONSTRAINT "{constraint_name}"')
+        # A identidade do id pertence à tabela antiga; a nova usa uma sequência comum
+        cursor.execute('ALTER TABLE core_usblog_legacy ALTER COLUMN id DROP IDENTITY IF EXISTS')
+
+        cursor.execute('CREATE TABLE core_usblog (LIKE core_usblog_legacy INCLUDING DEFAULTS) PARTITION BY RANGE ("timestamp")')
+        cursor.execute('CREATE SEQUENCE core_usblog_id_seq OWNED BY core_usblog.id')
+        cursor.execute("SELECT setval('core_usblog_id_seq', %s + 1, false)", [max_id])
+        cursor.execute("ALTER TABLE core_usblog ALTER COLUMN id SET DEFAULT nextval('core_usblog_id_seq')")
+        cursor.execute('CREATE TABLE core_usblog_default PARTITION OF core_usblog DEFAULT')
+
+        current = datetime.now(timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        month = oldest.astimezone(timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0) if oldest else current
+        while month <= add_months(current, MONTHS_AHEAD):
+            cursor.execute(
+                f'CREATE TABLE "core_usblog_p{month:%Y%m}" PARTITION OF core_usblog FOR VALUES FROM (%s) TO (%s)',
+                [month, add_months(month, 1)],
+            )
+            month = add_months(month, 1)
+
+        cursor.execute('INSERT INTO core_usblog SELECT * FROM core_usblog_legacy')
+        cursor.execute('DROP TABLE core_usblog_legacy')
+
+        # Índices e restrições depois da carga (mais rápido) e no pai, propagando para as partições
+        cursor.execute('ALTER TABLE core_usblog ADD CONSTRAINT core_usblog_pkey PRIMARY KEY (id, "timestamp")')
+        for _, index_def in indexes:
+            cursor.execute(index_def) # Definição capturada antes do RENAME: já aponta para a nova tabela
+        for constraint_name, constraint_def in foreign_keys:
+            cursor.execute(f'ALTER TABLE core_usblog ADD CONSTRAINT "{constraint_name}" {constraint_def}')
+
+
+def unpartition_usblog(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    raise IrreversibleError(
+        "O particionamento da core_usblog não é desfeito automaticamente"
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_usblog_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='USBLogRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('HOUR', 'Hora'), ('DAY', 'Dia')], max_length=4)),
+                ('bucket', models.DateTimeField()),
+                ('action_taken', models.CharField(max_length=50)),
+                ('total', models.BigIntegerField(default=0)),
+                ('agent', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='log_rollups', to='core.agent')),
+            ],
+            options={
+                'ordering': ['bucket'],
+                'indexes': [models.Index(fields=['granularity', 'bucket'], name='usblog_rollup_bucket_idx')],
+                'constraints': [models.UniqueConstraint(fields=('granularity', 'bucket', 'agent', 'action_taken'), name='usblog_rollup_unique')],
+            },
+        ),
+        migrations.RunPython(partition_usblog, unpartition_usblog),
+    ]
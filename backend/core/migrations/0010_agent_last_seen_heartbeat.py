@@ -0,0 +1,19 @@
+# Generated by Django 5.2.9 on 2026-10-18 00:15
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_usblog_partitioning_rollups'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='agent',
+            name='last_seen',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.9 on 2026-10-18 00:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_agent_last_seen_heartbeat'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='agent',
+            name='metrics',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='agent',
+            name='metrics_updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.9 on 2026-10-18 00:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_agent_metrics'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeviceInventory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('device_id', models.CharField(max_length=255, unique=True)),
+                ('device_name', models.CharField(max_length=255)),
+                ('first_seen', models.DateTimeField()),
+                ('last_seen', models.DateTimeField()),
+                ('total_events', models.BigIntegerField(default=0)),
+                ('blocked_events', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['-last_seen'],
+                'indexes': [models.Index(fields=['-last_seen', '-id'], name='inventory_last_seen_idx'), models.Index(fields=['-blocked_events', '-last_seen'], name='inventory_blocked_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DeviceSighting',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('username', models.CharField(blank=True, default='', max_length=100)),
+                ('first_seen', models.DateTimeField()),
+                ('last_seen', models.DateTimeField()),
+                ('total_events', models.BigIntegerField(default=0)),
+                ('blocked_events', models.BigIntegerField(default=0)),
+                ('agent', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='device_sightings', to='core.agent')),
+                ('device', models.ForeignKey(db_column='device_id', on_delete=django.db.models.deletion.CASCADE, related_name='sightings', to='core.deviceinventory', to_field='device_id')),
+            ],
+            options={
+                'ordering': ['-last_seen'],
+                'indexes': [models.Index(fields=['agent', '-last_seen'], name='sighting_agent_idx'), models.Index(fields=['username', '-last_seen'], name='sighting_username_idx')],
+                'constraints': [models.UniqueConstraint(fields=('device', 'agent', 'username'), name='device_sighting_unique')],
+            },
+        ),
+    ]
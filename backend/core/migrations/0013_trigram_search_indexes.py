@@ -0,0 +1,47 @@
+from django.db import migrations
+
+# SQL congelado nesta migração: índices GIN com gin_trgm_ops usados pelo core.search.
+# Em core_usblog (particionada) o índice é criado em cada partição, inclusive nas futuras.
+CREATE_SQL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS usblog_device_name_trgm ON core_usblog USING gin (device_name gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS usblog_device_id_trgm ON core_usblog USING gin (device_id gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS usblog_username_trgm ON core_usblog USING gin (username gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS agent_hostname_trgm ON core_agent USING gin (hostname gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS whitelist_device_name_trgm ON core_whitelisteddevice USING gin (device_name gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS whitelist_device_id_trgm ON core_whitelisteddevice USING gin (device_id gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS inventory_device_name_trgm ON core_deviceinventory USING gin (device_name gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS inventory_device_id_trgm ON core_deviceinventory USING gin (device_id gin_trgm_ops)",
+]
+
+DROP_SQL = [
+    "DROP INDEX IF EXISTS usblog_device_name_trgm",
+    "DROP INDEX IF EXISTS usblog_device_id_trgm",
+    "DROP INDEX IF EXISTS usblog_username_trgm",
+    "DROP INDEX IF EXISTS agent_hostname_trgm",
+    "DROP INDEX IF EXISTS whitelist_device_name_trgm",
+    "DROP INDEX IF EXISTS whitelist_device_id_trgm",
+    "DROP INDEX IF EXISTS inventory_device_name_trgm",
+    "DROP INDEX IF EXISTS inventory_device_id_trgm",
+]
+
+
+def run_on_postgres(statements):
+    def run(apps, schema_editor):
+        # pg_trgm e índices GIN só existem no PostgreSQL; outros bancos fazem a busca sem índice
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for sql in statements:
+            schema_editor.execute(sql)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_device_inventory'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_on_postgres(CREATE_SQL), run_on_postgres(DROP_SQL)),
+    ]
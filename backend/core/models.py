@@ -1,11 +1,17 @@
-from django.db import models
+from django.db import models, IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
 
 class Agent(models.Model):
-    hostname = models.CharField(max_length=100)
+    hostname = models.CharField(max_length=100, db_index=True)
     ip_address = models.GenericIPAddressField(null=True, blank=True)
     mac_address = models.CharField(max_length=17, unique=True)
     is_online = models.BooleanField(default=True)
-    last_seen = models.DateTimeField(auto_now=True)
+    # Atualizado pelos heartbeats (em lote), não a cada save do registro
+    last_seen = models.DateTimeField(default=timezone.now, db_index=True)
+    # Último resumo de métricas enviado pelo agente (latências por estágio, erros, outbox)
+    metrics = models.JSONField(null=True, blank=True)
+    metrics_updated_at = models.DateTimeField(null=True, blank=True)
     
     # Política de segurança
     POLICY_CHOICES = [
@@ -28,14 +34,115 @@ class USBLog(models.Model):
     username = models.CharField(max_length=100, null=True, blank=True) # Nome da pessoa que usa o PC
     ip_address = models.GenericIPAddressField(null=True, blank=True) # IP no momento do evento
     
-    timestamp = models.DateTimeField(auto_now_add=True)
+    # Horário da detecção no agente (eventos podem chegar atrasados pela outbox)
+    timestamp = models.DateTimeField(default=timezone.now)
 
     class Meta:
         ordering = ['-timestamp'] # Organiza para os mais novos aparecerem primeiro
+        indexes = [
+            models.Index(fields=['-timestamp', '-id'], name='usblog_ts_id_idx'),
+            models.Index(fields=['action_taken', '-timestamp'], name='usblog_action_ts_idx'),
+            models.Index(fields=['agent', '-timestamp'], name='usblog_agent_ts_idx'),
+        ]
 
     def __str__(self):
         return f"{self.device_name} | {self.action_taken} em {self.agent.hostname} ({self.username})"
 
+# Contadores de eventos por ação, mantidos incrementalmente na escrita dos logs.
+# O dashboard lê poucas linhas daqui em vez de fazer COUNT(*) no USBLog inteiro.
+class USBLogCounter(models.Model):
+    action_taken = models.CharField(max_length=50, unique=True)
+    total = models.BigIntegerField(default=0)
+
+    @classmethod
+    def bump(cls, counts):
+        """ Soma {ação: quantidade} aos contadores (um UPDATE por ação, não por evento) """
+        # Ordem fixa de travamento: lotes concorrentes não entram em deadlock
+        for action, amount in sorted(counts.items()):
+            if not amount:
+                continue
+            if cls.objects.filter(action_taken=action).update(total=F('total') + amount):
+                continue
+            try:
+                with transaction.atomic():
+                    cls.objects.create(action_taken=action, total=amount)
+            except IntegrityError:
+                # Outro processo criou a linha ao mesmo tempo
+                cls.objects.filter(action_taken=action).update(total=F('total') + amount)
+
+    def __str__(self):
+        return f"{self.action_taken}: {self.total}"
+
+# Agregados de logs por hora/dia, agente e ação para os gráficos históricos.
+# Sobrevivem à retenção: o detalhe do USBLog pode ser arquivado, o agregado fica.
+class USBLogRollup(models.Model):
+    GRANULARITY_CHOICES = [
+        ('HOUR', 'Hora'),
+        ('DAY', 'Dia'),
+    ]
+    granularity = models.CharField(max_length=4, choices=GRANULARITY_CHOICES)
+    bucket = models.DateTimeField() # Início da hora/dia
+    agent = models.ForeignKey(Agent, on_delete=models.CASCADE, related_name='log_rollups')
+    action_taken = models.CharField(max_length=50)
+    total = models.BigIntegerField(default=0)
+
+    class Meta:
+        ordering = ['bucket']
+        constraints = [
+            models.UniqueConstraint(fields=['granularity', 'bucket', 'agent', 'action_taken'], name='usblog_rollup_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['granularity', 'bucket'], name='usblog_rollup_bucket_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.granularity} {self.bucket:%Y-%m-%d %H:%M} | {self.action_taken}: {self.total}"
+
+# Inventário de dispositivos da frota, mantido por upsert na escrita dos logs
+# (core/inventory.py). Responde "onde este dispositivo já apareceu" sem varrer
+# o USBLog e, como os agregados, sobrevive à retenção do detalhe.
+class DeviceInventory(models.Model):
+    device_id = models.CharField(max_length=255, unique=True)
+    device_name = models.CharField(max_length=255) # Nome informado no evento mais recente
+    first_seen = models.DateTimeField()
+    last_seen = models.DateTimeField()
+    total_events = models.BigIntegerField(default=0)
+    blocked_events = models.BigIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-last_seen']
+        indexes = [
+            models.Index(fields=['-last_seen', '-id'], name='inventory_last_seen_idx'),
+            models.Index(fields=['-blocked_events', '-last_seen'], name='inventory_blocked_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.device_name} ({self.device_id})"
+
+# Onde cada dispositivo foi visto: uma linha por dispositivo, agente e usuário
+class DeviceSighting(models.Model):
+    device = models.ForeignKey(DeviceInventory, to_field='device_id', db_column='device_id',
+                               on_delete=models.CASCADE, related_name='sightings')
+    agent = models.ForeignKey(Agent, on_delete=models.CASCADE, related_name='device_sightings')
+    username = models.CharField(max_length=100, blank=True, default='') # '' quando o agente não informou
+    first_seen = models.DateTimeField()
+    last_seen = models.DateTimeField()
+    total_events = models.BigIntegerField(default=0)
+    blocked_events = models.BigIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-last_seen']
+        constraints = [
+            models.UniqueConstraint(fields=['device', 'agent', 'username'], name='device_sighting_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['agent', '-last_seen'], name='sighting_agent_idx'),
+            models.Index(fields=['username', '-last_seen'], name='sighting_username_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.device_id} em agente {self.agent_id} ({self.username or '-'})"
+
 # NOVA TABELA: Dispositivos Autorizados (Whitelist)
 class WhitelistedDevice(models.Model):
     device_id = models.CharField(max_length=255, unique=True)
@@ -44,4 +151,20 @@ class WhitelistedDevice(models.Model):
     description = models.TextField(null=True, blank=True)
 
     def __str__(self):
-        return f"Autorizado: {self.device_name or self.device_id}"
\ No newline at end of file
+        return f"Autorizado: {self.device_name or self.device_id}"
+
+# Diário de alterações da Whitelist (base para o sync incremental dos agentes)
+class WhitelistChange(models.Model):
+    OP_CHOICES = [
+        ('ADD', 'Adicionado'),
+        ('REMOVE', 'Removido'),
+    ]
+    device_id = models.CharField(max_length=255)
+    op = models.CharField(max_length=10, choices=OP_CHOICES)
+    changed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['id'] # O id funciona como número de versão da Whitelist
+
+    def __str__(self):
+        return f"v{self.id} {self.op} {self.device_id}"
@@ -0,0 +1,43 @@
+import json
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from rest_framework.pagination import CursorPagination
+
+class USBLogCursorPagination(CursorPagination):
+    """
+    Paginação por cursor (keyset) em (timestamp, id): cada página é um
+    "WHERE timestamp < cursor ORDER BY ... LIMIT n" servido pelo índice,
+    com custo independente do tamanho da tabela (sem OFFSET nem COUNT).
+    """
+    ordering = ('-timestamp', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class DeviceInventoryCursorPagination(CursorPagination):
+    """ Mesma paginação por cursor, no índice (last_seen, id) do inventário """
+    ordering = ('-last_seen', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator do admin: no PostgreSQL usa a estimativa de linhas do planejador
+    (EXPLAIN, sem executar a consulta) e só faz o COUNT(*) exato quando ela fica
+    abaixo de EXACT_COUNT_LIMIT. Listas grandes mostram um total aproximado.
+    """
+    EXACT_COUNT_LIMIT = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if connections[queryset.db].vendor == 'postgresql':
+            plan = json.loads(queryset.explain(format='json'))
+            estimate = int(plan[0]['Plan']['Plan Rows'])
+            if estimate >= self.EXACT_COUNT_LIMIT:
+                return estimate
+        return super().count
@@ -0,0 +1,100 @@
+"""
+Particionamento nativo do PostgreSQL para o USBLog (uma partição por mês, em UTC).
+
+A tabela core_usblog vira uma tabela particionada por RANGE(timestamp) com
+PRIMARY KEY (id, timestamp); para o Django nada muda (o id continua único,
+gerado pela sequência core_usblog_id_seq). Uma partição DEFAULT recebe
+qualquer linha fora dos meses já criados e é esvaziada quando o mês
+correspondente ganha sua partição.
+"""
+from datetime import datetime, timezone
+
+PARENT = 'core_usblog'
+DEFAULT_PARTITION = 'core_usblog_default'
+PARTITION_PREFIX = 'core_usblog_p'
+ARCHIVE_SCHEMA = 'usblog_archive'
+
+def month_start(dt):
+    dt = dt.astimezone(timezone.utc)
+    return datetime(dt.year, dt.month, 1, tzinfo=timezone.utc)
+
+def add_months(month, amount):
+    index = month.year * 12 + month.month - 1 + amount
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=timezone.utc)
+
+def partition_name(month):
+    return f"{PARTITION_PREFIX}{month:%Y%m}"
+
+def partition_month(name):
+    return datetime.strptime(name[len(PARTITION_PREFIX):], '%Y%m').replace(tzinfo=timezone.utc)
+
+def is_partitioned(cursor):
+    cursor.execute(
+        "SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s)", [PARENT]
+    )
+    return cursor.fetchone() is not None
+
+def list_partitions(cursor):
+    """ Meses com partição própria, em ordem cronológica (ignora a DEFAULT) """
+    cursor.execute(
+        """
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = to_regclass(%s) AND c.relname LIKE %s
+        ORDER BY c.relname
+        """,
+        [PARENT, PARTITION_PREFIX + '%'],
+    )
+    return [partition_month(name) for (name,) in cursor.fetchall()]
+
+def default_partition_months(cursor):
+    """ Meses que têm linhas caídas na partição DEFAULT (ex.: eventos muito atrasados) """
+    cursor.execute(
+        f"""SELECT DISTINCT date_trunc('month', "timestamp" AT TIME ZONE 'UTC') FROM "{DEFAULT_PARTITION}" """
+    )
+    return [month.replace(tzinfo=timezone.utc) for (month,) in cursor.fetchall()]
+
+def create_month_partition(cursor, month):
+    """
+    Cria a partição do mês. Linhas desse intervalo que já caíram na DEFAULT
+    são movidas antes do ATTACH (o PostgreSQL recusaria a partição caso contrário).
+    Retorna False se ela já existia.
+    """
+    name = partition_name(month)
+    cursor.execute("SELECT to_regclass(%s)", [name])
+    if cursor.fetchone()[0] is not None:
+        return False
+
+    start, end = month, add_months(month, 1)
+    cursor.execute(f'CREATE TABLE "{name}" (LIKE "{PARENT}" INCLUDING DEFAULTS)')
+    cursor.execute(
+        f"""
+        WITH moved AS (
+            DELETE FROM "{DEFAULT_PARTITION}" WHERE "timestamp" >= %s AND "timestamp" < %s RETURNING *
+        )
+        INSERT INTO "{name}" SELECT * FROM moved
+        """,
+        [start, end],
+    )
+    cursor.execute(
+        f'ALTER TABLE "{PARENT}" ATTACH PARTITION "{name}" FOR VALUES FROM (%s) TO (%s)',
+        [start, end],
+    )
+    return True
+
+def partition_action_counts(cursor, month):
+    cursor.execute(f'SELECT action_taken, COUNT(*) FROM "{partition_name(month)}" GROUP BY action_taken')
+    return dict(cursor.fetchall())
+
+def retire_partition(cursor, month, archive=True):
+    """
+    Remove o mês da tabela ativa: DETACH e depois DROP ou, em modo arquivo,
+    move a tabela para o schema usblog_archive (pode ser exportada com pg_dump).
+    """
+    name = partition_name(month)
+    cursor.execute(f'ALTER TABLE "{PARENT}" DETACH PARTITION "{name}"')
+    if archive:
+        cursor.execute(f'CREATE SCHEMA IF NOT EXISTS "{ARCHIVE_SCHEMA}"')
+        cursor.execute(f'ALTER TABLE "{name}" SET SCHEMA "{ARCHIVE_SCHEMA}"')
+    else:
+        cursor.execute(f'DROP TABLE "{name}"')
@@ -0,0 +1,57 @@
+from datetime import timedelta, timezone
+from django.db.models import Count
+from django.db.models.functions import TruncDay, TruncHour
+from .models import USBLog, USBLogRollup
+
+GRANULARITIES = {
+    'HOUR': TruncHour,
+    'DAY': TruncDay,
+}
+
+def align(dt, granularity):
+    """
+    Início da hora/dia em UTC que contém dt. Os baldes seguem o UTC, como as
+    partições mensais do USBLog: um dia nunca fica metade em um mês já
+    retirado e metade no seguinte.
+    """
+    dt = dt.astimezone(timezone.utc)
+    dt = dt.replace(minute=0, second=0, microsecond=0)
+    if granularity == 'DAY':
+        dt = dt.replace(hour=0)
+    return dt
+
+def rollup_range(start, end):
+    """
+    Recalcula os agregados de [start, end) a partir do USBLog e faz upsert.
+    O intervalo é expandido para horas/dias completos, então rodar de novo
+    sobre o mesmo período é idempotente (inclusive com eventos atrasados).
+    Retorna o número de linhas gravadas por granularidade.
+    """
+    written = {}
+    for granularity, trunc in GRANULARITIES.items():
+        bucket_start = align(start, granularity)
+        bucket_end = align(end, granularity)
+        if bucket_end < end:
+            bucket_end += timedelta(days=1) if granularity == 'DAY' else timedelta(hours=1)
+
+        rows = (
+            USBLog.objects.filter(timestamp__gte=bucket_start, timestamp__lt=bucket_end)
+            .order_by()
+            .annotate(bucket=trunc('timestamp', tzinfo=timezone.utc))
+            .values('bucket', 'agent_id', 'action_taken')
+            .annotate(total=Count('id'))
+        )
+        rollups = [
+            USBLogRollup(granularity=granularity, bucket=row['bucket'], agent_id=row['agent_id'],
+                         action_taken=row['action_taken'], total=row['total'])
+            for row in rows
+        ]
+        USBLogRollup.objects.bulk_create(
+            rollups,
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=['granularity', 'bucket', 'agent', 'action_taken'],
+            update_fields=['total'],
+        )
+        written[granularity] = len(rollups)
+    return written
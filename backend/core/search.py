@@ -0,0 +1,128 @@
+"""
+Busca ranqueada sobre logs, dispositivos, agentes e Whitelist.
+
+No PostgreSQL os campos pesquisados têm índices GIN com gin_trgm_ops (pg_trgm),
+que atendem tanto o ILIKE '%termo%' (lookup trigram_contains) quanto a similaridade por palavra dos campos
+de texto livre (termo digitado com erro, ex.: "kingstom"). O ranking é o maior
+word_similarity entre o termo e os campos. O hostname é resolvido antes na
+tabela de agentes (pequena), então a busca nos logs vira "agent_id IN (...)",
+servida pelo índice do agente, em vez de um JOIN dentro do OR.
+Em outros bancos (SQLite nos testes) a busca cai para icontains com um
+ranking simples: igual > prefixo > contém.
+"""
+import ipaddress
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db import connections
+from django.db.models import Case, CharField, FloatField, Lookup, Q, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from .models import Agent, DeviceInventory, USBLog, WhitelistedDevice
+
+MIN_TERM_LENGTH = 3 # trigramas: termos menores não usam o índice
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+LOG_CANDIDATES = 5000 # logs mais recentes que casam com o termo e entram no ranking
+AGENT_MATCH_LIMIT = 1000
+
+# Campos pesquisados por tipo de resultado
+SEARCH_FIELDS = {
+    'logs': ['device_name', 'device_id', 'username', 'agent__hostname'],
+    'devices': ['device_name', 'device_id'],
+    'agents': ['hostname'],
+    'whitelist': ['device_name', 'device_id'],
+}
+# Desempate entre resultados de mesma nota
+TIEBREAK = {
+    'logs': ('-timestamp', '-id'),
+    'devices': ('-last_seen',),
+    'agents': ('-last_seen',),
+    'whitelist': ('-added_at',),
+}
+# Texto livre: aceita erro de digitação (IDs e usuários só por trecho exato)
+FUZZY_FIELDS = {'device_name', 'hostname'}
+
+@CharField.register_lookup
+class TrigramContains(Lookup):
+    """
+    "coluna ILIKE '%termo%'" sem o UPPER() que o icontains do Django aplica no
+    PostgreSQL: assim o índice gin_trgm_ops da própria coluna atende o filtro.
+    """
+    lookup_name = 'trigram_contains'
+    prepare_rhs = False
+
+    def get_db_prep_lookup(self, value, connection):
+        return '%s', [f"%{connection.ops.prep_for_like_query(value)}%"]
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f"{lhs} ILIKE {rhs}", [*lhs_params, *rhs_params]
+
+def base_queryset(kind):
+    return {
+        'logs': lambda: USBLog.objects.select_related('agent'),
+        'devices': lambda: DeviceInventory.objects.all(),
+        'agents': lambda: Agent.objects.all(),
+        'whitelist': lambda: WhitelistedDevice.objects.all(),
+    }[kind]()
+
+def is_postgres(queryset):
+    return connections[queryset.db].vendor == 'postgresql'
+
+def is_ip(term):
+    try:
+        ipaddress.ip_address(term)
+    except ValueError:
+        return False
+    return True
+
+def field_condition(field, term, postgres):
+    if not postgres:
+        return Q(**{f"{field}__icontains": term})
+    condition = Q(**{f"{field}__trigram_contains": term})
+    if field in FUZZY_FIELDS:
+        condition |= Q(**{f"{field}__trigram_word_similar": term})
+    return condition
+
+def matching(queryset, kind, term):
+    """ Filtra pelos campos do tipo; cada ramo do OR é atendido por um índice trigram """
+    postgres = is_postgres(queryset)
+    condition = Q()
+    for field in SEARCH_FIELDS[kind]:
+        if field == 'agent__hostname':
+            agents = Agent.objects.using(queryset.db).filter(field_condition('hostname', term, postgres))
+            condition |= Q(agent_id__in=list(agents.values_list('id', flat=True)[:AGENT_MATCH_LIMIT]))
+        else:
+            condition |= field_condition(field, term, postgres)
+    if kind == 'agents' and is_ip(term):
+        condition |= Q(ip_address=term)
+    return queryset.filter(condition)
+
+def field_score(field, term, postgres):
+    if postgres:
+        return Coalesce(TrigramWordSimilarity(term, field), Value(0.0))
+    return Case(
+        When(**{f"{field}__iexact": term}, then=Value(1.0)),
+        When(**{f"{field}__istartswith": term}, then=Value(0.8)),
+        When(**{f"{field}__icontains": term}, then=Value(0.5)),
+        default=Value(0.0),
+        output_field=FloatField(),
+    )
+
+def ranked(queryset, kind, term):
+    """ Anota 'search_rank' (0 a 1): a melhor nota entre os campos do tipo """
+    postgres = is_postgres(queryset)
+    scores = [field_score(field, term, postgres) for field in SEARCH_FIELDS[kind]]
+    return queryset.annotate(search_rank=Greatest(*scores) if len(scores) > 1 else scores[0])
+
+def search(term, kinds=tuple(SEARCH_FIELDS), limit=DEFAULT_LIMIT):
+    """ {tipo: [objetos com search_rank]}, melhores primeiro (desempate: mais recentes) """
+    results = {}
+    for kind in kinds:
+        queryset = matching(base_queryset(kind), kind, term)
+        if kind == 'logs':
+            # Só os logs mais recentes que casam entram no ranking: o custo não cresce com o histórico
+            recent = queryset.order_by(*TIEBREAK[kind]).values('id')[:LOG_CANDIDATES]
+            queryset = base_queryset(kind).filter(id__in=recent)
+        queryset = ranked(queryset, kind, term).order_by('-search_rank', *TIEBREAK[kind])
+        results[kind] = list(queryset[:limit])
+    return results
@@ -1,10 +1,12 @@
 from rest_framework import serializers
-from .models import Agent, USBLog, WhitelistedDevice
+from device_identity import normalize_rule
+from .models import Agent, DeviceInventory, DeviceSighting, USBLog, WhitelistedDevice
 
 class AgentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Agent
-        fields = ['id', 'hostname', 'ip_address', 'mac_address', 'is_online', 'last_seen', 'policy']
+        fields = ['id', 'hostname', 'ip_address', 'mac_address', 'is_online', 'last_seen', 'policy', 'metrics', 'metrics_updated_at']
+        read_only_fields = ['last_seen', 'metrics', 'metrics_updated_at'] # Mantidos pelo próprio agente
 
 class USBLogSerializer(serializers.ModelSerializer):
     # Mostra o hostname do agente ao invés de apenas o ID no GET
@@ -21,4 +23,25 @@ class USBLogSerializer(serializers.ModelSerializer):
 class WhitelistedDeviceSerializer(serializers.ModelSerializer):
     class Meta:
         model = WhitelistedDevice
-        fields = ['id', 'device_id', 'device_name', 'added_at', 'description']
\ No newline at end of file
+        fields = ['id', 'device_id', 'device_name', 'added_at', 'description']
+
+    def validate_device_id(self, value):
+        # Aceita ID exato ou regra "VENDOR:PRODUCT:SERIAL" com curingas (*)
+        return normalize_rule(value)
+
+class DeviceInventorySerializer(serializers.ModelSerializer):
+    class Meta:
+        model = DeviceInventory
+        fields = ['device_id', 'device_name', 'first_seen', 'last_seen', 'total_events', 'blocked_events']
+
+class DeviceSightingSerializer(serializers.ModelSerializer):
+    device_id = serializers.ReadOnlyField(source='device.device_id')
+    device_name = serializers.ReadOnlyField(source='device.device_name')
+    agent_hostname = serializers.ReadOnlyField(source='agent.hostname')
+
+    class Meta:
+        model = DeviceSighting
+        fields = [
+            'device_id', 'device_name', 'agent', 'agent_hostname', 'username',
+            'first_seen', 'last_seen', 'total_events', 'blocked_events'
+        ]
@@ -0,0 +1,86 @@
+import threading
+from contextlib import contextmanager
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from .broadcast import broadcaster, publish_logs
+from .models import USBLog, USBLogCounter, WhitelistedDevice, WhitelistChange
+from .serializers import USBLogSerializer
+from .verdicts import verdicts
+from . import inventory
+
+# Toda alteração na Whitelist gera uma nova versão no diário,
+# permitindo que os agentes baixem apenas o delta desde a última sincronização.
+
+_journal = threading.local()
+
+@contextmanager
+def journal_suspended():
+    """ Operações em lote gravam o diário de uma vez (bulk_create) em vez de um INSERT por sinal """
+    _journal.suspended = True
+    try:
+        yield
+    finally:
+        _journal.suspended = False
+
+def journal_active():
+    return not getattr(_journal, 'suspended', False)
+
+@receiver(pre_save, sender=WhitelistedDevice)
+def whitelist_pre_save(sender, instance, **kwargs):
+    if not journal_active():
+        return
+    # Guarda o device_id anterior para detectar edições do identificador
+    instance._previous_device_id = None
+    if instance.pk:
+        instance._previous_device_id = (
+            WhitelistedDevice.objects.filter(pk=instance.pk).values_list('device_id', flat=True).first()
+        )
+
+@receiver(post_save, sender=WhitelistedDevice)
+def whitelist_saved(sender, instance, created, **kwargs):
+    if not journal_active():
+        return
+    previous = getattr(instance, '_previous_device_id', None)
+    if previous and previous != instance.device_id:
+        WhitelistChange.objects.create(device_id=previous, op='REMOVE')
+    WhitelistChange.objects.create(device_id=instance.device_id, op='ADD')
+
+@receiver(post_delete, sender=WhitelistedDevice)
+def whitelist_deleted(sender, instance, **kwargs):
+    if not journal_active():
+        return
+    WhitelistChange.objects.create(device_id=instance.device_id, op='REMOVE')
+
+# Cache de veredictos do check_auth: invalida na hora (este processo) e de novo
+# no commit, para não guardar um veredicto lido antes da transação terminar.
+# Vale também para o revoke (unitário e em lote), que apaga pelo ORM.
+
+@receiver(post_save, sender=WhitelistedDevice)
+def whitelist_verdicts_saved(sender, instance, **kwargs):
+    rule = instance.device_id
+    verdicts.rule_added(rule)
+    transaction.on_commit(lambda: verdicts.rule_added(rule))
+
+@receiver(post_delete, sender=WhitelistedDevice)
+def whitelist_verdicts_deleted(sender, instance, **kwargs):
+    verdicts.rules_changed()
+    transaction.on_commit(verdicts.rules_changed)
+
+# Contadores, inventário de dispositivos e stream do dashboard. O bulk_create da
+# ingestão em lote não dispara post_save, então a view faz o mesmo trabalho
+# diretamente nesse caminho.
+
+@receiver(post_save, sender=USBLog)
+def usblog_saved(sender, instance, created, **kwargs):
+    if created:
+        USBLogCounter.bump({instance.action_taken: 1})
+        inventory.record_logs([instance])
+        if broadcaster.has_subscribers:
+            data = [USBLogSerializer(instance).data]
+            transaction.on_commit(lambda: publish_logs(data))
+
+@receiver(post_delete, sender=USBLog)
+def usblog_deleted(sender, instance, **kwargs):
+    USBLogCounter.bump({instance.action_taken: -1})
+    broadcaster.mark_stats_dirty()
@@ -0,0 +1,23 @@
+from django.db.models import Count, Q
+from .models import Agent, USBLogCounter
+
+def get_dashboard_stats():
+    """
+    Indicadores do dashboard em duas consultas de custo constante:
+    agregação condicional nos agentes e leitura dos contadores de eventos
+    (sem COUNT(*) no USBLog).
+    """
+    agents = Agent.objects.aggregate(
+        total=Count('id'),
+        active=Count('id', filter=Q(is_online=True)),
+    )
+    counters = dict(USBLogCounter.objects.values_list('action_taken', 'total'))
+
+    return {
+        "active_agents": agents['active'],
+        "total_agents": agents['total'],
+        "total_events": sum(counters.values()),
+        "blocked_events": counters.get('BLOCKED', 0),
+        "authorized_events": counters.get('AUTHORIZED', 0),
+        "integrity_score": 98.5
+    }
@@ -1,3 +1,1139 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import math
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from unittest import mock
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from unittest import skipUnless
+from django.contrib.auth.models import User
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.test import APIClient
+from device_identity import RuleMatcher, canonical, parse_pnp_device_id
+from . import wire
+from .benchmark import FleetBenchmark, WireBenchmark, compare
+from .db_router import PIN_COOKIE
+from .heartbeats import check_heartbeat_settings, heartbeats, mark_stale_agents_offline
+from .inventory import backfill, record_logs
+from .models import Agent, DeviceInventory, USBLog, USBLogRollup, WhitelistChange, WhitelistedDevice
+from .rollups import rollup_range
+from .verdicts import BloomFilter, verdicts
 
-# Create your tests here.
+# O agente (monitor.py) fica na raiz do repositório, fora do projeto Django
+sys.path.insert(0, str(settings.BASE_DIR.parent))
+try:
+    import monitor
+except ImportError: # Dependências do agente (requests) ausentes
+    monitor = None
+
+
+class DashboardStatsTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.agent = Agent.objects.create(hostname='PC-01', mac_address='AA:BB:CC:DD:EE:01')
+
+    def ingest(self, action, amount):
+        events = [
+            {"agent": self.agent.id, "device_name": "Pendrive", "device_id": f"USB\\{i}", "action_taken": action}
+            for i in range(amount)
+        ]
+        response = self.client.post('/api/logs/bulk/', {"events": events}, format='json')
+        self.assertEqual(response.status_code, 201)
+
+    def stats_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/agents/dashboard_stats/')
+        self.assertEqual(response.status_code, 200)
+        return response.json(), len(ctx.captured_queries)
+
+    def test_counts_authorized_and_blocked_events(self):
+        self.ingest('BLOCKED', 3)
+        self.ingest('AUTHORIZED', 2)
+        USBLog.objects.create(agent=self.agent, device_name='Mouse', device_id='USB\\M', action_taken='AUTHORIZED')
+
+        stats, _ = self.stats_queries()
+        self.assertEqual(stats['blocked_events'], 3)
+        self.assertEqual(stats['authorized_events'], 3)
+        self.assertEqual(stats['total_events'], 6)
+        self.assertEqual(stats['total_agents'], 1)
+
+    def test_counters_follow_deletes(self):
+        self.ingest('BLOCKED', 2)
+        USBLog.objects.filter(action_taken='BLOCKED').first().delete()
+
+        stats, _ = self.stats_queries()
+        self.assertEqual(stats['blocked_events'], 1)
+
+    def test_query_count_is_independent_of_log_volume(self):
+        _, empty_queries = self.stats_queries()
+        for _ in range(5):
+            self.ingest('BLOCKED', 200)
+        stats, full_queries = self.stats_queries()
+
+        self.assertEqual(stats['blocked_events'], 1000)
+        self.assertEqual(empty_queries, full_queries)
+        self.assertEqual(full_queries, 2)
+
+
+class USBLogListTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.agents = [
+            Agent.objects.create(hostname=f'PC-{i:02}', mac_address=f'AA:BB:CC:DD:EE:{i:02}')
+            for i in range(3)
+        ]
+
+    def create_logs(self, amount, action='BLOCKED'):
+        USBLog.objects.bulk_create(
+            USBLog(agent=self.agents[i % 3], device_name='Pendrive', device_id=f'USB\\{i}', action_taken=action)
+            for i in range(amount)
+        )
+
+    def list_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json(), len(ctx.captured_queries)
+
+    def test_cursor_pages_cover_all_rows_once(self):
+        self.create_logs(120)
+        seen, url = [], '/api/logs/?page_size=50'
+        while url:
+            page, _ = self.list_queries(url)
+            seen += [row['id'] for row in page['results']]
+            url = page['next']
+        self.assertEqual(len(seen), 120)
+        self.assertEqual(len(set(seen)), 120)
+
+    def test_page_cost_is_independent_of_table_size(self):
+        self.create_logs(60)
+        small, small_queries = self.list_queries('/api/logs/')
+        self.create_logs(2000)
+        large, large_queries = self.list_queries('/api/logs/')
+
+        # Uma única consulta com JOIN no agente (sem N+1) e página de tamanho fixo
+        self.assertEqual(small_queries, 1)
+        self.assertEqual(large_queries, 1)
+        self.assertEqual(len(small['results']), len(large['results']))
+
+    def test_filters_by_agent_and_action(self):
+        self.create_logs(9)
+        self.create_logs(3, action='AUTHORIZED')
+        page, _ = self.list_queries(f'/api/logs/?agent={self.agents[0].id}&action=AUTHORIZED')
+        self.assertEqual(len(page['results']), 1)
+        self.assertEqual(page['results'][0]['agent_hostname'], 'PC-00')
+
+    def test_since_returns_new_rows_and_an_overlap_window(self):
+        self.create_logs(5)
+        first, _ = self.list_queries('/api/logs/?since=0')
+        self.assertEqual(len(first['results']), 5)
+
+        self.create_logs(2, action='AUTHORIZED')
+        update, _ = self.list_queries(f"/api/logs/?since={first['since']}")
+        new = [row['action_taken'] for row in update['results'] if row['id'] > first['since']]
+        self.assertEqual(new, ['AUTHORIZED'] * 2)
+        self.assertEqual(len(update['results']), 7) # Os 5 já vistos voltam na janela de sobreposição
+        self.assertGreater(update['since'], first['since'])
+
+    def test_since_catches_rows_committed_late_with_a_lower_id(self):
+        early = USBLog.objects.create(agent=self.agents[0], device_name='Pendrive', device_id='USB\\A', action_taken='BLOCKED')
+        # O id seguinte pertence a um lote que só commita depois de o Dashboard ler o mais novo
+        USBLog.objects.create(id=early.id + 2, agent=self.agents[0], device_name='Pendrive', device_id='USB\\C', action_taken='BLOCKED')
+        since = self.list_queries('/api/logs/?since=0')[0]['since']
+        self.assertEqual(since, early.id + 2)
+
+        USBLog.objects.create(id=early.id + 1, agent=self.agents[1], device_name='Pendrive', device_id='USB\\B', action_taken='BLOCKED')
+        update, _ = self.list_queries(f'/api/logs/?since={since}')
+        self.assertIn('USB\\B', [row['device_id'] for row in update['results']])
+        self.assertEqual((update['since'], update['has_more']), (since, False))
+
+
+class BulkIngestTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.agent = Agent.objects.create(hostname='PC-01', mac_address='AA:BB:CC:DD:EE:01')
+
+    def event(self, i, **fields):
+        return {"device_name": "Pendrive", "device_id": f"USB\\{i}", "action_taken": "BLOCKED", **fields}
+
+    def test_batch_over_the_limit_is_refused_whole(self):
+        events = [self.event(i, agent=self.agent.id) for i in range(501)]
+        response = self.client.post('/api/logs/bulk/', {"events": events}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(USBLog.objects.exists())
+
+    def test_invalid_events_are_rejected_one_by_one(self):
+        events = [
+            self.event(0),
+            self.event(1, action_taken='AUTHORIZED', username='ana'),
+            self.event(2, agent=999999),
+            {"device_id": "USB\\3"},
+            "nao-e-um-evento",
+        ]
+        session = {"agent": self.agent.id, "username": "maria", "ip_address": "10.0.0.9"}
+        response = self.client.post('/api/logs/bulk/', {"session": session, "events": events}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['accepted'], 2)
+        self.assertEqual([item['index'] for item in response.json()['rejected']], [2, 3, 4])
+
+        # A sessão preenche o que o evento não trouxe; o campo do evento prevalece
+        self.assertEqual(dict(USBLog.objects.values_list('device_id', 'username')), {"USB\\0": "maria", "USB\\1": "ana"})
+        self.assertEqual(set(USBLog.objects.values_list('agent_id', 'ip_address')), {(self.agent.id, '10.0.0.9')})
+        self.assertEqual(self.client.get('/api/agents/dashboard_stats/').json()['blocked_events'], 1)
+
+
+class USBLogHistoryTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.agent = Agent.objects.create(hostname='PC-01', mac_address='AA:BB:CC:DD:EE:01')
+
+    def test_history_is_served_from_rollups(self):
+        base = timezone.now().replace(minute=10, second=0, microsecond=0) - timedelta(hours=3)
+        for hour, action in ((0, 'BLOCKED'), (0, 'BLOCKED'), (1, 'AUTHORIZED'), (2, 'BLOCKED')):
+            USBLog.objects.create(agent=self.agent, device_name='Pendrive', device_id='USB\\1',
+                                  action_taken=action, timestamp=base + timedelta(hours=hour))
+
+        rollup_range(base, base + timedelta(hours=3))
+        rollup_range(base, base + timedelta(hours=3)) # Idempotente
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/logs/history/', {'granularity': 'hour', 'action': 'BLOCKED'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['total'] for row in response.json()], [2, 1])
+        self.assertNotIn('core_usblog"', ' '.join(q['sql'] for q in ctx.captured_queries))
+
+        daily = self.client.get('/api/logs/history/', {'granularity': 'day'}).json()
+        self.assertEqual(sum(row['total'] for row in daily), 4)
+
+    def log_at(self, *timestamps):
+        for timestamp in timestamps:
+            USBLog.objects.create(agent=self.agent, device_name='Pendrive', device_id='USB\\1',
+                                  action_taken='BLOCKED', timestamp=parse_datetime(timestamp))
+
+    def daily_totals(self):
+        return {row.bucket.isoformat(): row.total for row in USBLogRollup.objects.filter(granularity='DAY').order_by('bucket')}
+
+    def test_month_rollup_does_not_rewrite_the_previous_month_day(self):
+        # 31/01 23:00 UTC é 20:00 em São Paulo: com baldes locais o dia 31 atravessaria a virada do mês
+        self.log_at('2024-01-31T12:00:00+00:00', '2024-01-31T23:00:00+00:00', '2024-02-01T01:00:00+00:00')
+        january, february, march = (parse_datetime(f'2024-{m}-01T00:00:00+00:00') for m in ('01', '02', '03'))
+
+        rollup_range(january, february)
+        USBLog.objects.filter(timestamp__lt=february).delete() # Mês de janeiro retirado
+        rollup_range(february, march)
+
+        self.assertEqual(self.daily_totals(), {'2024-01-31T00:00:00+00:00': 2, '2024-02-01T00:00:00+00:00': 1})
+
+    @skipUnless(connection.vendor == 'postgresql', "Particionamento requer PostgreSQL")
+    def test_retention_keeps_daily_rollups_across_month_boundaries(self):
+        self.log_at('2024-01-31T12:00:00+00:00', '2024-01-31T23:00:00+00:00', '2024-02-01T01:00:00+00:00', '2024-02-15T10:00:00+00:00')
+        call_command('manage_log_partitions', retention_days=30, mode='drop', months_ahead=0, stdout=io.StringIO())
+
+        self.assertEqual(USBLog.objects.filter(timestamp__year=2024).count(), 0)
+        self.assertEqual(self.daily_totals(), {
+            '2024-01-31T00:00:00+00:00': 2, '2024-02-01T00:00:00+00:00': 1, '2024-02-15T00:00:00+00:00': 1,
+        })
+
+
+@override_settings(HEARTBEAT_FLUSH_INTERVAL=0, AGENT_OFFLINE_AFTER=90)
+class HeartbeatTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        heartbeats._pending.clear()
+        heartbeats._persisted.clear()
+        self.agents = [
+            Agent.objects.create(hostname=f'PC-{i:02}', mac_address=f'AA:BB:CC:DD:EE:{i:02}', is_online=False,
+                                 last_seen=timezone.now() - timedelta(hours=1))
+            for i in range(20)
+        ]
+
+    def test_beats_are_written_in_batches(self):
+        with override_settings(HEARTBEAT_FLUSH_INTERVAL=3600):
+            for agent in self.agents:
+                response = self.client.post('/api/agents/heartbeat/', {"agent": agent.id}, format='json')
+                self.assertEqual(response.status_code, 204)
+        self.assertEqual(Agent.objects.filter(is_online=True).count(), 0)
+
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(heartbeats.flush(), 20)
+        updates = [q for q in ctx.captured_queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(Agent.objects.filter(is_online=True).count(), 20)
+
+        # Beat repetido dentro do intervalo de persistência não gera escrita
+        heartbeats.beat(self.agents[0].id)
+        self.assertEqual(heartbeats.flush(), 0)
+
+    def test_sweeper_marks_stale_agents_offline(self):
+        Agent.objects.update(is_online=True)
+        heartbeats.beat(self.agents[0].id)
+        heartbeats.flush()
+
+        self.assertEqual(mark_stale_agents_offline(), 19)
+        self.assertEqual(list(Agent.objects.filter(is_online=True)), [self.agents[0]])
+
+    def at(self, start, seconds):
+        return mock.patch('django.utils.timezone.now', return_value=start + timedelta(seconds=seconds))
+
+    def test_live_agent_survives_sweeps_with_slowest_jitter(self):
+        agent, start = self.agents[0], timezone.now()
+        fastest = settings.AGENT_HEARTBEAT_INTERVAL * (1 - settings.AGENT_HEARTBEAT_JITTER)
+        slowest = settings.AGENT_HEARTBEAT_INTERVAL * (1 + settings.AGENT_HEARTBEAT_JITTER)
+        elapsed = 0
+        for _ in range(5):
+            with self.at(start, elapsed):
+                heartbeats.beat(agent.id) # Gravado
+            # Pior caso: beats descartados até o fim do intervalo de persistência...
+            target = settings.HEARTBEAT_PERSIST_INTERVAL - 0.5
+            beats = max(1, math.ceil(target / slowest))
+            if beats * fastest <= target:
+                for _ in range(beats):
+                    elapsed += target / beats
+                    with self.at(start, elapsed):
+                        heartbeats.beat(agent.id)
+            # ...e o próximo beat no jitter máximo, com o sweep logo antes dele
+            with self.at(start, elapsed + slowest - 0.5):
+                mark_stale_agents_offline()
+            agent.refresh_from_db()
+            self.assertTrue(agent.is_online, f"offline em t={elapsed + slowest:.0f}s")
+            elapsed += slowest
+
+    def test_agent_marked_offline_comes_back_on_next_beat(self):
+        agent, start = self.agents[0], timezone.now()
+        with self.at(start, 0):
+            heartbeats.beat(agent.id)
+        # Outro processo marcou offline (ex.: pausa longa); o _persisted local ainda é recente
+        Agent.objects.filter(id=agent.id).update(is_online=False)
+        with self.at(start, 1):
+            heartbeats.beat(agent.id)
+        agent.refresh_from_db()
+        self.assertTrue(agent.is_online)
+
+    def test_persist_interval_must_fit_the_offline_window(self):
+        check_heartbeat_settings()
+        with override_settings(HEARTBEAT_PERSIST_INTERVAL=60):
+            with self.assertRaises(ImproperlyConfigured):
+                check_heartbeat_settings()
+
+
+class AgentRegisterTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def register(self, **data):
+        body = {"hostname": "PC-01", "mac_address": "AA:BB:CC:DD:EE:01", "ip_address": "10.0.0.1", "policy": "BLOCK_ALL", **data}
+        return self.client.post('/api/agents/register/', body, format='json')
+
+    def test_re_register_is_idempotent_and_updates_the_ip(self):
+        first = self.register()
+        self.assertEqual(first.status_code, 201)
+        Agent.objects.filter(id=first.json()['id']).update(policy='READ_ONLY', is_online=False)
+
+        again = self.register(ip_address='10.0.0.2', policy='ALLOW_ALL')
+        self.assertEqual(again.status_code, 200)
+        self.assertEqual(again.json(), {"id": first.json()['id'], "policy": "READ_ONLY", "created": False})
+        agent = Agent.objects.get()
+        self.assertEqual((agent.ip_address, agent.is_online), ('10.0.0.2', True))
+
+    def test_saved_id_keeps_the_agent_when_the_mac_changes(self):
+        agent_id = self.register().json()['id']
+        Agent.objects.filter(id=agent_id).update(policy='READ_ONLY')
+
+        moved = self.register(agent=agent_id, mac_address='AA:BB:CC:DD:EE:99')
+        self.assertEqual(moved.json(), {"id": agent_id, "policy": "READ_ONLY", "created": False})
+        self.assertEqual(Agent.objects.get().mac_address, 'AA:BB:CC:DD:EE:99')
+
+        # ID de outra máquina (hostname diferente) não é adotado
+        other = self.register(agent=agent_id, hostname='PC-02', mac_address='AA:BB:CC:DD:EE:02')
+        self.assertTrue(other.json()['created'])
+        self.assertEqual(self.register(agent='x').status_code, 400)
+
+
+class WhitelistBulkTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def test_csv_import_skips_existing_and_feeds_sync(self):
+        WhitelistedDevice.objects.create(device_id='USB\\0')
+        lines = ['device_id,device_name,description'] + [f'USB\\{i},Pendrive {i},' for i in range(2500)]
+        upload = SimpleUploadedFile('aprovados.csv', '\n'.join(lines).encode())
+
+        response = self.client.post('/api/whitelist/import/', {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {"received": 2500, "created": 2499, "invalid": 0})
+
+        sync = self.client.get('/api/whitelist/sync/').json()
+        self.assertEqual(len(sync['devices']), 2500)
+
+    def test_broken_line_imports_nothing(self):
+        lines = [json.dumps({"device_id": f"USB\\{i}"}) for i in range(2500)] + ['{"device_id": ']
+        upload = SimpleUploadedFile('aprovados.ndjson', '\n'.join(lines).encode())
+
+        response = self.client.post('/api/whitelist/import/', {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('linha 2501', response.json()['error'])
+        self.assertEqual(response.json()['created'], 0)
+        self.assertFalse(WhitelistedDevice.objects.exists())
+        self.assertFalse(WhitelistChange.objects.exists())
+
+        upload = SimpleUploadedFile('aprovados.csv', 'device_id\nUSB\\1\n'.encode() + b'\xff\xfe\n')
+        response = self.client.post('/api/whitelist/import/', {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('linha 3', response.json()['error'])
+        self.assertFalse(WhitelistedDevice.objects.exists())
+
+    def test_bulk_revoke_and_batch_check(self):
+        self.client.post('/api/whitelist/import/', {"devices": [{"device_id": f"USB\\{i}"} for i in range(10)]}, format='json')
+        version = self.client.get('/api/whitelist/sync/').json()['version']
+
+        with CaptureQueriesContext(connection) as ctx:
+            check = self.client.post('/api/whitelist/check/', {"device_ids": ["USB\\1", "USB\\99"]}, format='json')
+        self.assertEqual(check.json(), {"authorized": ["USB\\1"], "blocked": ["USB\\99"]})
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+        revoke = self.client.post('/api/whitelist/bulk-revoke/', {"device_ids": ["USB\\1", "USB\\2", "USB\\99"]}, format='json')
+        self.assertEqual(revoke.json(), {"revoked": 2})
+        delta = self.client.get('/api/whitelist/sync/', {'since': version}).json()
+        self.assertEqual(sorted(delta['removed']), ["USB\\1", "USB\\2"])
+
+    def test_delta_resends_a_window_below_since(self):
+        first = WhitelistChange.objects.create(device_id='USB\\1', op='ADD')
+        latest = WhitelistChange.objects.create(id=first.id + 2, device_id='USB\\3', op='ADD')
+        # Commit atrasado com id abaixo da versão que o agente já tem
+        WhitelistChange.objects.create(id=first.id + 1, device_id='USB\\2', op='ADD')
+        delta = self.client.get('/api/whitelist/sync/', {'since': latest.id}).json()
+        self.assertFalse(delta['full'])
+        self.assertIn('USB\\2', delta['added'])
+
+    def test_journal_is_read_only_in_admin(self):
+        change = WhitelistChange.objects.create(device_id='USB\\1', op='ADD')
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'senha'))
+        self.assertEqual(self.client.get('/admin/core/whitelistchange/').status_code, 200)
+        self.assertEqual(self.client.get('/admin/core/whitelistchange/add/').status_code, 403)
+        self.assertEqual(self.client.post(f'/admin/core/whitelistchange/{change.id}/delete/', {'post': 'yes'}).status_code, 403)
+        self.assertTrue(WhitelistChange.objects.filter(id=change.id).exists())
+
+    def test_streaming_export(self):
+        self.client.post('/api/whitelist/import/', {"devices": [{"device_id": f"USB\\{i}"} for i in range(3)]}, format='json')
+        response = self.client.get('/api/whitelist/export/', {'type': 'ndjson'})
+        self.assertTrue(response.streaming)
+        rows = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(rows), 3)
+
+
+class DeviceIdentityTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        verdicts.reset()
+
+    def test_pnp_ids_are_normalized(self):
+        usb = parse_pnp_device_id('USB\\VID_0951&PID_1666\\60a44c413a8c')
+        self.assertEqual(canonical(usb), '0951:1666:60A44C413A8C')
+        usbstor = parse_pnp_device_id('USBSTOR\\DISK&VEN_KINGSTON&PROD_DT_3.0&REV_PMAP\\60A44C413A8C&0')
+        self.assertEqual(canonical(usbstor), 'KINGSTON:DT_3.0:60A44C413A8C')
+        self.assertIsNone(parse_pnp_device_id('\\\\.\\PHYSICALDRIVE1'))
+
+    def test_matcher_prefers_most_specific_rule(self):
+        matcher = RuleMatcher(['0951:*:*', '0951:1666:*', '\\\\.\\PHYSICALDRIVE1'])
+        self.assertEqual(matcher.match('0951:1666:ABC'), '0951:1666:*')
+        self.assertEqual(matcher.match('0951:0001:ABC'), '0951:*:*')
+        self.assertEqual(matcher.match('\\\\.\\PHYSICALDRIVE1'), '\\\\.\\PHYSICALDRIVE1')
+        self.assertIsNone(matcher.match('1234:1666:ABC'))
+        matcher.remove('0951:*:*')
+        self.assertIsNone(matcher.match('0951:0001:ABC'))
+
+    def test_check_auth_and_batch_check_honor_wildcards(self):
+        self.client.post('/api/whitelist/', {"device_id": "0951:1666:*", "device_name": "DataTraveler"}, format='json')
+
+        response = self.client.get('/api/agents/check-auth/0951:1666:ABC/')
+        self.assertEqual(response.json(), {"status": "authorized"})
+
+        check = self.client.post('/api/whitelist/check/', {"device_ids": ["0951:1666:XYZ", "0951:0001:XYZ"]}, format='json')
+        self.assertEqual(check.json(), {"authorized": ["0951:1666:XYZ"], "blocked": ["0951:0001:XYZ"]})
+
+
+class AgentPolicyTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.agent = Agent.objects.create(hostname='PC-01', mac_address='AA:BB:CC:DD:EE:01', policy='READ_ONLY')
+
+    def test_policy_is_served_with_conditional_etag(self):
+        url = f'/api/agents/{self.agent.id}/policy/'
+        response = self.client.get(url)
+        self.assertEqual(response.json(), {"policy": "READ_ONLY"})
+
+        unchanged = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(unchanged.status_code, 304)
+
+        Agent.objects.filter(pk=self.agent.pk).update(policy='BLOCK_ALL')
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.json(), {"policy": "BLOCK_ALL"})
+        self.assertEqual(self.client.get('/api/agents/999/policy/').status_code, 404)
+
+    def test_metrics_summary_is_stored_on_the_agent(self):
+        summary = {"window_seconds": 300, "stages": {"eject": {"count": 2, "p99_ms": 250}}, "gauges": {"outbox_depth": 3}}
+        response = self.client.post('/api/agents/metrics/', {"agent": self.agent.id, **summary}, format='json')
+        self.assertEqual(response.status_code, 204)
+
+        agent = self.client.get(f'/api/agents/{self.agent.id}/').json()
+        self.assertEqual(agent['metrics'], summary)
+        self.assertIsNotNone(agent['metrics_updated_at'])
+        self.assertEqual(self.client.post('/api/agents/metrics/', {"agent": 999}, format='json').status_code, 404)
+
+
+class VerdictCacheTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        verdicts.reset()
+        WhitelistedDevice.objects.create(device_id='0951:1666:*')
+        verdicts.warm()
+
+    def check(self, hw_id):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(f'/api/agents/check-auth/{hw_id}/')
+        return response.json()['status'], len(ctx.captured_queries)
+
+    def test_verdicts_are_cached_and_bloom_answers_unknown_devices(self):
+        self.assertEqual(self.check('0951:1666:ABC'), ('authorized', 1))
+        self.assertEqual(self.check('0951:1666:ABC'), ('authorized', 0))
+        # Nenhuma regra candidata no Bloom: negativo sem consulta
+        self.assertEqual(self.check('1234:5678:XYZ'), ('blocked', 0))
+
+    def test_whitelist_changes_invalidate_cached_verdicts(self):
+        self.assertEqual(self.check('1234:5678:XYZ')[0], 'blocked')
+        self.client.post('/api/whitelist/', {"device_id": "1234:*:*"}, format='json')
+        self.assertEqual(self.check('1234:5678:XYZ')[0], 'authorized')
+
+        self.client.post('/api/whitelist/revoke/', {"device_id": "1234:*:*"}, format='json')
+        self.assertEqual(self.check('1234:5678:XYZ')[0], 'blocked')
+
+        self.client.post('/api/whitelist/import/', {"devices": [{"device_id": "1234:5678:XYZ"}]}, format='json')
+        self.assertEqual(self.check('1234:5678:XYZ')[0], 'authorized')
+        self.client.post('/api/whitelist/bulk-revoke/', {"device_ids": ["1234:5678:XYZ"]}, format='json')
+        self.assertEqual(self.check('1234:5678:XYZ')[0], 'blocked')
+
+    def test_other_processes_see_changes_through_the_journal(self):
+        self.assertEqual(self.check('1234:5678:XYZ')[0], 'blocked')
+        # Simula outro processo: grava regra e diário sem passar pelos sinais deste cache
+        WhitelistedDevice.objects.bulk_create([WhitelistedDevice(device_id='1234:5678:XYZ')])
+        WhitelistChange.objects.create(device_id='1234:5678:XYZ', op='ADD')
+        self.assertEqual(self.check('1234:5678:XYZ')[0], 'blocked') # Dentro do TTL
+        verdicts._expires = 0 # TTL vencido
+        self.assertEqual(self.check('1234:5678:XYZ')[0], 'authorized')
+
+    def test_late_journal_commit_below_the_version_is_applied(self):
+        first = WhitelistChange.objects.create(device_id='0000:0000:A', op='ADD')
+        # O id seguinte fica reservado por uma transação de outro processo que ainda não commitou
+        latest = WhitelistChange.objects.create(id=first.id + 2, device_id='0000:0000:B', op='ADD')
+        verdicts._expires = 0
+        self.assertEqual(self.check('1234:5678:XYZ')[0], 'blocked')
+        self.assertEqual(verdicts._version, latest.id)
+
+        WhitelistedDevice.objects.bulk_create([WhitelistedDevice(device_id='1234:5678:XYZ')])
+        WhitelistChange.objects.create(id=first.id + 1, device_id='1234:5678:XYZ', op='ADD')
+        verdicts._expires = 0
+        self.assertEqual(self.check('1234:5678:XYZ')[0], 'authorized')
+        self.assertEqual(verdicts._version, latest.id)
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = BloomFilter(1000)
+        for i in range(1000):
+            bloom.add(f'rule-{i}')
+        self.assertTrue(all(f'rule-{i}' in bloom for i in range(1000)))
+        false_positives = sum(f'other-{i}' in bloom for i in range(10000))
+        self.assertLess(false_positives, 300)
+
+
+class FleetBenchmarkTests(TestCase):
+    # Orçamento de consultas por requisição dos endpoints quentes (gate de regressão)
+    QUERY_BUDGET = {'check_auth': 1, 'logs_list': 1, 'dashboard_stats': 2}
+
+    def test_fleet_stays_within_query_budget(self):
+        report = FleetBenchmark(agents=4, events=5, devices=20, whitelist=10).run()
+
+        self.assertEqual(report['endpoints']['check_auth']['requests'], 20)
+        self.assertFalse([name for name, row in report['endpoints'].items() if row['errors']])
+        for name, budget in self.QUERY_BUDGET.items():
+            self.assertLessEqual(report['endpoints'][name]['queries_max'], budget, name)
+        self.assertEqual(USBLog.objects.count(), 20)
+
+    def test_compare_flags_extra_queries_and_slow_p99(self):
+        row = {"requests": 1, "errors": 0, "p50_ms": 1.0, "p99_ms": 2.0, "queries_mean": 1, "queries_max": 1}
+        baseline = {"endpoints": {"check_auth": row}}
+        self.assertEqual(compare({"endpoints": {"check_auth": dict(row, p99_ms=2.4)}}, baseline), [])
+        regressions = compare({"endpoints": {"check_auth": dict(row, p99_ms=3.0, queries_mean=2, queries_max=2)}}, baseline)
+        self.assertEqual(len(regressions), 2)
+        self.assertEqual(compare({"endpoints": {"check_auth": dict(row, queries_mean=1.05, queries_max=2)}}, baseline), [])
+
+
+class USBLogExportTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.agents = [Agent.objects.create(hostname=f'PC-{i:02}', mac_address=f'AA:BB:CC:DD:EE:{i:02}') for i in range(2)]
+        self.base = base = timezone.now() - timedelta(days=3)
+        USBLog.objects.bulk_create(
+            USBLog(agent=self.agents[i % 2], device_name='Pendrive', device_id=f'USB\\{i}',
+                   action_taken='BLOCKED' if i % 3 else 'AUTHORIZED', timestamp=base + timedelta(hours=i))
+            for i in range(30)
+        )
+
+    def export(self, **params):
+        response = self.client.get('/api/logs/export/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content)
+
+    def test_csv_export_is_chronological_and_filtered(self):
+        rows = self.export(agent=self.agents[0].id, action='BLOCKED').decode().splitlines()
+        self.assertEqual(rows[0].split(',')[:4], ['id', 'timestamp', 'agent_id', 'hostname'])
+        self.assertEqual(len(rows) - 1, 10)
+        timestamps = [row.split(',')[1] for row in rows[1:]]
+        self.assertEqual(timestamps, sorted(timestamps))
+
+    def test_ndjson_export_honors_date_range(self):
+        start = (self.base + timedelta(hours=10)).isoformat()
+        rows = [json.loads(line) for line in self.export(type='ndjson', start=start).decode().splitlines()]
+        self.assertEqual(len(rows), 20)
+        self.assertEqual(rows[0]['hostname'], 'PC-00')
+
+    def test_rejects_unknown_format(self):
+        self.assertEqual(self.client.get('/api/logs/export/', {'type': 'xlsx'}).status_code, 400)
+
+
+class DeviceInventoryTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.pc1 = Agent.objects.create(hostname='PC-01', mac_address='AA:BB:CC:DD:EE:01')
+        self.pc2 = Agent.objects.create(hostname='PC-02', mac_address='AA:BB:CC:DD:EE:02')
+        self.base = timezone.now().replace(microsecond=0) - timedelta(days=1)
+
+    def event(self, agent, device_id, action, username, hours, name="Pendrive"):
+        return {
+            "agent": agent.id, "device_name": name, "device_id": device_id, "action_taken": action,
+            "username": username, "timestamp": (self.base + timedelta(hours=hours)).isoformat(),
+        }
+
+    def ingest(self):
+        events = [
+            self.event(self.pc1, '0951:1666:A', 'BLOCKED', 'ana', 2),
+            self.event(self.pc1, '0951:1666:A', 'BLOCKED', 'ana', 1),
+            self.event(self.pc2, '0951:1666:A', 'BLOCKED', 'bruno', 3, name="Kingston"),
+            self.event(self.pc2, '0781:5567:B', 'AUTHORIZED', 'bruno', 0),
+        ]
+        self.client.post('/api/logs/bulk/', {"events": events}, format='json')
+        # Evento atrasado (outbox) em outro lote: não recua o last_seen
+        self.client.post('/api/logs/bulk/', {"events": [self.event(self.pc1, '0951:1666:A', 'AUTHORIZED', 'ana', -5)]}, format='json')
+
+    def test_ingestion_maintains_inventory_and_sightings(self):
+        self.ingest()
+        device = self.client.get('/api/devices/0951:1666:A/').json()
+        self.assertEqual(device['device_name'], "Kingston")
+        self.assertEqual((device['total_events'], device['blocked_events']), (4, 3))
+        self.assertEqual(parse_datetime(device['first_seen']), self.base - timedelta(hours=5))
+        self.assertEqual([(s['agent_hostname'], s['username'], s['total_events']) for s in device['sightings']],
+                         [('PC-02', 'bruno', 1), ('PC-01', 'ana', 3)])
+
+        top = self.client.get('/api/devices/top-blocked/').json()
+        self.assertEqual([d['device_id'] for d in top], ['0951:1666:A'])
+        on_pc2 = self.client.get(f'/api/devices/by-agent/{self.pc2.id}/').json()
+        self.assertEqual({d['device_id'] for d in on_pc2}, {'0951:1666:A', '0781:5567:B'})
+        by_ana = self.client.get('/api/devices/by-user/ana/').json()
+        self.assertEqual([(d['device_id'], d['blocked_events']) for d in by_ana], [('0951:1666:A', 2)])
+
+    def test_inventory_queries_do_not_touch_usblog(self):
+        self.ingest()
+        for url in ('/api/devices/top-blocked/', f'/api/devices/by-agent/{self.pc1.id}/', '/api/devices/by-user/bruno/'):
+            with CaptureQueriesContext(connection) as ctx:
+                self.client.get(url)
+            self.assertEqual(len(ctx.captured_queries), 1)
+            self.assertNotIn('core_usblog', ctx.captured_queries[0]['sql'])
+
+    def test_backfill_rebuilds_from_usblog(self):
+        self.ingest()
+        USBLog.objects.create(agent=self.pc1, device_name="HD", device_id='1058:25A2:C', action_taken='BLOCKED', username='ana')
+        expected = list(DeviceInventory.objects.order_by('device_id').values())
+        DeviceInventory.objects.all().delete()
+
+        self.assertEqual(list(backfill(chunk_size=2))[-1], 6)
+        rebuilt = list(DeviceInventory.objects.order_by('device_id').values())
+        strip = lambda rows: [{k: v for k, v in row.items() if k != 'id'} for row in rows]
+        self.assertEqual(strip(rebuilt), strip(expected))
+
+    def test_admin_is_read_only(self):
+        self.ingest()
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'senha'))
+        device = DeviceInventory.objects.get(device_id='0951:1666:A')
+        self.assertEqual(self.client.get(f'/admin/core/deviceinventory/{device.id}/change/').status_code, 200)
+        self.assertEqual(self.client.get('/admin/core/deviceinventory/add/').status_code, 403)
+        self.assertEqual(self.client.post(f'/admin/core/deviceinventory/{device.id}/delete/', {'post': 'yes'}).status_code, 403)
+        self.assertTrue(DeviceInventory.objects.filter(id=device.id).exists())
+
+
+@skipUnless(connection.vendor == 'postgresql', "LOCK TABLE requer PostgreSQL")
+class DeviceInventoryBackfillTests(TransactionTestCase):
+    def test_batch_committed_during_backfill_is_counted_once(self):
+        agent = Agent.objects.create(hostname='PC-01', mac_address='AA:BB:CC:DD:EE:01')
+        USBLog.objects.create(agent=agent, device_name='Pendrive', device_id='USB\\A', action_taken='BLOCKED')
+        inserted, release = threading.Event(), threading.Event()
+
+        def late_batch():
+            # Lote da ingestão: o id já foi reservado, mas o commit só sai depois
+            try:
+                with transaction.atomic():
+                    logs = USBLog.objects.bulk_create([USBLog(agent=agent, device_name='Pendrive', device_id='USB\\B', action_taken='BLOCKED')])
+                    inserted.set()
+                    release.wait(1)
+                    record_logs(logs)
+            finally:
+                connections.close_all()
+
+        thread = threading.Thread(target=late_batch)
+        thread.start()
+        inserted.wait(5)
+        USBLog.objects.create(agent=agent, device_name='Pendrive', device_id='USB\\C', action_taken='BLOCKED')
+
+        # Sem a trava o corte já incluiria USB\B: o replay o leria e a escrita o somaria de novo
+        progress = backfill(chunk_size=1)
+        next(progress)
+        release.set()
+        thread.join()
+        list(progress)
+        self.assertEqual(dict(DeviceInventory.objects.values_list('device_id', 'total_events')), {'USB\\A': 1, 'USB\\B': 1, 'USB\\C': 1})
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.financeiro = Agent.objects.create(hostname='FINANCEIRO-01', mac_address='AA:BB:CC:DD:EE:01', ip_address='10.0.0.5')
+        self.rh = Agent.objects.create(hostname='RH-02', mac_address='AA:BB:CC:DD:EE:02')
+        events = [
+            {"agent": self.rh.id, "device_name": "Kingston DataTraveler", "device_id": "0951:1666:AA11", "action_taken": "BLOCKED", "username": "carla"},
+            {"agent": self.financeiro.id, "device_name": "SanDisk Cruzer", "device_id": "0781:5567:BB22", "action_taken": "BLOCKED", "username": "kingsley"},
+            {"agent": self.financeiro.id, "device_name": "Mouse", "device_id": "046D:C077:CC33", "action_taken": "AUTHORIZED", "username": "ana"},
+        ]
+        self.client.post('/api/logs/bulk/', {"events": events}, format='json')
+        WhitelistedDevice.objects.create(device_id='0951:1666:*', device_name='Kingston corporativo')
+
+    def search(self, **params):
+        response = self.client.get('/api/search/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_ranks_across_fields_and_types(self):
+        results = self.search(q='kingston')
+        self.assertEqual(results['logs'][0]['device_name'], "Kingston DataTraveler")
+        self.assertEqual([d['device_id'] for d in results['devices']], ['0951:1666:AA11'])
+        self.assertEqual([w['device_id'] for w in results['whitelist']], ['0951:1666:*'])
+        self.assertGreater(results['logs'][0]['rank'], 0)
+
+        # Hostname do agente, trecho do serial e usuário
+        by_host = self.search(q='financeiro', type='logs')['logs']
+        self.assertEqual({log['agent_hostname'] for log in by_host}, {'FINANCEIRO-01'})
+        self.assertEqual(len(by_host), 2)
+        self.assertEqual([log['username'] for log in self.search(q='BB22', type='logs')['logs']], ['kingsley'])
+        self.assertEqual(self.search(q='carla', type='logs')['logs'][0]['device_id'], '0951:1666:AA11')
+        self.assertEqual([a['hostname'] for a in self.search(q='10.0.0.5', type='agents')['agents']], ['FINANCEIRO-01'])
+
+    def test_rejects_short_terms_and_unknown_types(self):
+        self.assertEqual(self.client.get('/api/search/', {'q': 'ki'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/search/', {'q': 'kingston', 'type': 'usuarios'}).status_code, 400)
+
+    @skipUnless(connection.vendor == 'postgresql', "Similaridade por trigramas requer PostgreSQL")
+    def test_tolerates_typos_with_trigrams(self):
+        results = self.search(q='kingstom', type='devices,agents')
+        self.assertEqual([d['device_name'] for d in results['devices']], ["Kingston DataTraveler"])
+        self.assertEqual([a['hostname'] for a in self.search(q='finaceiro', type='agents')['agents']], ['FINANCEIRO-01'])
+
+    def test_admin_changelists_use_indexed_search(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'senha'))
+        response = self.client.get('/admin/core/usblog/', {'q': 'financeiro'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['cl'].result_count, 2)
+        response = self.client.get('/admin/core/whitelisteddevice/', {'q': 'kingston'})
+        self.assertEqual(response.context['cl'].result_count, 1)
+
+
+@override_settings(DATABASE_READ_REPLICAS=['replica'])
+class ReadReplicaRoutingTests(TransactionTestCase):
+    # Sem a transação do TestCase: a réplica (espelho do banco de teste) só enxerga dados confirmados
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def queries(self, method, path, data=None):
+        """ (resposta, consultas no primário, consultas na réplica) """
+        with CaptureQueriesContext(connections['default']) as primary, CaptureQueriesContext(connections['replica']) as replica:
+            if method == 'get':
+                response = self.client.get(path, data)
+            else:
+                response = self.client.post(path, data, format='json')
+        return response, len(primary.captured_queries), len(replica.captured_queries)
+
+    def test_dashboard_reads_go_to_the_replica(self):
+        for path, data in [
+            ('/api/logs/', None),
+            ('/api/agents/dashboard_stats/', None),
+            ('/api/search/', {'q': 'kingston'}),
+            ('/api/devices/', None),
+        ]:
+            response, primary, replica = self.queries('get', path, data)
+            self.assertEqual(response.status_code, 200, path)
+            self.assertEqual(primary, 0, path)
+            self.assertGreater(replica, 0, path)
+
+    def test_agent_calls_and_recent_writes_stay_on_the_primary(self):
+        agent = Agent.objects.create(hostname='PC-01', mac_address='AA:BB:CC:DD:EE:01')
+        response, _, replica = self.queries('get', '/api/agents/check-auth/USB\\X/')
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(replica, 0)
+
+        events = [{"agent": agent.id, "device_name": "Pendrive", "device_id": "USB\\1", "action_taken": "BLOCKED"}]
+        response, _, replica = self.queries('post', '/api/logs/bulk/', {"events": events})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(replica, 0)
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+        # Read-your-writes: com o cookie a listagem lê do primário e já enxerga o log recém-gravado
+        response, primary, replica = self.queries('get', '/api/logs/')
+        self.assertEqual((replica, response.status_code), (0, 200))
+        self.assertGreater(primary, 0)
+        self.assertEqual(response.json()['results'][0]['device_id'], 'USB\\1')
+
+class WireFormatTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.agent = Agent.objects.create(hostname='PC-01', mac_address='AA:BB:CC:DD:EE:01')
+        self.batch = {
+            "session": {"agent": self.agent.id, "username": "maria", "ip_address": "10.0.0.9"},
+            "events": [
+                {"device_name": "Pendrive", "device_id": f"USB\\{i}", "action_taken": "BLOCKED"} for i in range(20)
+            ] + [{"device_name": "Mouse", "device_id": "USB\\M", "action_taken": "AUTHORIZED", "username": "ana"}],
+        }
+
+    def post_bulk(self, body, content_type='application/json', **headers):
+        return self.client.post('/api/logs/bulk/', data=body, content_type=content_type, **headers)
+
+    def test_gzip_batch_with_session_fields(self):
+        response = self.post_bulk(gzip.compress(json.dumps(self.batch).encode()), HTTP_CONTENT_ENCODING='gzip')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['accepted'], 21)
+        self.assertEqual(USBLog.objects.filter(username='maria', ip_address='10.0.0.9', agent=self.agent).count(), 20)
+        self.assertEqual(USBLog.objects.get(device_id='USB\\M').username, 'ana') # O evento prevalece sobre a sessão
+
+    def test_rejects_bad_or_unsupported_bodies(self):
+        body = gzip.compress(json.dumps(self.batch).encode())
+        self.assertEqual(self.post_bulk(body[:-8], HTTP_CONTENT_ENCODING='gzip').status_code, 400)
+        self.assertEqual(self.post_bulk(body, HTTP_CONTENT_ENCODING='br').status_code, 415)
+        with override_settings(DATA_UPLOAD_MAX_MEMORY_SIZE=500):
+            self.assertEqual(self.post_bulk(body, HTTP_CONTENT_ENCODING='gzip').status_code, 413)
+        self.assertEqual(self.post_bulk(json.dumps({"events": [], "session": [1]})).status_code, 400)
+        self.assertEqual(USBLog.objects.count(), 0)
+
+    @skipUnless(wire.msgpack and wire.zstandard, "Requer msgpack e zstandard")
+    def test_msgpack_zstd_round_trip(self):
+        response = self.post_bulk(
+            wire.compress(wire.packb(self.batch), 'zstd'), content_type=wire.MSGPACK_MEDIA_TYPE,
+            HTTP_CONTENT_ENCODING='zstd', HTTP_ACCEPT=wire.MSGPACK_MEDIA_TYPE,
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(response['Content-Type'].startswith(wire.MSGPACK_MEDIA_TYPE))
+        self.assertEqual(wire.unpackb(response.content)['accepted'], 21)
+        # Com JSON preferido (ou Accept genérico) nada muda para os outros clientes
+        self.assertTrue(self.client.get('/api/logs/', HTTP_ACCEPT='*/*')['Content-Type'].startswith('application/json'))
+        self.assertTrue(self.client.get('/api/logs/', HTTP_ACCEPT=f'{wire.MSGPACK_MEDIA_TYPE};q=0.5, application/json')['Content-Type'].startswith('application/json'))
+
+        # Respostas grandes saem em zstd para quem aceita; os demais continuam no gzip
+        WhitelistedDevice.objects.bulk_create([WhitelistedDevice(device_id=f"0951:1666:{i:08d}") for i in range(200)])
+        response = self.client.get('/api/whitelist/sync/', HTTP_ACCEPT_ENCODING='zstd, gzip')
+        self.assertEqual(response['Content-Encoding'], 'zstd')
+        self.assertEqual(len(json.loads(wire.decompress(response.content, 'zstd'))['devices']), 200)
+        self.assertEqual(self.client.get('/api/whitelist/sync/', HTTP_ACCEPT_ENCODING='gzip')['Content-Encoding'], 'gzip')
+
+    def test_wire_benchmark_compares_against_json(self):
+        report = WireBenchmark(events=50, batch_size=10, whitelist=20, repeat=1).run()
+        self.assertEqual(report['upload']['json']['bytes_vs_json'], 1.0)
+        self.assertLess(report['upload']['json+gzip']['bytes_vs_json'], 0.5)
+        self.assertLess(report['whitelist']['json+gzip']['bytes_per_item'], report['whitelist']['json']['bytes_per_item'])
+        if wire.msgpack is None:
+            self.assertIn('msgpack', report['unavailable'])
+        else:
+            self.assertLess(report['upload']['msgpack']['bytes_vs_json'], 1.0)
+
+class AgentApiMixin:
+    """ Liga o ApiClient do agente ao servidor de teste: mesmo caminho do agente real, sem rede """
+
+    def setUp(self):
+        super().setUp()
+        self.agent_client = APIClient()
+        self.agent_requests = []
+        patcher = mock.patch.object(monitor.API.session, 'request', side_effect=self.route)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        data_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(data_dir.cleanup)
+        self.data_dir = data_dir.name
+
+    def route(self, method, url, params=None, headers=None, data=None, timeout=None, **kwargs):
+        path = '/api' + url[len(monitor.API.base_url):]
+        self.agent_requests.append((method, path, params))
+        extra = {'HTTP_' + k.upper().replace('-', '_'): v for k, v in (headers or {}).items() if k != 'Content-Type'}
+        extra.setdefault('HTTP_ACCEPT', monitor.API.session.headers.get('Accept', 'application/json'))
+        if method == 'GET':
+            return self.agent_client.get(path, params, **extra)
+        if 'json' in kwargs:
+            return self.agent_client.generic(method, path, json.dumps(kwargs['json']), content_type='application/json', **extra)
+        return self.agent_client.generic(method, path, data, content_type=headers['Content-Type'], **extra)
+
+
+@skipUnless(monitor, "Requer as dependências do agente (requests)")
+class AgentWhitelistSyncTests(AgentApiMixin, TestCase):
+    def test_late_commit_below_the_agent_version_reaches_the_cache(self):
+        WhitelistedDevice.objects.create(device_id='0951:1666:A')
+        cache = monitor.WhitelistCache(os.path.join(self.data_dir, 'whitelist.json'))
+        self.assertTrue(cache.sync())
+        self.assertTrue(cache.contains('0951:1666:A'))
+
+        # O id seguinte fica reservado por uma transação que só commita depois do próximo sync
+        reserved = cache.version + 1
+        WhitelistedDevice.objects.bulk_create([WhitelistedDevice(device_id='1234:5678:B'), WhitelistedDevice(device_id='1234:5678:C')])
+        WhitelistChange.objects.create(id=reserved + 1, device_id='1234:5678:C', op='ADD')
+        self.assertTrue(cache.sync())
+        self.assertEqual(cache.version, reserved + 1)
+
+        WhitelistChange.objects.create(id=reserved, device_id='1234:5678:B', op='ADD')
+        self.assertTrue(cache.sync())
+        self.assertEqual(self.agent_requests[-1][2], {"since": reserved + 1})
+        self.assertTrue(cache.contains('1234:5678:B'))
+
+        # Reaplicar a janela já vista não mexe em nada
+        with mock.patch.object(cache, '_save') as save:
+            self.assertTrue(cache.sync())
+        save.assert_not_called()
+
+    def test_periodic_full_sync_repairs_drift(self):
+        WhitelistedDevice.objects.create(device_id='0951:1666:A')
+        cache = monitor.WhitelistCache(os.path.join(self.data_dir, 'whitelist.json'))
+        cache.sync()
+        # Mudança que escapou do diário (ex.: SQL direto no banco)
+        WhitelistedDevice.objects.filter(device_id='0951:1666:A').update(device_id='0951:1666:C')
+        cache.sync()
+        self.assertTrue(cache.contains('0951:1666:A'))
+
+        cache.sync(full_interval=0)
+        self.assertEqual(self.agent_requests[-1][2], {"since": 0})
+        self.assertFalse(cache.contains('0951:1666:A'))
+        self.assertTrue(cache.contains('0951:1666:C'))
+
+
+@skipUnless(monitor, "Requer as dependências do agente (requests)")
+class AgentIdentityTests(AgentApiMixin, TestCase):
+    def start_agent(self, mac, ip='10.0.0.1'):
+        network = mock.Mock(mac=mac, ip=ip)
+        with mock.patch.object(monitor, 'DATA_DIR', self.data_dir), mock.patch.object(monitor, 'NETWORK', network):
+            return monitor.get_or_create_agent()
+
+    def test_mac_change_keeps_the_registered_agent(self):
+        agent_id = self.start_agent('AA:BB:CC:DD:EE:01')
+        self.assertEqual(self.start_agent('AA:BB:CC:DD:EE:01'), agent_id)
+        self.assertEqual(len(self.agent_requests), 1) # Mesmo MAC: usa o ID salvo, sem registrar de novo
+
+        self.assertEqual(self.start_agent('AA:BB:CC:DD:EE:99', ip='192.168.0.5'), agent_id)
+        agent = Agent.objects.get()
+        self.assertEqual((agent.mac_address, agent.ip_address), ('AA:BB:CC:DD:EE:99', '192.168.0.5'))
+
+
+@skipUnless(monitor, "Requer as dependências do agente (requests)")
+class AgentOutboxTests(AgentApiMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.agent = Agent.objects.create(hostname='PC-01', mac_address='AA:BB:CC:DD:EE:01')
+        self.path = os.path.join(self.data_dir, 'outbox.db')
+        patcher = mock.patch.object(monitor.API, 'max_retries', 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def event(self, i, **fields):
+        return {"agent": self.agent.id, "device_name": "Pendrive", "device_id": f"USB\\{i}",
+                "action_taken": "BLOCKED", "username": "maria", "ip_address": "10.0.0.9", **fields}
+
+    def test_events_survive_failed_flushes_and_restarts(self):
+        outbox = monitor.EventOutbox(self.path)
+        for i in range(3):
+            outbox.put(self.event(i))
+
+        session = monitor.API.session
+        with self.assertLogs(monitor.log, 'ERROR'):
+            with mock.patch.object(session, 'request', side_effect=monitor.requests.ConnectionError("servidor fora")):
+                self.assertFalse(outbox.flush())
+            with mock.patch.object(session, 'request', return_value=mock.Mock(status_code=503)):
+                self.assertFalse(outbox.flush())
+        self.assertEqual(outbox.depth(), 3)
+        self.assertFalse(USBLog.objects.exists())
+
+        # Agente reiniciado: a fila em disco continua lá e só esvazia depois do 201
+        outbox = monitor.EventOutbox(self.path)
+        self.assertEqual(outbox.depth(), 3)
+        self.assertTrue(outbox.flush())
+        self.assertEqual(outbox.depth(), 0)
+        self.assertEqual(USBLog.objects.filter(username='maria').count(), 3)
+
+    def test_rejected_events_do_not_block_the_queue(self):
+        outbox = monitor.EventOutbox(self.path)
+        outbox.put(self.event(0))
+        outbox.put(self.event(1, action_taken=None))
+        outbox.put(self.event(2))
+        with self.assertLogs(monitor.log, 'WARNING') as logs:
+            self.assertTrue(outbox.flush())
+        self.assertEqual(len(logs.records), 1)
+        self.assertEqual(outbox.depth(), 0)
+        self.assertEqual(sorted(USBLog.objects.values_list('device_id', flat=True)), ["USB\\0", "USB\\2"])
+
+
+@skipUnless(monitor, "Requer as dependências do agente (requests)")
+class AgentPipelineTests(SimpleTestCase):
+    def setUp(self):
+        data_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(data_dir.cleanup)
+        self.whitelist = monitor.WhitelistCache(os.path.join(data_dir.name, 'whitelist.json'))
+        self.whitelist.matcher.add('1000:*:*')
+        self.backend = monitor.FakeEjectBackend(fail=['G:'])
+        for name, value in (('EJECTOR', monitor.EjectWorker(self.backend)), ('AGENT_ID', None)):
+            patcher = mock.patch.object(monitor, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.verdicts = []
+
+    def run_pipeline(self, policy, events):
+        """ Submete (device_id, drives, segundos) e devolve o que foi aceito """
+        start = time.monotonic()
+        with mock.patch.object(monitor, 'ENGINE', monitor.PolicyEngine(self.whitelist, policy)):
+            pipeline = monitor.DevicePipeline(workers=2, debounce=2, on_verdict=lambda event, verdict, _: self.verdicts.append((event.device_id, verdict)))
+            accepted = [
+                pipeline.submit(monitor.DeviceEvent(device_id, 'Pendrive', drives, start + at))
+                for device_id, drives, at in events
+            ]
+            pipeline.close()
+        return accepted
+
+    def test_authorized_repeats_are_debounced_but_blocked_devices_always_eject(self):
+        with self.assertLogs(monitor.log, 'INFO'):
+            accepted = self.run_pipeline('BLOCK_ALL', [
+                ('1000:0001:A', ['D:'], 0), ('1000:0001:A', ['D:'], 0.5), ('1000:0001:A', ['D:'], 3),
+                ('2000:0001:B', ['E:'], 0), ('2000:0001:B', ['E:'], 0.5),
+            ])
+        self.assertEqual(accepted, [True, False, True, True, True])
+        self.assertEqual(self.backend.ejected, ['E:', 'E:'])
+        self.assertEqual(sorted(self.verdicts), [('1000:0001:A', 'AUTHORIZED')] * 2 + [('2000:0001:B', 'BLOCKED')] * 2)
+
+    def test_drives_of_a_disk_are_ejected_in_one_batch(self):
+        with mock.patch.object(self.backend, 'eject_many', wraps=self.backend.eject_many) as eject_many, \
+                self.assertLogs(monitor.log, 'WARNING') as logs:
+            self.run_pipeline('BLOCK_ALL', [('2000:0001:B', ['E:', 'f:', 'G:'], 0)])
+        eject_many.assert_called_once_with(['E:', 'F:', 'G:'])
+        self.assertIn("❗ Falha ao ejetar", [record.getMessage() for record in logs.records])
+
+    def test_read_only_ejects_only_the_drives_it_could_not_protect(self):
+        with mock.patch.object(self.backend, 'eject_many', wraps=self.backend.eject_many) as eject_many, \
+                self.assertLogs(monitor.log, 'WARNING'):
+            self.run_pipeline('READ_ONLY', [('2000:0001:B', ['E:', 'G:'], 0)])
+        self.assertEqual(self.backend.protected, ['E:'])
+        eject_many.assert_called_once_with(['G:'])
+        self.assertEqual(self.verdicts, [('2000:0001:B', 'READ_ONLY')])
+
+
+@skipUnless(monitor, "Requer as dependências do agente (requests)")
+class AgentSimulationTests(SimpleTestCase):
+    def test_recorded_trace_replays_with_the_same_verdicts(self):
+        data_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(data_dir.cleanup)
+        trace = os.path.join(data_dir.name, 'trace.ndjson')
+        monitor.SyntheticWatcher(rate=50, burst_size=20, burst_every=1, devices=16, count=300, seed=7).record(trace)
+        schedule = list(monitor.SyntheticWatcher(trace=trace).schedule())
+        self.assertEqual(len(schedule), 300)
+
+        # Sem espera (speed=0) tudo cai na janela de debounce: cada autorizado conta uma vez, bloqueados sempre
+        authorized = {device_id for _, device_id, _, _ in schedule if device_id.startswith('1000:')}
+        blocked = sum(not device_id.startswith('1000:') for _, device_id, _, _ in schedule)
+
+        summaries = []
+        for _ in range(2):
+            with mock.patch.multiple(monitor, DATA_DIR=data_dir.name, ENGINE=None, EJECTOR=None), \
+                    mock.patch('sys.stdout', new_callable=io.StringIO) as stdout, self.assertLogs(monitor.log, 'WARNING'):
+                summaries.append(monitor.run_simulation(f"trace={trace},speed=0"))
+            self.assertEqual(json.loads(stdout.getvalue())['verdicts'], summaries[-1]['verdicts'])
+        self.assertEqual(summaries[0]['verdicts'], {"AUTHORIZED": len(authorized), "BLOCKED": blocked})
+        self.assertEqual(summaries[1]['verdicts'], summaries[0]['verdicts'])
+        self.assertEqual(summaries[0]['submitted'], len(authorized) + blocked)
+
+
+@skipUnless(monitor, "Requer as dependências do agente (requests)")
+class AgentEjectTests(SimpleTestCase):
+    def test_normalize_drive(self):
+        self.assertEqual(monitor.normalize_drive('e:'), 'E:')
+        self.assertEqual(monitor.normalize_drive('/dev/sdb'), '/dev/sdb')
+        for bad in ('E:\\', 'EE:', "E:'; Remove-Item C:\\", '/dev/../sda', '', '1:'):
+            self.assertIsNone(monitor.normalize_drive(bad), bad)
+
+    def test_drives_of_a_disk_go_in_one_batch(self):
+        backend = monitor.FakeEjectBackend()
+        worker = monitor.EjectWorker(backend)
+        with mock.patch.object(backend, 'eject_many', wraps=backend.eject_many) as eject_many:
+            results = worker.eject_many(['e:', 'F:', "G:'"])
+        eject_many.assert_called_once_with(['E:', 'F:'])
+        self.assertEqual(backend.ejected, ['E:', 'F:'])
+        self.assertEqual([(r.drive, r.ok) for r in results], [('E:', True), ('F:', True), ("G:'", False)])
+        self.assertEqual(results[-1].error, "unidade inválida")
+
+        with mock.patch.object(backend, 'protect_many', wraps=backend.protect_many) as protect_many:
+            worker.protect_many(['/dev/sdb', 'h:'])
+        protect_many.assert_called_once_with(['/dev/sdb', 'H:'])
+
+    def test_failed_drives_are_reported(self):
+        backend = monitor.FakeEjectBackend(fail=['f:'])
+        worker = monitor.EjectWorker(backend)
+        for operation, done in ((worker.eject_many, backend.ejected), (worker.protect_many, backend.protected)):
+            results = operation(['E:', 'F:'])
+            self.assertEqual([(r.drive, r.ok, r.error) for r in results], [('E:', True, None), ('F:', False, "falha simulada")])
+            self.assertEqual(done, ['E:'])
+
+    def test_ejections_are_confirmed_together(self):
+        E = monitor.EjectResult
+        invoked = [E('E:', True, 1, None), E('F:', False, 1, 'unidade nao encontrada'), E('G:', True, 1, None), E('H:', True, 1, None)]
+        start = time.perf_counter()
+        # E: e H: somem depois de 0,2 s; G: nunca some (arquivo aberto)
+        mounted = lambda d: d == 'G:' or time.perf_counter() - start < 0.2
+        results = monitor.confirm_ejected(invoked, start, timeout=0.5, mounted=mounted)
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual([(r.drive, r.ok) for r in results], [('E:', True), ('F:', False), ('G:', False), ('H:', True)])
+        self.assertEqual(results[1], invoked[1]) # Falha no Eject volta como veio
+        self.assertEqual(results[2].error, "unidade continua montada")
+        self.assertLess(results[3].latency_ms, 450) # H: não esperou E: confirmar primeiro
+        self.assertLess(elapsed, 1.0) # Uma única janela de confirmação, não uma por unidade
+
+
+@skipUnless(monitor, "Requer as dependências do agente (requests)")
+class AgentPackagingTests(SimpleTestCase):
+    def test_agent_imports_without_the_backend_tree(self):
+        # O agente é distribuído só com estes arquivos, sem o projeto Django
+        root = settings.BASE_DIR.parent
+        with tempfile.TemporaryDirectory() as agent_dir:
+            for name in ('monitor.py', 'device_identity.py', 'bulk_session.py'):
+                shutil.copy(root / name, agent_dir)
+            result = subprocess.run([sys.executable, '-c', 'import monitor'], cwd=agent_dir, capture_output=True, text=True)
+        self.assertEqual(result.returncode, 0, result.stderr)
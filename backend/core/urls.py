@@ -1,13 +1,16 @@
 # core/urls.py
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import AgentViewSet, USBLogViewSet, WhitelistedDeviceViewSet # Adicione o WhitelistedDeviceViewSet
+from .views import AgentViewSet, DeviceInventoryViewSet, SearchViewSet, USBLogViewSet, WhitelistedDeviceViewSet, event_stream # Adicione o WhitelistedDeviceViewSet
 
 router = DefaultRouter()
 router.register(r'agents', AgentViewSet)
 router.register(r'logs', USBLogViewSet)
 router.register(r'whitelist', WhitelistedDeviceViewSet) # <--- ESSA LINHA É ESSENCIAL PARA O FRONTEND
+router.register(r'devices', DeviceInventoryViewSet) # Inventário de dispositivos da frota
+router.register(r'search', SearchViewSet, basename='search') # Busca ranqueada (trigramas no PostgreSQL)
 
 urlpatterns = [
+    path('stream/', event_stream, name='event-stream'), # Stream SSE do dashboard (ASGI)
     path('', include(router.urls)),
 ]
\ No newline at end of file
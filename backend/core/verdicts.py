@@ -0,0 +1,199 @@
+"""
+Cache dos veredictos do check_auth.
+
+Ordem de consulta:
+1. Filtro de Bloom com todas as regras da Whitelist: se nenhuma regra candidata
+   do dispositivo está no filtro, ele com certeza não é autorizado (negativo sem
+   tocar em nada mais). O filtro só cresce; remoções apenas geram falsos positivos,
+   que seguem para os passos seguintes.
+2. LRU em memória do processo (positivos e negativos).
+3. Cache compartilhado opcional (alias do CACHES), entre processos/servidores.
+4. Banco: uma consulta indexada "device_id IN (regras candidatas)".
+
+Invalidação: sinais de WhitelistedDevice e as operações em lote chamam
+rule_added()/rules_changed() no próprio processo. A cada TTL segundos cada
+processo relê o diário WhitelistChange a partir de JOURNAL_OVERLAP ids antes
+da versão que conhece e aplica todo id ainda não visto, inclusive os commits
+atrasados com id abaixo da versão: o LRU cai e as regras adicionadas entram no
+Bloom (mesmo delta que os agentes baixam). As chaves do cache compartilhado
+levam a versão e os ids vistos na janela, então nunca servem um veredicto de
+outro estado do diário.
+"""
+import hashlib
+import math
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import caches
+from device_identity import candidate_rules
+from .models import WhitelistedDevice, WhitelistChange
+
+JOURNAL_OVERLAP = 100 # ids do diário relidos a cada checagem: commits fora de ordem não escapam
+JOURNAL_MAX_DELTA = 10000 # acima disso é mais barato reconstruir o Bloom do zero
+
+class BloomFilter:
+    """ Filtro de Bloom simples sobre um bytearray (k posições derivadas de um único blake2b) """
+
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(capacity, 1)
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value):
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, value):
+        for pos in self._positions(value):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, value):
+        return all(self.bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(value))
+
+class VerdictCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._lru = OrderedDict()
+        self._bloom = None
+        self._generation = 0 # Local: muda a cada invalidação neste processo
+        self._version = None # Versão da Whitelist refletida no estado local
+        self._seen = frozenset() # ids do diário já aplicados dentro da janela de sobreposição
+        self._expires = 0
+
+    # --- CONFIGURAÇÃO (lida a cada uso: override_settings funciona nos testes) ---
+    @property
+    def maxsize(self):
+        return getattr(settings, 'CHECK_AUTH_CACHE_SIZE', 10000)
+
+    @property
+    def ttl(self):
+        return getattr(settings, 'CHECK_AUTH_CACHE_TTL', 5)
+
+    @property
+    def shared(self):
+        alias = getattr(settings, 'CHECK_AUTH_CACHE_ALIAS', None)
+        return caches[alias] if alias else None
+
+    # --- CONSULTA ---
+    def is_authorized(self, hw_id):
+        self._check_expiry()
+        candidates = candidate_rules(hw_id)
+        bloom = self._bloom or self._build_bloom()
+        if not any(rule in bloom for rule in candidates):
+            return False
+
+        cached = self._lru_get(hw_id)
+        if cached is not None:
+            return cached
+
+        generation = self._generation
+        shared = self.shared
+        if shared is not None:
+            key = self._shared_key(hw_id)
+            cached = shared.get(key)
+            if cached is not None:
+                self._lru_put(hw_id, cached, generation)
+                return cached
+
+        verdict = WhitelistedDevice.objects.filter(device_id__in=candidates).exists()
+        self._lru_put(hw_id, verdict, generation)
+        if shared is not None:
+            shared.set(key, verdict, timeout=self.ttl * 12)
+        return verdict
+
+    def _build_bloom(self):
+        with self._lock:
+            if self._bloom is None:
+                rules = list(WhitelistedDevice.objects.values_list('device_id', flat=True))
+                bloom = BloomFilter(max(len(rules), 1000) * 2) # Folga para as regras que chegarem depois
+                for rule in rules:
+                    bloom.add(rule)
+                self._bloom = bloom
+            return self._bloom
+
+    def _lru_get(self, hw_id):
+        with self._lock:
+            verdict = self._lru.get(hw_id)
+            if verdict is not None:
+                self._lru.move_to_end(hw_id)
+            return verdict
+
+    def _lru_put(self, hw_id, verdict, generation):
+        with self._lock:
+            # Uma invalidação chegou durante a consulta ao banco: o resultado pode estar velho
+            if generation != self._generation:
+                return
+            self._lru[hw_id] = verdict
+            self._lru.move_to_end(hw_id)
+            while len(self._lru) > self.maxsize:
+                self._lru.popitem(last=False)
+
+    def _shared_key(self, hw_id):
+        digest = hashlib.blake2b(hw_id.encode(), digest_size=16).hexdigest()
+        return f"check_auth:{self._version}.{len(self._seen)}:{digest}"
+
+    def _check_expiry(self):
+        """ No máximo uma consulta (indexada pela PK) a cada TTL segundos """
+        now = time.monotonic()
+        if now < self._expires:
+            return
+        changes = []
+        if self._version is not None:
+            changes = list(
+                WhitelistChange.objects.filter(id__gt=self._version - JOURNAL_OVERLAP)
+                .order_by('id').values_list('id', 'device_id', 'op')[:JOURNAL_MAX_DELTA]
+            )
+        if self._version is None or len(changes) == JOURNAL_MAX_DELTA:
+            self.reset()
+            ids = list(WhitelistChange.objects.order_by('-id').values_list('id', flat=True)[:JOURNAL_OVERLAP])
+            self._version = ids[0] if ids else 0
+            self._seen = frozenset(ids)
+        else:
+            # Um commit atrasado pode ter id menor que a versão: vale o id não visto, não o maior id
+            unseen = [change for change in changes if change[0] not in self._seen]
+            if unseen:
+                self.rules_changed(added=[device_id for _, device_id, op in unseen if op == 'ADD'], recheck=False)
+                self._version = max(self._version, changes[-1][0])
+            self._seen = frozenset(change[0] for change in changes if change[0] > self._version - JOURNAL_OVERLAP)
+        self._expires = now + self.ttl
+
+    def warm(self):
+        """ Confere a versão e monta o filtro de Bloom antes da primeira requisição """
+        self._check_expiry()
+        self._bloom or self._build_bloom()
+
+    # --- INVALIDAÇÃO ---
+    def reset(self):
+        """ Descarta LRU e filtro de Bloom (reconstruído na próxima consulta) """
+        with self._lock:
+            self._generation += 1
+            self._lru.clear()
+            self._bloom = None
+            self._version = None
+            self._seen = frozenset()
+            self._expires = 0
+
+    def rules_changed(self, added=(), recheck=True):
+        """
+        Qualquer mudança na Whitelist derruba o LRU (uma regra com curinga pode
+        afetar vários IDs já em cache). O Bloom só precisa receber as regras novas:
+        regras removidas continuam nele como falsos positivos inofensivos.
+        """
+        with self._lock:
+            self._generation += 1
+            self._lru.clear()
+            if self._bloom is not None:
+                for rule in added:
+                    self._bloom.add(rule)
+            if recheck:
+                # Relê o diário na próxima consulta (nova versão = novas chaves no cache compartilhado)
+                self._expires = 0
+
+    def rule_added(self, rule):
+        self.rules_changed(added=[rule])
+
+verdicts = VerdictCache()
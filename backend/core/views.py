@@ -1,9 +1,28 @@
 from rest_framework import viewsets, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
-from django.db.models import Count
-from .models import Agent, USBLog, WhitelistedDevice
-from .serializers import AgentSerializer, USBLogSerializer, WhitelistedDeviceSerializer
+import asyncio
+from collections import Counter
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.db.models import Sum
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from device_identity import normalize_rule
+from .broadcast import broadcaster, format_sse, publish_logs
+from .db_router import replica_reads
+from .heartbeats import heartbeats
+from .models import Agent, DeviceInventory, DeviceSighting, USBLog, USBLogCounter, USBLogRollup, WhitelistedDevice, WhitelistChange
+from .pagination import DeviceInventoryCursorPagination, USBLogCursorPagination
+from .serializers import (
+    AgentSerializer, DeviceInventorySerializer, DeviceSightingSerializer, USBLogSerializer, WhitelistedDeviceSerializer,
+)
+from .stats import get_dashboard_stats
+from .verdicts import JOURNAL_OVERLAP, verdicts
+from . import exports, inventory, search, whitelist
 
 class AgentViewSet(viewsets.ModelViewSet):
     queryset = Agent.objects.all()
@@ -15,48 +34,313 @@ class AgentViewSet(viewsets.ModelViewSet):
             return self.queryset.filter(mac_address=mac)
         return self.queryset
 
+    # --- REGISTRO IDEMPOTENTE (UPSERT PELO MAC) ---
+    @action(detail=False, methods=['post'], url_path='register')
+    def register(self, request):
+        """
+        Registra ou atualiza o agente pela identidade de hardware (mac_address, único e indexado).
+        Pode ser chamado quantas vezes for preciso: sempre devolve o mesmo ID.
+        Um agente já registrado manda o ID salvo em 'agent': se o MAC da interface
+        de saída mudou (outra placa, Wi-Fi/cabo) o registro existente recebe o MAC
+        novo, mantendo política e histórico, em vez de virar um agente duplicado.
+        """
+        mac = request.data.get('mac_address')
+        hostname = request.data.get('hostname')
+        if not mac or not hostname:
+            return Response({"error": "hostname e mac_address são obrigatórios"}, status=status.HTTP_400_BAD_REQUEST)
+        policy = request.data.get('policy', 'ALLOW_ALL')
+        if policy not in dict(Agent.POLICY_CHOICES):
+            return Response({"error": "Política inválida"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            agent_id = int(request.data['agent']) if request.data.get('agent') is not None else None
+        except (TypeError, ValueError):
+            return Response({"error": "agent deve ser o ID do agente"}, status=status.HTTP_400_BAD_REQUEST)
+
+        lookup = {"mac_address": mac}
+        if agent_id is not None and Agent.objects.filter(id=agent_id, hostname=hostname).exists():
+            # O MAC novo só é adotado se não pertence a outro agente
+            if not Agent.objects.filter(mac_address=mac).exclude(id=agent_id).exists():
+                lookup = {"id": agent_id}
+
+        agent, created = Agent.objects.update_or_create(
+            **lookup,
+            defaults={
+                "hostname": hostname,
+                "mac_address": mac,
+                "ip_address": request.data.get('ip_address') or None,
+                "is_online": True,
+                "last_seen": timezone.now(),
+            },
+            create_defaults={
+                "hostname": hostname,
+                "mac_address": mac,
+                "ip_address": request.data.get('ip_address') or None,
+                "policy": policy,
+            },
+        )
+        return Response(
+            {"id": agent.id, "policy": agent.policy, "created": created},
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+        )
+
+    # --- HEARTBEAT (AGREGADO EM MEMÓRIA, GRAVADO EM LOTE) ---
+    @action(detail=False, methods=['post'], url_path='heartbeat')
+    def heartbeat(self, request):
+        """
+        Sinal de vida do agente {"agent": id, "ip_address": "..."}.
+        Não toca no banco na hora: o beat é agregado e gravado em lote.
+        """
+        try:
+            agent_id = int(request.data.get('agent'))
+        except (TypeError, ValueError):
+            return Response({"error": "agent deve ser o ID do agente"}, status=status.HTTP_400_BAD_REQUEST)
+
+        heartbeats.beat(agent_id, request.data.get('ip_address') or None)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    # --- POLÍTICA DO AGENTE (CONSULTA CONDICIONAL) ---
+    @action(detail=True, methods=['get'])
+    def policy(self, request, pk=None):
+        """
+        Política vigente do agente com ETag. O agente envia If-None-Match com a
+        política que já tem compilada e recebe 304 (sem corpo) se nada mudou.
+        """
+        policy = Agent.objects.filter(pk=pk).values_list('policy', flat=True).first()
+        if policy is None:
+            return Response({"error": "Agente não encontrado"}, status=status.HTTP_404_NOT_FOUND)
+
+        etag = f'"{policy}"'
+        if request.headers.get('If-None-Match') == etag:
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+        return Response({"policy": policy}, headers={"ETag": etag})
+
+    # --- MÉTRICAS DO AGENTE (RESUMO PERIÓDICO) ---
+    @action(detail=False, methods=['post'], url_path='metrics')
+    def metrics(self, request):
+        """
+        Resumo da última janela de métricas do agente (latência por estágio,
+        contadores, profundidade da outbox). Guarda apenas o último resumo.
+        """
+        try:
+            agent_id = int(request.data.get('agent'))
+        except (TypeError, ValueError):
+            return Response({"error": "agent deve ser o ID do agente"}, status=status.HTTP_400_BAD_REQUEST)
+
+        summary = {key: value for key, value in request.data.items() if key != 'agent'}
+        if not Agent.objects.filter(pk=agent_id).update(metrics=summary, metrics_updated_at=timezone.now()):
+            return Response({"error": "Agente não encontrado"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
     @action(detail=False, methods=['get'], url_path='check-auth/(?P<hw_id>.+)')
     def check_auth(self, request, hw_id=None):
         if not hw_id:
             return Response({"error": "Hardware ID não fornecido"}, status=status.HTTP_400_BAD_REQUEST)
         
-        is_authorized = WhitelistedDevice.objects.filter(device_id=hw_id).exists()
-        
-        if is_authorized:
+        # Normalmente respondido pelo AgentFastPathMiddleware; mesmo cache de veredictos
+        if verdicts.is_authorized(hw_id):
             return Response({"status": "authorized"}, status=status.HTTP_200_OK)
         return Response({"status": "blocked"}, status=status.HTTP_403_FORBIDDEN)
 
     @action(detail=False, methods=['get'])
+    @replica_reads()
     def dashboard_stats(self, request):
-        total_agents = Agent.objects.count()
-        active_agents = Agent.objects.filter(is_online=True).count()
-        total_events = USBLog.objects.count()
-        blocked_events = USBLog.objects.filter(action_taken='BLOCKED').count()
-        authorized_events = USBLog.objects.filter(action_taken='DETECTED').count()
+        return Response(get_dashboard_stats())
+
+class USBLogViewSet(viewsets.ModelViewSet):
+    queryset = USBLog.objects.select_related('agent').order_by('-timestamp', '-id')
+    serializer_class = USBLogSerializer
+    pagination_class = USBLogCursorPagination
 
+    def get_queryset(self):
+        """
+        Filtros indexados: ?agent=<id>, ?action=<BLOCKED|AUTHORIZED>,
+        ?start=<ISO8601> e ?end=<ISO8601> (intervalo de timestamp).
+        """
+        queryset = self.queryset
+        params = self.request.query_params
+
+        if params.get('agent'):
+            queryset = queryset.filter(agent_id=params['agent'])
+        if params.get('action'):
+            queryset = queryset.filter(action_taken=params['action'])
+        for param, lookup in (('start', 'timestamp__gte'), ('end', 'timestamp__lt')):
+            if params.get(param):
+                value = parse_datetime(params[param])
+                if value is None:
+                    raise ValidationError({param: "Data inválida, use ISO 8601"})
+                queryset = queryset.filter(**{lookup: value})
+        return queryset
+
+    def perform_create(self, serializer):
+        # Log, contadores e inventário na mesma transação (ver inventory.backfill)
+        with transaction.atomic():
+            serializer.save()
+
+    @replica_reads()
+    def list(self, request, *args, **kwargs):
+        """
+        Modo incremental: ?since=<id> devolve os logs gravados depois desse id
+        (inclui eventos atrasados pela outbox, que chegam com timestamp antigo)
+        e relê os BULK_MAX_EVENTS ids anteriores: um lote que commitou depois
+        de um id maior não fica para trás. O cliente descarta os repetidos por id.
+        Sem 'since', pagina por cursor do mais novo para o mais antigo.
+        """
+        since = request.query_params.get('since')
+        if since is None:
+            return super().list(request, *args, **kwargs)
+        try:
+            since = int(since)
+        except ValueError:
+            raise ValidationError({"since": "since deve ser um inteiro"})
+
+        limit = USBLogCursorPagination.max_page_size
+        queryset = self.get_queryset()
+        logs = list(queryset.filter(id__gt=since).order_by('id')[:limit])
+        has_more = len(logs) == limit
+        if since > 0:
+            # Janela de sobreposição fora do limite: não impede o cursor de avançar
+            logs = list(queryset.filter(id__gt=since - self.BULK_MAX_EVENTS, id__lte=since).order_by('id')) + logs
+        logs.reverse() # Mantém a ordem do dashboard: mais novos primeiro
         return Response({
-            "active_agents": active_agents,
-            "total_agents": total_agents,
-            "total_events": total_events,
-            "blocked_events": blocked_events,
-            "authorized_events": authorized_events,
-            "integrity_score": 98.5
+            "since": max((log.id for log in logs), default=since),
+            "has_more": has_more,
+            "results": self.get_serializer(logs, many=True).data,
         })
 
-class USBLogViewSet(viewsets.ModelViewSet):
-    queryset = USBLog.objects.all().order_by('-timestamp')
-    serializer_class = USBLogSerializer
+    BULK_MAX_EVENTS = 500
+
+    # --- EXPORTAÇÃO PARA AUDITORIA (STREAMING) ---
+    @action(detail=False, methods=['get'], url_path='export')
+    @replica_reads()
+    def export(self, request):
+        """
+        Exporta o histórico em ordem cronológica sem carregar a tabela em memória:
+        ?type=csv (padrão) | ndjson | parquet (requer pyarrow), com os mesmos
+        filtros da listagem (?start, ?end, ?agent, ?action).
+        """
+        file_type = request.query_params.get('type', 'csv')
+        if file_type not in exports.CONTENT_TYPES:
+            return Response({"error": "type deve ser csv, ndjson ou parquet"}, status=status.HTTP_400_BAD_REQUEST)
+        if file_type == 'parquet' and exports.pq is None:
+            return Response({"error": "Exportação Parquet indisponível: instale o pyarrow"}, status=status.HTTP_501_NOT_IMPLEMENTED)
+
+        queryset = self.get_queryset()
+        # Fixa o alias agora: o streaming roda depois que a view retorna (fora do replica_reads)
+        chunks = exports.stream_usblog(queryset.using(queryset.db), file_type)
+        response = StreamingHttpResponse(chunks, content_type=exports.CONTENT_TYPES[file_type])
+        response['Content-Disposition'] = f'attachment; filename="usb_logs.{file_type}"'
+        return response
+
+    # --- HISTÓRICO PARA GRÁFICOS (AGREGADOS) ---
+    @action(detail=False, methods=['get'], url_path='history')
+    @replica_reads()
+    def history(self, request):
+        """
+        Série temporal a partir dos agregados (não toca no USBLog):
+        ?granularity=hour|day, ?start/?end (ISO 8601), ?agent=<id>, ?action=<ação>.
+        """
+        granularity = request.query_params.get('granularity', 'hour').upper()
+        if granularity not in dict(USBLogRollup.GRANULARITY_CHOICES):
+            return Response({"error": "granularity deve ser hour ou day"}, status=status.HTTP_400_BAD_REQUEST)
+
+        rollups = USBLogRollup.objects.filter(granularity=granularity)
+        params = request.query_params
+        if params.get('agent'):
+            rollups = rollups.filter(agent_id=params['agent'])
+        if params.get('action'):
+            rollups = rollups.filter(action_taken=params['action'])
+        for param, lookup in (('start', 'bucket__gte'), ('end', 'bucket__lt')):
+            if params.get(param):
+                value = parse_datetime(params[param])
+                if value is None:
+                    raise ValidationError({param: "Data inválida, use ISO 8601"})
+                rollups = rollups.filter(**{lookup: value})
+
+        series = rollups.order_by('bucket').values('bucket', 'action_taken').annotate(total=Sum('total'))
+        return Response(list(series))
+
+    # --- INGESTÃO EM LOTE (OUTBOX DOS AGENTES) ---
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk_ingest(self, request):
+        """
+        Recebe um lote de eventos {"events": [...]} e grava tudo com um único bulk_create.
+        Campos iguais em todo o lote (agent, username, ip_address) podem vir uma
+        única vez em "session"; o que vier no evento prevalece.
+        Eventos inválidos são devolvidos em 'rejected' para que não travem a fila do agente.
+        """
+        events = request.data.get('events')
+        session = request.data.get('session') or {}
+        if not isinstance(events, list):
+            return Response({"error": "events deve ser uma lista"}, status=status.HTTP_400_BAD_REQUEST)
+        if not isinstance(session, dict):
+            return Response({"error": "session deve ser um objeto"}, status=status.HTTP_400_BAD_REQUEST)
+        if len(events) > self.BULK_MAX_EVENTS:
+            return Response({"error": f"Máximo de {self.BULK_MAX_EVENTS} eventos por lote"}, status=status.HTTP_400_BAD_REQUEST)
+
+        logs, rejected = [], []
+        for index, event in enumerate(events):
+            if session and isinstance(event, dict):
+                event = {**session, **event}
+            serializer = self.get_serializer(data=event)
+            if serializer.is_valid():
+                logs.append(USBLog(**serializer.validated_data))
+            else:
+                rejected.append({"index": index, "errors": serializer.errors})
+
+        with transaction.atomic():
+            USBLog.objects.bulk_create(logs)
+            USBLogCounter.bump(Counter(log.action_taken for log in logs))
+            inventory.record_logs(logs)
+            if logs and broadcaster.has_subscribers:
+                data = self.get_serializer(logs, many=True).data
+                transaction.on_commit(lambda: publish_logs(data))
+        return Response({"accepted": len(logs), "rejected": rejected}, status=status.HTTP_201_CREATED)
 
 class WhitelistedDeviceViewSet(viewsets.ModelViewSet):
     queryset = WhitelistedDevice.objects.all()
     serializer_class = WhitelistedDeviceSerializer
 
     def create(self, request, *args, **kwargs):
-        device_id = request.data.get('device_id')
+        device_id = normalize_rule(request.data.get('device_id') or '')
         if WhitelistedDevice.objects.filter(device_id=device_id).exists():
             return Response({"message": "Dispositivo já está na lista branca."}, status=status.HTTP_200_OK)
         return super().create(request, *args, **kwargs)
 
+    # --- SINCRONIZAÇÃO VERSIONADA (CACHE DOS AGENTES) ---
+    @action(detail=False, methods=['get'], url_path='sync')
+    def sync(self, request):
+        """
+        Retorna a Whitelist para o cache local dos agentes.
+        Sem 'since' (ou com versão desconhecida) envia o snapshot completo;
+        com 'since=N' envia o que mudou após a versão N, mais uma janela de
+        JOURNAL_OVERLAP ids abaixo dela: um commit atrasado com id menor que N
+        ainda chega ao agente, que aplica as operações de forma idempotente.
+        """
+        try:
+            since = int(request.query_params.get('since', 0))
+        except ValueError:
+            return Response({"error": "since deve ser um inteiro"}, status=status.HTTP_400_BAD_REQUEST)
+
+        # A versão é lida antes dos dados: se algo mudar no meio, o próximo delta reaplica (idempotente)
+        version = WhitelistChange.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+        if since <= 0 or since > version:
+            devices = list(WhitelistedDevice.objects.values_list('device_id', flat=True))
+            return Response({"version": version, "full": True, "devices": devices})
+
+        # Compacta o diário: só o último estado de cada dispositivo interessa ao agente
+        latest_op = {}
+        changes = WhitelistChange.objects.filter(id__gt=since - JOURNAL_OVERLAP, id__lte=version).order_by('id').values_list('device_id', 'op')
+        for device_id, op in changes:
+            latest_op[device_id] = op
+
+        return Response({
+            "version": version,
+            "full": False,
+            "added": [d for d, op in latest_op.items() if op == 'ADD'],
+            "removed": [d for d, op in latest_op.items() if op == 'REMOVE'],
+        })
+
     # --- NOVA AÇÃO: REVOGAR ---
     @action(detail=False, methods=['post'], url_path='revoke')
     def revoke_device(self, request):
@@ -68,8 +352,190 @@ class WhitelistedDeviceViewSet(viewsets.ModelViewSet):
             return Response({"error": "device_id é obrigatório"}, status=status.HTTP_400_BAD_REQUEST)
 
         try:
-            device = WhitelistedDevice.objects.get(device_id=device_id)
+            device = WhitelistedDevice.objects.get(device_id=normalize_rule(device_id))
             device.delete()
             return Response({"message": "Acesso revogado com sucesso!"}, status=status.HTTP_200_OK)
         except WhitelistedDevice.DoesNotExist:
-            return Response({"error": "Dispositivo não encontrado na Whitelist."}, status=status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+            return Response({"error": "Dispositivo não encontrado na Whitelist."}, status=status.HTTP_404_NOT_FOUND)
+
+    # --- OPERAÇÕES EM LOTE ---
+    BATCH_MAX_IDS = 10000
+
+    def get_device_ids(self, request):
+        device_ids = request.data.get('device_ids')
+        if not isinstance(device_ids, list) or not all(isinstance(d, str) for d in device_ids):
+            raise ValidationError({"device_ids": "Informe uma lista de device_id"})
+        if len(device_ids) > self.BATCH_MAX_IDS:
+            raise ValidationError({"device_ids": f"Máximo de {self.BATCH_MAX_IDS} por requisição"})
+        return device_ids
+
+    @action(detail=False, methods=['post'], url_path='import')
+    def bulk_import(self, request):
+        """
+        Importa dispositivos em lote: arquivo 'file' (.csv ou NDJSON) via multipart,
+        lido em streaming, ou JSON {"devices": [{"device_id": ..., "device_name": ...}]}.
+        Dispositivos já autorizados são ignorados. Um arquivo com erro não importa
+        nada: a resposta 400 traz a linha do problema.
+        """
+        upload = request.FILES.get('file')
+        if upload is not None:
+            rows = whitelist.parse_upload(upload)
+        elif isinstance(request.data.get('devices'), list):
+            rows = request.data['devices']
+        else:
+            return Response({"error": "Envie um arquivo 'file' ou a lista 'devices'"}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            result = whitelist.import_devices(rows)
+        except ValueError as e:
+            return Response({"error": f"Arquivo inválido, nada foi importado ({e})", "created": 0}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(result, status=status.HTTP_201_CREATED)
+
+    @action(detail=False, methods=['post'], url_path='bulk-revoke')
+    def bulk_revoke(self, request):
+        """ Revoga vários dispositivos de uma vez: {"device_ids": [...]} """
+        revoked = whitelist.revoke_devices(self.get_device_ids(request))
+        return Response({"revoked": revoked}, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['post'], url_path='check')
+    def batch_check(self, request):
+        """ Autoriza uma lista de dispositivos com uma única consulta: {"device_ids": [...]} """
+        device_ids = self.get_device_ids(request)
+        authorized = whitelist.authorized_subset(device_ids)
+        return Response({
+            "authorized": [d for d in device_ids if d in authorized],
+            "blocked": [d for d in device_ids if d not in authorized],
+        })
+
+    @action(detail=False, methods=['get'], url_path='export')
+    def export(self, request):
+        """ Exporta a Whitelist inteira em streaming: ?type=csv (padrão) ou ?type=ndjson """
+        file_type = request.query_params.get('type', 'csv')
+        if file_type not in ('csv', 'ndjson'):
+            return Response({"error": "type deve ser csv ou ndjson"}, status=status.HTTP_400_BAD_REQUEST)
+
+        content_type = 'text/csv' if file_type == 'csv' else 'application/x-ndjson'
+        response = StreamingHttpResponse(whitelist.export_rows(file_type), content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="whitelist.{file_type}"'
+        return response
+
+class DeviceInventoryViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Inventário de dispositivos da frota, mantido na escrita dos logs: todas as
+    consultas leem poucas linhas por índice, sem tocar no USBLog.
+    O detalhe é /devices/<device_id>/ (inclui onde o dispositivo foi visto).
+    """
+    queryset = DeviceInventory.objects.all()
+    serializer_class = DeviceInventorySerializer
+    pagination_class = DeviceInventoryCursorPagination
+    lookup_field = 'device_id'
+    lookup_value_regex = '.+'
+
+    DEFAULT_LIMIT = 20
+    MAX_LIMIT = 500
+
+    @replica_reads()
+    def dispatch(self, request, *args, **kwargs):
+        # Somente leitura: todas as actions podem ler de uma réplica
+        return super().dispatch(request, *args, **kwargs)
+
+    def limit(self):
+        try:
+            limit = int(self.request.query_params.get('limit', self.DEFAULT_LIMIT))
+        except ValueError:
+            raise ValidationError({"limit": "limit deve ser um inteiro"})
+        return max(1, min(limit, self.MAX_LIMIT))
+
+    def sightings(self, queryset):
+        sightings = queryset.select_related('device', 'agent').order_by('-last_seen')[:self.limit()]
+        return Response(DeviceSightingSerializer(sightings, many=True).data)
+
+    def retrieve(self, request, *args, **kwargs):
+        device = self.get_object()
+        data = self.get_serializer(device).data
+        data['sightings'] = DeviceSightingSerializer(
+            device.sightings.select_related('device', 'agent').order_by('-last_seen')[:self.limit()], many=True
+        ).data
+        return Response(data)
+
+    @action(detail=False, methods=['get'], url_path='top-blocked')
+    def top_blocked(self, request):
+        """ Dispositivos mais bloqueados na frota (?limit=N) """
+        devices = self.queryset.filter(blocked_events__gt=0).order_by('-blocked_events', '-last_seen')[:self.limit()]
+        return Response(self.get_serializer(devices, many=True).data)
+
+    @action(detail=False, methods=['get'], url_path=r'by-agent/(?P<agent_id>\d+)')
+    def by_agent(self, request, agent_id=None):
+        """ Dispositivos vistos no agente, mais recentes primeiro """
+        return self.sightings(DeviceSighting.objects.filter(agent_id=agent_id))
+
+    @action(detail=False, methods=['get'], url_path='by-user/(?P<username>.+)')
+    def by_user(self, request, username=None):
+        """ Dispositivos usados pelo usuário em qualquer agente """
+        return self.sightings(DeviceSighting.objects.filter(username=username))
+
+class SearchViewSet(viewsets.ViewSet):
+    """
+    Busca ranqueada em logs, dispositivos, agentes e Whitelist (core/search.py):
+    ?q=<termo> (mínimo de 3 caracteres), ?type=logs,devices,agents,whitelist
+    (padrão: todos) e ?limit=N por tipo. Cada resultado traz 'rank' (0 a 1).
+    """
+    SERIALIZERS = {
+        'logs': USBLogSerializer,
+        'devices': DeviceInventorySerializer,
+        'agents': AgentSerializer,
+        'whitelist': WhitelistedDeviceSerializer,
+    }
+
+    @replica_reads()
+    def list(self, request):
+        term = request.query_params.get('q', '').strip()
+        if len(term) < search.MIN_TERM_LENGTH:
+            return Response({"error": f"q deve ter pelo menos {search.MIN_TERM_LENGTH} caracteres"}, status=status.HTTP_400_BAD_REQUEST)
+
+        kinds = [kind for kind in request.query_params.get('type', '').split(',') if kind] or list(search.SEARCH_FIELDS)
+        unknown = set(kinds) - set(search.SEARCH_FIELDS)
+        if unknown:
+            return Response({"error": f"type inválido: {', '.join(sorted(unknown))}"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = int(request.query_params.get('limit', search.DEFAULT_LIMIT))
+        except ValueError:
+            raise ValidationError({"limit": "limit deve ser um inteiro"})
+        limit = max(1, min(limit, search.MAX_LIMIT))
+
+        results = {}
+        for kind, objects in search.search(term, kinds, limit).items():
+            serialized = self.SERIALIZERS[kind](objects, many=True).data
+            results[kind] = [{**data, "rank": round(obj.search_rank, 3)} for obj, data in zip(objects, serialized)]
+        return Response({"query": term, "results": results})
+
+# --- STREAM EM TEMPO REAL (SSE) ---
+KEEPALIVE_INTERVAL = 15 # segundos; evita que proxies derrubem a conexão ociosa
+
+async def event_stream(request):
+    """
+    Server-Sent Events para o dashboard (requer servidor ASGI).
+    Eventos: 'logs' (lista de novos USBLog), 'stats' (indicadores) e
+    'resync' (o cliente ficou para trás e deve buscar via /logs/?since=).
+    """
+    if not isinstance(request, ASGIRequest):
+        # Sob WSGI o stream prenderia um worker inteiro; o dashboard volta ao polling
+        return JsonResponse({"error": "Stream disponível apenas via ASGI"}, status=501)
+
+    async def stream():
+        queue = broadcaster.subscribe()
+        try:
+            yield "retry: 3000\n\n"
+            yield format_sse('stats', await sync_to_async(get_dashboard_stats)())
+            while True:
+                try:
+                    yield await asyncio.wait_for(queue.get(), timeout=KEEPALIVE_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+        finally:
+            broadcaster.unsubscribe(queue)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no' # Desliga o buffer do nginx
+    return response
@@ -0,0 +1,112 @@
+"""
+Operações em lote da Whitelist: importação, revogação, consulta e exportação.
+Tudo processado em blocos de BATCH_SIZE para que milhares de dispositivos
+custem poucas consultas e memória constante.
+"""
+import csv
+import json
+from itertools import islice
+from django.db import transaction
+from device_identity import RuleMatcher, candidate_rules, normalize_rule
+from .exports import CHUNK_SIZE, stream_csv, stream_ndjson
+from .models import WhitelistedDevice, WhitelistChange
+from .signals import journal_suspended
+from .verdicts import verdicts
+
+BATCH_SIZE = 1000
+EXPORT_FIELDS = ['device_id', 'device_name', 'description']
+
+def chunked(iterable, size=BATCH_SIZE):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+def decoded_lines(binary):
+    """ Decodifica linha a linha: um byte inválido aponta a linha exata """
+    for number, raw in enumerate(binary, 1):
+        try:
+            yield raw.decode('utf-8-sig' if number == 1 else 'utf-8')
+        except UnicodeDecodeError as e:
+            raise ValueError(f"linha {number}: {e}")
+
+def parse_upload(upload):
+    """
+    Lê o arquivo enviado linha a linha (sem carregar tudo em memória):
+    .csv com cabeçalho device_id,device_name,description ou NDJSON (um objeto por linha).
+    Um erro de leitura vira ValueError com o número da linha.
+    """
+    lines = decoded_lines(upload.file)
+    if upload.name.lower().endswith('.csv'):
+        reader = csv.DictReader(lines)
+        try:
+            yield from reader
+        except csv.Error as e:
+            raise ValueError(f"linha {reader.line_num}: {e}")
+        return
+    for number, line in enumerate(lines, 1):
+        if line.strip():
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                raise ValueError(f"linha {number}: {e}")
+            yield row
+
+def import_devices(rows):
+    """
+    Insere os dispositivos novos com bulk_create(ignore_conflicts=True); retorna as contagens.
+    Tudo ou nada: os blocos vão para o banco conforme o arquivo é lido, mas em uma
+    única transação, então um erro no meio do arquivo não deixa metade importada.
+    """
+    received = created = invalid = 0
+    with transaction.atomic():
+        for chunk in chunked(rows):
+            devices = {}
+            for row in chunk:
+                received += 1
+                device_id = normalize_rule(row.get('device_id') or '') if isinstance(row, dict) else ''
+                if not device_id or len(device_id) > 255:
+                    invalid += 1
+                    continue
+                devices[device_id] = WhitelistedDevice(
+                    device_id=device_id,
+                    device_name=row.get('device_name') or None,
+                    description=row.get('description') or None,
+                )
+
+            existing = set(WhitelistedDevice.objects.filter(device_id__in=devices).values_list('device_id', flat=True))
+            new_ids = [d for d in devices if d not in existing]
+            WhitelistedDevice.objects.bulk_create([devices[d] for d in new_ids], ignore_conflicts=True)
+            WhitelistChange.objects.bulk_create(WhitelistChange(device_id=d, op='ADD') for d in new_ids)
+            if new_ids:
+                # bulk_create não dispara post_save: o cache do check_auth é avisado aqui
+                verdicts.rules_changed(added=new_ids)
+                transaction.on_commit(lambda ids=new_ids: verdicts.rules_changed(added=ids))
+            created += len(new_ids)
+    return {"received": received, "created": created, "invalid": invalid}
+
+def revoke_devices(device_ids):
+    """ Remove vários dispositivos (um DELETE por bloco) e registra as remoções no diário """
+    revoked = 0
+    for chunk in chunked(normalize_rule(d) for d in device_ids):
+        with transaction.atomic(), journal_suspended():
+            existing = list(WhitelistedDevice.objects.filter(device_id__in=chunk).values_list('device_id', flat=True))
+            WhitelistedDevice.objects.filter(device_id__in=existing).delete()
+            WhitelistChange.objects.bulk_create(WhitelistChange(device_id=d, op='REMOVE') for d in existing)
+        revoked += len(existing)
+    return revoked
+
+def authorized_subset(device_ids):
+    """
+    Quais dos IDs informados são autorizados: uma consulta indexada traz só as
+    regras candidatas (exatas e com curinga) e o RuleMatcher decide cada ID.
+    """
+    candidates = {rule for device_id in device_ids for rule in candidate_rules(device_id)}
+    matcher = RuleMatcher(WhitelistedDevice.objects.filter(device_id__in=candidates).values_list('device_id', flat=True))
+    return {device_id for device_id in device_ids if matcher.match(device_id)}
+
+def export_rows(file_type):
+    """ Gera o export em CSV ou NDJSON com cursor no servidor (memória constante) """
+    rows = WhitelistedDevice.objects.order_by('id').values_list(*EXPORT_FIELDS).iterator(chunk_size=CHUNK_SIZE)
+    if file_type == 'ndjson':
+        return stream_ndjson(EXPORT_FIELDS, rows)
+    return stream_csv(EXPORT_FIELDS, rows)
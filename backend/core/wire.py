@@ -0,0 +1,149 @@
+"""
+Formatos compactos do tráfego agente <-> servidor.
+
+- MessagePack (application/msgpack) como alternativa ao JSON, negociado pelo
+  DRF via Accept (respostas) e Content-Type (requisições);
+- compressão zstd ou gzip do corpo, nos dois sentidos: Content-Encoding nas
+  requisições (RequestDecompressionMiddleware) e Accept-Encoding nas
+  respostas (ZstdMiddleware; o gzip fica com o GZipMiddleware do Django).
+
+msgpack e zstandard são opcionais: sem eles a API segue falando JSON/gzip
+e o agente detecta isso (415) e volta ao JSON.
+"""
+import gzip
+import zlib
+from rest_framework.exceptions import ParseError
+from rest_framework.negotiation import DefaultContentNegotiation
+from rest_framework.parsers import BaseParser
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+try:
+    import msgpack # Opcional: formato binário da API
+except ImportError:
+    msgpack = None
+try:
+    import zstandard # Opcional: compressão zstd
+except ImportError:
+    zstandard = None
+
+MSGPACK_MEDIA_TYPE = 'application/msgpack'
+ZSTD_LEVEL = 3 # nível padrão do zstd: comprime melhor que o gzip -6 gastando menos CPU
+GZIP_LEVEL = 6
+
+_encoder = JSONEncoder() # datetime, Decimal, UUID... viram os mesmos textos do JSON
+
+def packb(data):
+    return msgpack.packb(data, default=_encoder.default)
+
+def unpackb(data):
+    return msgpack.unpackb(data, raw=False)
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = MSGPACK_MEDIA_TYPE
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return packb(data)
+
+class MessagePackParser(BaseParser):
+    media_type = MSGPACK_MEDIA_TYPE
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return unpackb(stream.read())
+        except (ValueError, msgpack.UnpackException) as exc:
+            raise ParseError(f"MessagePack inválido: {exc}")
+
+def prefers_msgpack(accepts):
+    """ MessagePack é o tipo de maior q no Accept (no empate vale o que vem primeiro) """
+    best_type, best_q = None, -1.0
+    for token in accepts:
+        media_type, *params = token.split(';')
+        q = 1.0
+        for param in params:
+            key, _, value = param.partition('=')
+            if key.strip() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if q > best_q:
+            best_type, best_q = media_type.strip(), q
+    return best_type == MSGPACK_MEDIA_TYPE
+
+class MessagePackNegotiation(DefaultContentNegotiation):
+    """
+    A negociação padrão do DRF ignora o q do Accept e, entre tipos igualmente
+    específicos, fica com o primeiro renderer da lista (JSON). Quem prefere
+    MessagePack no Accept (o agente) recebe MessagePack; navegador, Dashboard
+    e curl seguem recebendo o mesmo de antes.
+    """
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        explicit_format = format_suffix or request.query_params.get(self.settings.URL_FORMAT_OVERRIDE)
+        if not explicit_format and prefers_msgpack(self.get_accept_list(request)):
+            for renderer in renderers:
+                if renderer.media_type == MSGPACK_MEDIA_TYPE:
+                    return renderer, MSGPACK_MEDIA_TYPE
+        return super().select_renderer(request, renderers, format_suffix)
+
+# --- COMPRESSÃO ---
+class BodyTooLarge(ValueError):
+    pass
+
+def encodings():
+    """ Content-Encodings aceitos nas requisições, do preferido ao mais simples """
+    return ('zstd', 'gzip') if zstandard is not None else ('gzip',)
+
+def compress(data, encoding):
+    if encoding == 'zstd':
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+def compress_stream(chunks):
+    """ zstd em streaming: cada pedaço sai em um bloco próprio, sem esperar o fim da resposta """
+    compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+    for chunk in chunks:
+        data = compressor.compress(chunk) + compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def decompress(data, encoding, limit=None):
+    """
+    Descomprime um corpo de requisição. Com 'limit' não passa desse tamanho
+    (BodyTooLarge): um corpo pequeno não vira gigabytes em memória.
+    Corpo corrompido ou truncado levanta ValueError.
+    """
+    if encoding == 'zstd':
+        try:
+            if limit is None:
+                decompressor = zstandard.ZstdDecompressor().decompressobj()
+                body = decompressor.decompress(data)
+                if not decompressor.eof:
+                    raise ValueError("zstd inválido: corpo truncado")
+                return body
+            if zstandard.frame_content_size(data) > limit:
+                raise BodyTooLarge(f"Corpo descomprimido maior que {limit} bytes")
+            # Tamanho ausente no cabeçalho (compressão em streaming): a saída para em limit + 1
+            body = zstandard.ZstdDecompressor().decompress(data, max_output_size=limit + 1)
+        except zstandard.ZstdError as exc:
+            raise ValueError(f"zstd inválido: {exc}")
+        if len(body) > limit:
+            raise BodyTooLarge(f"Corpo descomprimido maior que {limit} bytes")
+        return body
+
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS) # cabeçalho gzip
+    try:
+        body = decompressor.decompress(data, 0 if limit is None else limit + 1)
+    except zlib.error as exc:
+        raise ValueError(f"gzip inválido: {exc}")
+    if limit is not None and len(body) > limit:
+        raise BodyTooLarge(f"Corpo descomprimido maior que {limit} bytes")
+    if not decompressor.eof:
+        raise ValueError("gzip inválido: corpo truncado")
+    return body
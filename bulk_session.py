@@ -0,0 +1,19 @@
+"""
+Sessão do agente nos lotes de /logs/bulk/.
+
+Módulo em Python puro, na raiz do repositório como o device_identity.py: o
+agente (monitor.py) monta os lotes da outbox com ele e o benchmark do servidor
+o usa para medir exatamente o mesmo formato. O servidor faz o caminho inverso
+em bulk_ingest: cada evento recebe os campos de "session" que não trouxer.
+"""
+
+# Campos da sessão do agente: enviados uma vez por lote quando iguais em todos os eventos
+SESSION_FIELDS = ('agent', 'username', 'ip_address')
+
+def hoist_session(events):
+    """ Lote para /logs/bulk/: campos da sessão iguais em todos os eventos vão uma vez só em "session" """
+    session = {
+        field: events[0][field] for field in SESSION_FIELDS
+        if field in events[0] and all(event.get(field) == events[0][field] for event in events)
+    }
+    return {"session": session, "events": [{k: v for k, v in event.items() if k not in session} for event in events]}
@@ -0,0 +1,131 @@
+"""
+Identidade normalizada de dispositivos USB e casamento de regras da Whitelist.
+
+Módulo em Python puro (sem Django), na raiz do repositório: o agente o
+distribui ao lado do monitor.py e o servidor o importa pelo mesmo caminho,
+para que os dois decidam exatamente da mesma forma.
+
+Identidade canônica: "VENDOR:PRODUCT:SERIAL" em maiúsculas, ex.
+"0951:1666:60A44C413A8CF1A0B9A1234E". Regras usam o mesmo formato e aceitam
+"*" em qualquer posição ("0951:1666:*" = qualquer unidade desse modelo,
+"0951:*:*" = qualquer produto do fabricante). Regras em outro formato (IDs
+antigos como "\\\\.\\PHYSICALDRIVE1") continuam valendo por igualdade exata.
+"""
+import re
+from collections import namedtuple
+from itertools import product as cartesian
+
+WILDCARD = '*'
+
+DeviceIdentity = namedtuple('DeviceIdentity', ['vendor', 'product', 'serial'])
+
+# USB\VID_0951&PID_1666\60A44C413A8CF1A0B9A1234E
+USB_ID_RE = re.compile(r'^USB\\VID_([0-9A-F]{4})&PID_([0-9A-F]{4})(?:&[^\\]*)?\\(.+)$', re.IGNORECASE)
+# USBSTOR\DISK&VEN_KINGSTON&PROD_DATATRAVELER_3.0&REV_PMAP\60A44C413A8CF1A0B9A1234E&0
+USBSTOR_ID_RE = re.compile(r'^USBSTOR\\[^&\\]+&VEN_([^&\\]*)&PROD_([^&\\]*)(?:&REV_[^\\]*)?\\(.+)$', re.IGNORECASE)
+RULE_RE = re.compile(r'^([^:\\]+):([^:\\]+):([^:\\]+)$')
+
+def usbstor_serial(instance_id):
+    """ O USBSTOR acrescenta '&<LUN>' ao serial do dispositivo USB pai """
+    return re.sub(r'&\d+$', '', instance_id)
+
+def parse_pnp_device_id(pnp_device_id):
+    """ Extrai (vendor, product, serial) de um PNPDeviceID do Windows; None se não reconhecido """
+    if not pnp_device_id:
+        return None
+    match = USB_ID_RE.match(pnp_device_id)
+    if match:
+        vendor, product, serial = match.groups()
+    else:
+        match = USBSTOR_ID_RE.match(pnp_device_id)
+        if not match:
+            return None
+        vendor, product, serial = match.groups()
+        serial = usbstor_serial(serial)
+    return DeviceIdentity(vendor.strip('_').upper(), product.strip('_').upper(), serial.upper())
+
+def canonical(identity):
+    return ':'.join(identity)
+
+def parse_identity(value):
+    """ Converte "V:P:S" em DeviceIdentity (sem curingas); None para IDs em outro formato """
+    match = RULE_RE.match(value.strip().upper()) if value else None
+    if not match or WILDCARD in match.groups():
+        return None
+    return DeviceIdentity(*match.groups())
+
+def parse_rule(rule):
+    """ Regra -> (máscara, chave) para padrões "V:P:S"; None para regras de ID exato (legadas) """
+    match = RULE_RE.match(rule.strip().upper())
+    if not match:
+        return None
+    parts = match.groups()
+    mask = tuple(part != WILDCARD for part in parts)
+    key = tuple(part for part in parts if part != WILDCARD)
+    return mask, key
+
+def normalize_rule(rule):
+    """ Padrões "V:P:S" são gravados em maiúsculas; IDs exatos ficam como vieram """
+    rule = rule.strip()
+    return rule.upper() if parse_rule(rule) else rule
+
+# As 8 combinações de posições fixas/curinga, da mais para a menos específica
+MASKS = sorted(cartesian((True, False), repeat=3), key=lambda mask: -sum(mask))
+
+def candidate_rules(device_id):
+    """
+    Todas as regras que casariam com o dispositivo: o ID bruto mais as 8
+    variações com curinga da identidade. Permite resolver no banco com um
+    único "device_id IN (...)" indexado.
+    """
+    candidates = [device_id]
+    identity = parse_identity(device_id)
+    if identity:
+        for mask in MASKS:
+            candidates.append(':'.join(part if fixed else WILDCARD for part, fixed in zip(identity, mask)))
+    return list(dict.fromkeys(candidates))
+
+class RuleMatcher:
+    """
+    Regras compiladas em um mapa hash por nível de especificidade (máscara).
+    Avaliar um dispositivo custa no máximo 9 buscas em dicionário,
+    independente de haver 10 ou 100 mil regras.
+    """
+
+    def __init__(self, rules=()):
+        self.exact = set()
+        self.levels = {mask: set() for mask in MASKS}
+        for rule in rules:
+            self.add(rule)
+
+    def __len__(self):
+        return len(self.exact) + sum(len(keys) for keys in self.levels.values())
+
+    def add(self, rule):
+        compiled = parse_rule(rule)
+        if compiled is None:
+            self.exact.add(rule)
+        else:
+            mask, key = compiled
+            self.levels[mask].add(key)
+
+    def remove(self, rule):
+        compiled = parse_rule(rule)
+        if compiled is None:
+            self.exact.discard(rule)
+        else:
+            mask, key = compiled
+            self.levels[mask].discard(key)
+
+    def match(self, device_id):
+        """ Regra que autoriza o dispositivo (a mais específica) ou None """
+        if device_id in self.exact:
+            return device_id
+        identity = parse_identity(device_id)
+        if identity is None:
+            return None
+        for mask in MASKS:
+            key = tuple(part for part, fixed in zip(identity, mask) if fixed)
+            if key in self.levels[mask]:
+                return ':'.join(part if fixed else WILDCARD for part, fixed in zip(identity, mask))
+        return None
@@ -1,4 +1,4 @@
-import { useEffect, useState } from 'react';
+import { useEffect, useRef, useState } from 'react';
 import axios from 'axios';
 import { Toaster, toast } from 'react-hot-toast'; 
 import { 
@@ -37,6 +37,13 @@ interface Stats {
   authorized_events: number; // Substituindo integridade por Whitelist
 }
 
+// Rótulos das ações registradas pelo agente (conforme a política aplicada)
+const ACTION_LABELS: Record<string, string> = {
+  BLOCKED: 'BLOQUEADO',
+  AUTHORIZED: 'AUTORIZADO',
+  READ_ONLY: 'SOMENTE LEITURA',
+};
+
 function App() {
   const [activeTab, setActiveTab] = useState<'dashboard' | 'auditoria' | 'dispositivos' | 'logs'>('dashboard');
   const [logs, setLogs] = useState<USBLog[]>([]);
@@ -45,19 +52,53 @@ function App() {
   
   const API_URL = 'http://127.0.0.1:8000/api'; 
 
+  const MAX_LOGS = 500; // Limite de registros mantidos em memória no navegador
+  const lastLogId = useRef<number | null>(null);
+  const seenLogIds = useRef<Set<number>>(new Set()); // O "since" reenvia uma janela de logs já vistos
+
+  const alertBlocked = (log: USBLog) => {
+    // Alerta sonoro/visual para novos bloqueios detectados
+    toast.error(`BLOQUEIO CRÍTICO: ${log.device_name}`, {
+      duration: 6000,
+      style: { background: '#0a0a0f', color: '#ef4444', border: '1px solid #ef444433' },
+      icon: <ShieldAlert size={20} className="text-red-500 animate-pulse" />
+    });
+  };
+
+  const rememberLogs = (page: USBLog[]) => {
+    page.forEach(log => seenLogIds.current.add(log.id));
+    if (seenLogIds.current.size > MAX_LOGS * 4) {
+      // Mantém só os mais recentes (o Set preserva a ordem de inserção)
+      seenLogIds.current = new Set([...seenLogIds.current].slice(-MAX_LOGS * 2));
+    }
+  };
+
+  // Insere logs novos no topo sem duplicar os que já chegaram por outro caminho (SSE ou polling)
+  const mergeLogs = (fresh: USBLog[]) => {
+    const unseen = fresh.filter(log => !seenLogIds.current.has(log.id));
+    if (unseen.length === 0) return;
+    const blocked = unseen.find(log => log.action_taken === 'BLOCKED');
+    if (blocked) alertBlocked(blocked);
+    rememberLogs(unseen);
+    const ids = new Set(unseen.map(log => log.id));
+    setLogs(prev => [...unseen, ...prev.filter(log => !ids.has(log.id))].slice(0, MAX_LOGS));
+  };
+
   const fetchData = async () => {
     try {
-      const logsRes = await axios.get(`${API_URL}/logs/`);
-      if (logsRes.data) {
-        // Alerta sonoro/visual para novos bloqueios detectados
-        if (logs.length > 0 && logsRes.data.length > logs.length && logsRes.data[0].action_taken === 'BLOCKED') {
-          toast.error(`BLOQUEIO CRÍTICO: ${logsRes.data[0].device_name}`, {
-            duration: 6000,
-            style: { background: '#0a0a0f', color: '#ef4444', border: '1px solid #ef444433' },
-            icon: <ShieldAlert size={20} className="text-red-500 animate-pulse" />
-          });
-        }
-        setLogs(logsRes.data);
+      if (lastLogId.current === null) {
+        // Primeira carga: página mais recente (paginação por cursor)
+        const logsRes = await axios.get(`${API_URL}/logs/`);
+        const page: USBLog[] = logsRes.data.results;
+        lastLogId.current = page.reduce((max, log) => Math.max(max, log.id), 0);
+        rememberLogs(page);
+        setLogs(page);
+      } else {
+        // Depois: os logs gravados desde o último id recebido (mais a janela de sobreposição)
+        const logsRes = await axios.get(`${API_URL}/logs/`, { params: { since: lastLogId.current } });
+        const fresh: USBLog[] = logsRes.data.results;
+        lastLogId.current = Math.max(lastLogId.current ?? 0, logsRes.data.since);
+        if (fresh.length > 0) mergeLogs(fresh);
       }
       const statsRes = await axios.get(`${API_URL}/agents/dashboard_stats/`);
       setStats(statsRes.data);
@@ -68,9 +109,31 @@ function App() {
 
   useEffect(() => {
     fetchData();
-    const interval = setInterval(fetchData, 5000); 
-    return () => clearInterval(interval);
-  }, [logs.length]);
+
+    // Push em tempo real (SSE); se o servidor não suportar, volta ao polling de 5s
+    let interval: ReturnType<typeof setInterval> | null = null;
+    const source = new EventSource(`${API_URL}/stream/`);
+
+    source.addEventListener('logs', (e) => {
+      // lastLogId só avança via REST: numa ressincronização o "since" cobre qualquer lacuna do push
+      const fresh: USBLog[] = JSON.parse((e as MessageEvent).data);
+      mergeLogs(fresh.slice().reverse());
+    });
+    source.addEventListener('stats', (e) => setStats(JSON.parse((e as MessageEvent).data)));
+    // Ficamos para trás (ou reconectamos): busca o que faltou desde o último id
+    source.addEventListener('resync', () => fetchData());
+    source.onopen = () => { if (lastLogId.current !== null) fetchData(); };
+    source.onerror = () => {
+      if (source.readyState === EventSource.CLOSED && interval === null) {
+        interval = setInterval(fetchData, 5000);
+      }
+    };
+
+    return () => {
+      source.close();
+      if (interval !== null) clearInterval(interval);
+    };
+  }, []);
 
   const filteredLogs = logs.filter(log => 
     log.agent_hostname?.toLowerCase().includes(searchTerm.toLowerCase()) ||
@@ -234,7 +297,7 @@ function App() {
                     </div>
                     <div className="text-right">
                       <p className="text-[10px] font-mono font-bold text-slate-400 tracking-tighter leading-none">{new Date(log.timestamp).toLocaleTimeString()}</p>
-                      <span className={`text-[8px] font-black uppercase tracking-widest mt-1.5 block ${log.action_taken === 'BLOCKED' ? 'text-red-400' : 'text-emerald-400'}`}>{log.action_taken === 'BLOCKED' ? 'BLOQUEADO' : 'AUTORIZADO'}</span>
+                      <span className={`text-[8px] font-black uppercase tracking-widest mt-1.5 block ${log.action_taken === 'BLOCKED' ? 'text-red-400' : 'text-emerald-400'}`}>{ACTION_LABELS[log.action_taken] ?? log.action_taken}</span>
                     </div>
                   </div>
                 ))}
@@ -288,7 +351,7 @@ function App() {
                           <span className={`px-5 py-2.5 rounded-2xl text-[9px] font-black uppercase border shadow-2xl ${
                             log.action_taken === 'BLOCKED' ? 'text-red-500 border-red-500/20 bg-red-500/10' : 'text-emerald-500 border-emerald-500/20 bg-emerald-500/10'
                           }`}>
-                            {log.action_taken === 'BLOCKED' ? 'BLOQUEADO' : 'AUTORIZADO'}
+                            {ACTION_LABELS[log.action_taken] ?? log.action_taken}
                           </span>
                         </td>
                       </tr>
@@ -374,7 +437,7 @@ function DeviceCard({ log }: { log: USBLog }) {
       </div>
       <h4 className="text-xl font-black italic uppercase tracking-tight truncate leading-none mb-1 text-white">{log.device_name}</h4>
       <span className={`text-[10px] font-black uppercase px-3 py-1 rounded-lg border tracking-tighter ${isBlocked ? 'text-red-400 border-red-500/30 bg-red-900/20' : 'text-emerald-400 border-emerald-500/30 bg-emerald-900/20'}`}>
-        {isBlocked ? 'BLOQUEADO' : 'AUTORIZADO'}
+        {ACTION_LABELS[log.action_taken] ?? log.action_taken}
       </span>
       
       <div className="mt-8 space-y-3 pt-6 border-t border-slate-800">
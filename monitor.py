@@ -1,20 +1,569 @@
 import os
+import sys
+import bisect
+import gzip
+import json
+import logging
+import queue
+import random
+import re
 import subprocess
+import threading
 import time
 import requests
-import wmi
-import urllib.parse
+from requests.adapters import HTTPAdapter
+from urllib3.response import HTTPResponse
+try:
+    import wmi # Fonte de eventos no Windows
+except ImportError:
+    wmi = None
+try:
+    import pyudev # Fonte de eventos no Linux
+except ImportError:
+    pyudev = None
+try:
+    import psutil # Opcional: permite achar o MAC exato da interface de saída
+except ImportError:
+    psutil = None
+try:
+    import msgpack # Opcional: lotes e respostas em MessagePack em vez de JSON
+except ImportError:
+    msgpack = None
+try:
+    import zstandard # Opcional: comprime os lotes com zstd em vez de gzip
+except ImportError:
+    zstandard = None
 import socket
+import sqlite3
 import getpass
-from datetime import datetime
+import uuid
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Identidade de dispositivo e casamento de regras compartilhados com o servidor (device_identity.py, ao lado deste arquivo)
+from device_identity import DeviceIdentity, RuleMatcher, canonical, parse_pnp_device_id
+# Formato dos lotes da outbox, o mesmo medido pelo benchmark do servidor
+from bulk_session import hoist_session
 
 # --- CONFIGURAÇÕES ---
 API_URL = "http://localhost:8000/api"
 HOSTNAME = os.environ.get('COMPUTERNAME', socket.gethostname())
 USERNAME = getpass.getuser()
 AGENT_ID = None
+API_TIMEOUT = 5 # segundos por tentativa
+API_MAX_RETRIES = 3 # tentativas extras em falha de rede / 429 / 5xx
+API_BACKOFF_BASE = 0.5 # segundos; dobra a cada tentativa
+API_BACKOFF_CAP = 30 # teto do backoff, evita esperas absurdas
+API_RETRY_STATUS = {429, 502, 503, 504}
+API_COMPRESS_MIN_BYTES = 512 # corpos menores vão sem compressão
+MSGPACK_MEDIA_TYPE = 'application/msgpack'
+NETWORK_IDENTITY_TTL = 60 # segundos até reconferir IP/MAC da interface de saída
+DATA_DIR = os.environ.get('SENTINEL_DATA_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sentinel_data'))
+WHITELIST_SYNC_INTERVAL = 30 # segundos entre consultas de delta da Whitelist
+WHITELIST_FULL_SYNC_INTERVAL = 3600 # segundos entre snapshots completos (corrige qualquer desvio do delta)
+WHITELIST = None
+DEFAULT_POLICY = "BLOCK_ALL" # Usada até a primeira resposta do servidor
+ENGINE = None
+OUTBOX_BATCH_SIZE = 100 # eventos por requisição ao endpoint de ingestão em lote
+OUTBOX_LINGER = 0.5 # segundos aguardando mais eventos da mesma rajada antes de enviar
+OUTBOX_RETRY_INTERVAL = 10 # segundos entre tentativas enquanto o servidor está fora
+OUTBOX = None
+HEARTBEAT_INTERVAL = 30 # segundos entre sinais de vida para o Dashboard
+PIPELINE_WORKERS = 4 # dispositivos processados em paralelo
+EJECT_BACKEND = os.environ.get('SENTINEL_EJECT_BACKEND', 'powershell' if os.name == 'nt' else 'fake')
+EJECT_TIMEOUT = 10 # segundos máximos por lote de ejeção
+EJECT_CONFIRM_TIMEOUT = 3 # segundos aguardando a unidade sumir depois do Eject
+EJECT_POOL_SIZE = 2 # processos PowerShell: uma proteção lenta não segura as ejeções
+EJECTOR = None
+DEBOUNCE_WINDOW = 2 # segundos em que um mesmo dispositivo é considerado duplicado
+WATCHER_BACKEND = os.environ.get('SENTINEL_WATCHER_BACKEND', 'wmi' if os.name == 'nt' else 'udev')
+WATCHER_OPTIONS = os.environ.get('SENTINEL_WATCHER_OPTIONS', '') # ex.: "rate=50,burst_size=200,seed=7"
+LOG_LEVEL = os.environ.get('SENTINEL_LOG_LEVEL', 'INFO') # DEBUG, INFO, WARNING, ERROR ou OFF
+LOG_FORMAT = os.environ.get('SENTINEL_LOG_FORMAT', 'text') # 'text' ou 'json' (uma linha por registro)
+METRICS_PORT = int(os.environ['SENTINEL_METRICS_PORT']) if os.environ.get('SENTINEL_METRICS_PORT') else None # /metrics local
+METRICS_SUMMARY_INTERVAL = 300 # segundos entre resumos de métricas enviados ao servidor
 
-def get_real_ip():
+def jittered(interval):
+    """ Espalha tarefas periódicas em +/-20% para a frota não sincronizar em bloco """
+    return interval * random.uniform(0.8, 1.2)
+
+# --- LOGS ESTRUTURADOS ---
+log = logging.getLogger("usb_sentinel.agent")
+
+def kv(**fields):
+    """ Campos estruturados de um registro: log.info("mensagem", extra=kv(device=...)) """
+    return {"fields": fields}
+
+class TextFormatter(logging.Formatter):
+    """ Linha legível com os campos no fim em chave=valor """
+
+    def format(self, record):
+        line = super().format(record)
+        fields = getattr(record, 'fields', None)
+        if fields:
+            line += " | " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+class JsonFormatter(logging.Formatter):
+    """ Um objeto JSON por linha, pronto para coletores de log """
+
+    def format(self, record):
+        data = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "msg": record.getMessage(),
+            **getattr(record, 'fields', {}),
+        }
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+def setup_logging(level=LOG_LEVEL, fmt=LOG_FORMAT):
+    handler = logging.StreamHandler()
+    handler.setFormatter(JsonFormatter() if fmt == 'json' else TextFormatter("%(asctime)s %(levelname)-7s %(message)s"))
+    log.handlers[:] = [handler]
+    log.propagate = False
+    # OFF silencia tudo (ex.: estações de produção); o /metrics continua disponível
+    log.setLevel(logging.CRITICAL + 1 if level.upper() == 'OFF' else level.upper())
+
+# --- MÉTRICAS ---
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10) # segundos
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # Último = +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, counts, fraction):
+        """ Limite superior do bucket que contém o quantil (None se caiu no +Inf) """
+        total = sum(counts)
+        if not total:
+            return None
+        running = 0
+        for bound, amount in zip(self.buckets, counts):
+            running += amount
+            if running >= total * fraction:
+                return bound
+        return None
+
+class Metrics:
+    """
+    Métricas do agente: histogramas de latência por estágio do pipeline
+    (detect, queue, decide, eject, protect, report, upload, total), contadores
+    (erros, retentativas, eventos) e gauges lidos na hora (profundidade da outbox).
+    Expostas no formato texto do Prometheus e resumidas por janela para o servidor.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self._previous = ({}, {}) # Últimos valores enviados no resumo (para calcular o delta)
+        self._previous_at = time.monotonic()
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timer(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def gauge(self, name, read):
+        self.gauges[name] = read
+
+    @staticmethod
+    def labels(pairs):
+        return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}" if pairs else ""
+
+    def render(self):
+        """ Formato de exposição texto do Prometheus """
+        lines = []
+        with self._lock:
+            histograms = {stage: (h.buckets, list(h.counts), h.sum, h.count) for stage, h in self.histograms.items()}
+            counters = dict(self.counters)
+        if histograms:
+            lines += ["# HELP sentinel_stage_seconds Latência de cada estágio do pipeline de inserção",
+                      "# TYPE sentinel_stage_seconds histogram"]
+        for stage, (buckets, counts, total, count) in sorted(histograms.items()):
+            running = 0
+            for bound, amount in zip(buckets + ('+Inf',), counts):
+                running += amount
+                lines.append(f'sentinel_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {running}')
+            lines.append(f'sentinel_stage_seconds_sum{{stage="{stage}"}} {total}')
+            lines.append(f'sentinel_stage_seconds_count{{stage="{stage}"}} {count}')
+        for name in sorted({name for name, _ in counters}):
+            lines.append(f"# TYPE sentinel_{name} counter")
+            for (counter, pairs), value in sorted(counters.items()):
+                if counter == name:
+                    lines.append(f"sentinel_{name}{self.labels(pairs)} {value}")
+        for name, read in sorted(self.gauges.items()):
+            try:
+                value = read()
+            except Exception:
+                continue
+            lines += [f"# TYPE sentinel_{name} gauge", f"sentinel_{name} {value}"]
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """ Resumo da janela desde o último resumo: contagem e p50/p99/média por estágio, deltas dos contadores """
+        with self._lock:
+            histograms = {stage: (h, list(h.counts), h.sum) for stage, h in self.histograms.items()}
+            counters = dict(self.counters)
+            previous_histograms, previous_counters = self._previous
+            self._previous = ({stage: (counts, total) for stage, (_, counts, total) in histograms.items()}, counters)
+            now = time.monotonic()
+            window, self._previous_at = now - self._previous_at, now
+
+        stages = {}
+        for stage, (histogram, counts, total) in histograms.items():
+            old_counts, old_total = previous_histograms.get(stage, ([0] * len(counts), 0.0))
+            delta = [a - b for a, b in zip(counts, old_counts)]
+            count = sum(delta)
+            if not count:
+                continue
+            p50, p99 = histogram.quantile(delta, 0.50), histogram.quantile(delta, 0.99)
+            stages[stage] = {
+                "count": count,
+                "mean_ms": round((total - old_total) / count * 1000, 3),
+                "p50_ms": p50 * 1000 if p50 is not None else None,
+                "p99_ms": p99 * 1000 if p99 is not None else None,
+            }
+        deltas = {}
+        for (name, pairs), value in counters.items():
+            delta = value - previous_counters.get((name, pairs), 0)
+            if delta:
+                deltas[name + self.labels(pairs)] = delta
+        gauges = {}
+        for name, read in self.gauges.items():
+            try:
+                gauges[name] = read()
+            except Exception:
+                pass
+        return {"window_seconds": round(window, 1), "stages": stages, "counters": deltas, "gauges": gauges}
+
+METRICS = Metrics()
+
+def start_metrics_server(port=METRICS_PORT):
+    """ Endpoint local (somente 127.0.0.1) para scrape do Prometheus: GET /metrics """
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != '/metrics':
+                self.send_error(404)
+                return
+            body = METRICS.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass # Scrapes não poluem o log do agente
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    log.info("📊 Métricas disponíveis", extra=kv(url=f"http://127.0.0.1:{server.server_port}/metrics"))
+    return server
+
+def start_metrics_reporter(interval=METRICS_SUMMARY_INTERVAL):
+    """ Envia periodicamente o resumo da janela ao servidor (perdido se o servidor estiver fora) """
+    def loop():
+        while True:
+            time.sleep(jittered(interval))
+            summary = METRICS.summary()
+            log.debug("📊 Resumo de métricas", extra=kv(**summary))
+            try:
+                API.post("/agents/metrics/", json={"agent": AGENT_ID, **summary}, retries=0)
+            except Exception:
+                METRICS.inc('errors_total', stage='metrics')
+    threading.Thread(target=loop, name="metrics-reporter", daemon=True).start()
+
+class ApiClient:
+    """
+    Cliente HTTP único do agente: uma Session com pool de conexões e keep-alive
+    (sem novo handshake TCP por chamada), respostas comprimidas e retentativas limitadas
+    com backoff exponencial e jitter completo. Depois de um restart do servidor,
+    cada agente volta em um instante aleatório em vez de todos ao mesmo tempo.
+    Com msgpack/zstandard instalados, send() manda os corpos em MessagePack
+    comprimido e as respostas vêm em MessagePack; se o servidor recusar (415),
+    o cliente desce para gzip e depois para JSON.
+    """
+
+    def __init__(self, base_url, max_retries=API_MAX_RETRIES):
+        self.base_url = base_url
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=4, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.body_format = 'msgpack' if msgpack is not None else 'json'
+        self.body_encoding = 'zstd' if zstandard is not None else 'gzip'
+        # zstd nas respostas só se o urllib3 souber descomprimir
+        decoders = getattr(HTTPResponse, 'CONTENT_DECODERS', [])
+        self.session.headers.update({
+            "Accept-Encoding": "zstd, gzip, deflate" if 'zstd' in decoders else "gzip, deflate",
+            "User-Agent": f"usb-sentinel-agent ({HOSTNAME})",
+        })
+        if msgpack is not None:
+            self.session.headers["Accept"] = f"{MSGPACK_MEDIA_TYPE}, application/json;q=0.9"
+
+    def backoff(self, attempt):
+        return random.uniform(0, min(API_BACKOFF_CAP, API_BACKOFF_BASE * (2 ** attempt)))
+
+    def request(self, method, path, retries=None, **kwargs):
+        kwargs.setdefault('timeout', API_TIMEOUT)
+        retries = self.max_retries if retries is None else retries
+        url = f"{self.base_url}{path}"
+
+        for attempt in range(retries + 1):
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == retries:
+                    raise
+                METRICS.inc('api_retries_total', reason='network')
+                time.sleep(self.backoff(attempt))
+                continue
+
+            if response.status_code not in API_RETRY_STATUS or attempt == retries:
+                return response
+            METRICS.inc('api_retries_total', reason=str(response.status_code))
+
+            # Respeita o Retry-After do servidor quando informado (em segundos)
+            delay = self.backoff(attempt)
+            try:
+                delay = max(delay, min(API_BACKOFF_CAP, float(response.headers.get('Retry-After', 0))))
+            except ValueError:
+                pass
+            time.sleep(delay)
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def encode(self, payload):
+        """ Corpo e cabeçalhos no formato/compressão atuais do cliente """
+        if self.body_format == 'msgpack':
+            body, headers = msgpack.packb(payload), {"Content-Type": MSGPACK_MEDIA_TYPE}
+        else:
+            body, headers = json.dumps(payload).encode('utf-8'), {"Content-Type": "application/json"}
+        if len(body) >= API_COMPRESS_MIN_BYTES:
+            if self.body_encoding == 'zstd':
+                body = zstandard.ZstdCompressor(level=3).compress(body)
+            else:
+                body = gzip.compress(body, compresslevel=6, mtime=0)
+            headers["Content-Encoding"] = self.body_encoding
+        return body, headers
+
+    def downgrade(self):
+        """ Servidor recusou o corpo (415): zstd -> gzip -> JSON. False se não há para onde descer """
+        if self.body_encoding == 'zstd':
+            self.body_encoding = 'gzip'
+        elif self.body_format == 'msgpack':
+            self.body_format = 'json'
+        else:
+            return False
+        log.warning("⚠️ Servidor recusou o formato compacto, usando um mais simples",
+                    extra=kv(format=self.body_format, encoding=self.body_encoding))
+        return True
+
+    def send(self, method, path, payload, **kwargs):
+        """ Como request(), com o payload no formato compacto negociado com o servidor """
+        while True:
+            body, headers = self.encode(payload)
+            response = self.request(method, path, data=body, headers=headers, **kwargs)
+            if response.status_code != 415 or not self.downgrade():
+                return response
+
+    @staticmethod
+    def parse(response):
+        """ Corpo da resposta, em MessagePack ou JSON conforme o Content-Type """
+        if msgpack is not None and response.headers.get('Content-Type', '').startswith(MSGPACK_MEDIA_TYPE):
+            return msgpack.unpackb(response.content, raw=False)
+        return response.json()
+
+API = ApiClient(API_URL)
+
+class WhitelistCache:
+    """
+    Cópia local da Whitelist mantida em memória e em disco.
+    Carrega o último snapshot salvo e depois aplica apenas os deltas
+    versionados do servidor, de modo que a decisão de bloqueio é local
+    e continua funcionando com o Dashboard fora do ar. As regras ficam
+    compiladas em um RuleMatcher (mesma lógica do servidor).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.version = 0
+        self.devices = frozenset()
+        self.matcher = RuleMatcher()
+        self._lock = threading.Lock()
+        self._full_synced_at = None
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            self.version = data.get('version', 0)
+            self.devices = frozenset(data.get('devices', []))
+            self.matcher = RuleMatcher(self.devices)
+        except (OSError, ValueError):
+            pass
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"version": self.version, "devices": sorted(self.devices)}, f)
+        os.replace(tmp_path, self.path) # Escrita atômica: nunca deixa um snapshot pela metade
+
+    def contains(self, device_id):
+        return self.matcher.match(device_id) is not None
+
+    def sync(self, full_interval=WHITELIST_FULL_SYNC_INTERVAL):
+        """
+        Baixa o delta desde a versão local; na partida e a cada 'full_interval'
+        segundos pede o snapshot completo (since=0).
+        """
+        with self._lock:
+            now = time.monotonic()
+            full = self._full_synced_at is None or now - self._full_synced_at >= full_interval
+            try:
+                r = API.get("/whitelist/sync/", params={"since": 0 if full else self.version})
+                if r.status_code != 200:
+                    return False
+                data = API.parse(r)
+            except Exception as e:
+                METRICS.inc('errors_total', stage='whitelist_sync')
+                log.warning("⚠️ Whitelist: sincronização falhou, usando cache local", extra=kv(version=self.version, error=e))
+                return False
+
+            devices_before = self.devices
+            if data['full']:
+                self._full_synced_at = now
+                devices = frozenset(data['devices'])
+                if devices != self.devices:
+                    # Snapshot: compila um matcher novo e troca de uma vez (leitores nunca veem estado parcial)
+                    self.devices = devices
+                    self.matcher = RuleMatcher(self.devices)
+            else:
+                # Delta: o servidor reenvia uma janela já aplicada; só o que de fato mudou toca o matcher
+                removed = self.devices & set(data['removed'])
+                added = set(data['added']) - self.devices
+                for rule in removed:
+                    self.matcher.remove(rule)
+                for rule in added:
+                    self.matcher.add(rule)
+                self.devices = (self.devices | added) - removed
+            if data['version'] == self.version and self.devices == devices_before:
+                return True
+            self.version = data['version']
+            self._save()
+            log.info("🔄 Whitelist sincronizada", extra=kv(version=self.version, devices=len(self.devices)))
+            return True
+
+class EventOutbox:
+    """
+    Fila persistente (SQLite) de eventos pendentes de envio.
+    Os eventos são gravados em disco antes de qualquer tentativa de rede e
+    só são removidos depois que o servidor confirma o lote; uma rajada de
+    inserções vira um único POST em /logs/bulk/. Entrega "ao menos uma vez".
+    """
+
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS outbox (id INTEGER PRIMARY KEY AUTOINCREMENT, payload TEXT NOT NULL)")
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+
+    def put(self, event):
+        with self._lock:
+            self._db.execute("INSERT INTO outbox (payload) VALUES (?)", (json.dumps(event),))
+        self._wakeup.set()
+
+    def depth(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+    def _peek(self, limit):
+        with self._lock:
+            return self._db.execute("SELECT id, payload FROM outbox ORDER BY id LIMIT ?", (limit,)).fetchall()
+
+    def _ack(self, last_id):
+        with self._lock:
+            self._db.execute("DELETE FROM outbox WHERE id <= ?", (last_id,))
+
+    def flush(self):
+        """ Envia os eventos pendentes em lotes; retorna False se o servidor não confirmou """
+        while True:
+            rows = self._peek(OUTBOX_BATCH_SIZE)
+            if not rows:
+                return True
+            batch = [json.loads(payload) for _, payload in rows]
+            try:
+                with METRICS.timer('upload'):
+                    r = API.send('POST', "/logs/bulk/", hoist_session(batch), timeout=10)
+            except Exception as e:
+                METRICS.inc('errors_total', stage='upload')
+                log.error("❌ Falha no report, eventos mantidos na fila", extra=kv(events=len(batch), error=e))
+                NETWORK.invalidate() # Pode ter havido troca de interface/IP
+                return False
+            if r.status_code != 201:
+                METRICS.inc('errors_total', stage='upload')
+                log.error("❌ Falha no report, eventos mantidos na fila", extra=kv(events=len(batch), status=r.status_code))
+                return False
+            self._ack(rows[-1][0])
+            rejected = {item['index'] for item in API.parse(r).get('rejected', [])}
+            METRICS.inc('outbox_sent_total', len(batch) - len(rejected))
+            for i, event in enumerate(batch):
+                if i in rejected:
+                    METRICS.inc('outbox_rejected_total')
+                    log.warning("⚠️ Evento descartado pelo servidor", extra=kv(device=event['device_name']))
+                else:
+                    log.debug("📡 Evento enviado", extra=kv(action=event['action_taken'], device=event['device_name']))
+
+    def start_background_flush(self):
+        def loop():
+            while True:
+                # Com fila vazia aguarda um evento; com pendências, tenta de novo periodicamente
+                self._wakeup.wait(timeout=jittered(OUTBOX_RETRY_INTERVAL))
+                self._wakeup.clear()
+                time.sleep(OUTBOX_LINGER)
+                self.flush()
+        self._wakeup.set() # Envia imediatamente o que sobrou da última execução
+        threading.Thread(target=loop, name="event-outbox", daemon=True).start()
+
+def probe_outbound_ip():
     """ 
     Obtém o IP da interface de rede ativa que tem acesso à internet.
     Evita retornar 127.0.0.1 ou 0.0.0.0.
@@ -30,124 +579,872 @@ def get_real_ip():
         s.close()
     return ip
 
+def probe_mac_address(ip):
+    """ MAC da interface que possui o IP de saída (fallback: MAC principal da máquina) """
+    if psutil is not None:
+        for addrs in psutil.net_if_addrs().values():
+            if any(a.family == socket.AF_INET and a.address == ip for a in addrs):
+                for a in addrs:
+                    if a.family == psutil.AF_LINK and a.address:
+                        return a.address.replace('-', ':').upper()
+    node = uuid.getnode()
+    if node >> 40 & 0x01:
+        # Bit multicast ligado: o uuid não achou placa de rede e gerou um valor aleatório.
+        # Usa um MAC "administrado localmente" (02:...) derivado do hostname: estável e único por máquina.
+        node = (0x02 << 40) | int.from_bytes(uuid.uuid5(uuid.NAMESPACE_DNS, HOSTNAME).bytes[:5], 'big')
+    return ':'.join(f"{(node >> shift) & 0xff:02X}" for shift in range(40, -1, -8))
+
+class NetworkIdentity:
+    """
+    IP de saída e MAC real do agente, resolvidos uma vez e mantidos em cache.
+    Só volta a consultar a rede depois do TTL ou quando invalidado
+    (ex.: troca de interface detectada por falha de envio).
+    """
+
+    def __init__(self, ttl=NETWORK_IDENTITY_TTL):
+        self.ttl = ttl
+        self._ip = None
+        self._mac = None
+        self._expires = 0
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        ip = probe_outbound_ip()
+        if ip != self._ip or self._mac is None:
+            # A interface mudou (ou é a primeira vez): reconsulta o MAC
+            self._mac = probe_mac_address(ip)
+            self._ip = ip
+        self._expires = time.monotonic() + self.ttl
+
+    def _ensure(self):
+        if time.monotonic() >= self._expires:
+            with self._lock:
+                if time.monotonic() >= self._expires:
+                    self._refresh()
+
+    def invalidate(self):
+        self._expires = 0
+
+    @property
+    def ip(self):
+        self._ensure()
+        return self._ip
+
+    @property
+    def mac(self):
+        self._ensure()
+        return self._mac
+
+NETWORK = NetworkIdentity()
+
+def get_real_ip():
+    """ IP de saída atual (em cache, sem abrir socket por evento) """
+    return NETWORK.ip
+
+def load_agent_identity():
+    """
+    ID do agente salvo no último registro (válido só para este hostname).
+    O MAC pode mudar com a interface de saída; quem confere é get_or_create_agent().
+    """
+    try:
+        with open(os.path.join(DATA_DIR, 'agent.json'), 'r', encoding='utf-8') as f:
+            identity = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if identity.get('hostname') != HOSTNAME:
+        return None
+    return identity
+
+def save_agent_identity(identity):
+    os.makedirs(DATA_DIR, exist_ok=True)
+    path = os.path.join(DATA_DIR, 'agent.json')
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(identity, f)
+    os.replace(path + '.tmp', path)
+
 def get_or_create_agent():
-    """ Verifica registro do agente no Django ou cria um novo """
-    global AGENT_ID
+    """
+    Usa o ID salvo localmente ou registra (upsert idempotente) o agente no Django.
+    Se o MAC mudou, registra de novo levando o ID salvo: o servidor atualiza o MAC
+    do mesmo agente em vez de criar outro.
+    """
+    identity = load_agent_identity()
+    if identity and identity.get('mac_address') == NETWORK.mac:
+        log.info("✅ Agente identificado", extra=kv(hostname=HOSTNAME, agent=identity['id']))
+        return identity['id']
+
     try:
-        response = requests.get(f"{API_URL}/agents/", timeout=5)
-        if response.status_code == 200:
-            agents = response.json()
-            for a in agents:
-                if a['hostname'] == HOSTNAME:
-                    print(f"✅ Agente '{HOSTNAME}' identificado (ID: {a['id']})")
-                    return a['id']
-        
-        print(f"📝 Registrando novo agente: {HOSTNAME}...")
-        new_agent = {
+        log.info("📝 Registrando agente", extra=kv(hostname=HOSTNAME, mac=NETWORK.mac))
+        res = API.post("/agents/register/", json={
+            "agent": identity['id'] if identity else None,
             "hostname": HOSTNAME,
-            "mac_address": "00:00:00:00:00:00", 
-            "policy": "BLOCK_ALL"
-        }
-        res = requests.post(f"{API_URL}/agents/", json=new_agent, timeout=5)
-        if res.status_code == 201:
-            new_id = res.json()['id']
-            print(f"✅ Registro concluído com sucesso (Novo ID: {new_id})")
-            return new_id
+            "mac_address": NETWORK.mac,
+            "ip_address": NETWORK.ip,
+            "policy": DEFAULT_POLICY
+        })
+        if res.status_code in (200, 201):
+            data = API.parse(res)
+            save_agent_identity({
+                "id": data['id'],
+                "hostname": HOSTNAME,
+                "mac_address": NETWORK.mac,
+                "policy": data['policy'],
+            })
+            log.info("✅ Registro concluído", extra=kv(agent=data['id'], created=data['created']))
+            return data['id']
+        log.error("🚨 Registro recusado pelo servidor", extra=kv(status=res.status_code))
     except Exception as e:
-        print(f"🚨 Erro de conexão com o Servidor: {e}")
-        return None
+        log.error("🚨 Erro de conexão com o servidor", extra=kv(error=e))
+    return None
 
-def is_authorized(device_id):
-    """ Consulta a Whitelist via API """
-    try:
-        encoded_id = urllib.parse.quote(device_id, safe='')
-        url = f"{API_URL}/agents/check-auth/{encoded_id}/"
-        response = requests.get(url, timeout=3)
-        return response.status_code == 200
-    except:
-        return False
+# --- MOTOR DE DECISÃO (POLÍTICA DO AGENTE + WHITELIST) ---
+ALLOW = "AUTHORIZED"
+BLOCK = "BLOCKED"
+READ_ONLY = "READ_ONLY"
 
-def eject_usb(drive_letter):
-    """ Ejeta a unidade via PowerShell """
-    try:
-        cmd = f"powershell $drive = '{drive_letter}'; (New-Object -ComObject Shell.Application).Namespace(17).ParseName($drive).InvokeVerb('Eject')"
-        subprocess.run(cmd, shell=True, capture_output=True)
+# Destino de um dispositivo fora da Whitelist em cada política
+POLICY_FALLBACK = {
+    "BLOCK_ALL": BLOCK,
+    "READ_ONLY": READ_ONLY,
+}
+
+Decision = namedtuple('Decision', ['verdict', 'rule', 'policy', 'latency_us'])
+
+def compile_policy(policy, matcher):
+    """
+    Gera o avaliador da política: uma função de um único dispositivo, sem
+    ramificações por política no caminho quente. Política desconhecida
+    cai no bloqueio (falha fechada).
+    """
+    if policy == "ALLOW_ALL":
+        return lambda device_id: (ALLOW, None)
+
+    fallback = POLICY_FALLBACK.get(policy, BLOCK)
+    match = matcher.match
+
+    def evaluate(device_id):
+        rule = match(device_id)
+        return (ALLOW, rule) if rule is not None else (fallback, None)
+    return evaluate
+
+class PolicyEngine:
+    """
+    Política do agente (Agent.policy) compilada junto com as regras da Whitelist.
+    A política é reconsultada com If-None-Match (304 quando não mudou) e as regras
+    chegam por delta; o avaliador só é recompilado quando uma das duas muda.
+    """
+
+    def __init__(self, whitelist, policy=DEFAULT_POLICY):
+        self.whitelist = whitelist
+        self.policy = policy
+        self._matcher = None
+        self._compiled = None
+        self._lock = threading.Lock()
+        self.compile()
+
+    def compile(self):
+        matcher = self.whitelist.matcher
+        # Troca de referência atômica: decisões em andamento usam o avaliador anterior
+        self._compiled = (self.policy, compile_policy(self.policy, matcher))
+        self._matcher = matcher
+
+    def decide(self, device_id):
+        policy, evaluate = self._compiled
+        start = time.perf_counter()
+        verdict, rule = evaluate(device_id)
+        elapsed = time.perf_counter() - start
+        decision = Decision(verdict, rule, policy, elapsed * 1e6)
+        METRICS.observe('decide', elapsed)
+        log.info("⚖️ Decisão", extra=kv(verdict=verdict, policy=policy, rule=rule or '-', latency_us=round(decision.latency_us, 1), device_id=device_id))
+        return decision
+
+    def refresh_policy(self):
+        """ Consulta condicional: o servidor devolve 304 enquanto a política for a mesma """
+        try:
+            r = API.get(f"/agents/{AGENT_ID}/policy/", headers={"If-None-Match": f'"{self.policy}"'})
+        except Exception as e:
+            METRICS.inc('errors_total', stage='policy_sync')
+            log.warning("⚠️ Política: consulta falhou, mantendo a atual", extra=kv(policy=self.policy, error=e))
+            return False
+        if r.status_code != 200:
+            return r.status_code == 304
+
+        policy = API.parse(r)['policy']
+        if policy != self.policy:
+            log.warning("🔐 Política alterada pelo Dashboard", extra=kv(previous=self.policy, policy=policy))
+            self.policy = policy
+            identity = load_agent_identity()
+            if identity:
+                save_agent_identity({**identity, "policy": policy}) # Vale também offline no próximo boot
+            self.compile()
         return True
-    except:
-        return False
+
+    def sync(self):
+        with self._lock:
+            self.refresh_policy()
+            self.whitelist.sync()
+            # Deltas alteram o matcher no lugar; só um snapshot completo troca o objeto
+            if self.whitelist.matcher is not self._matcher:
+                self.compile()
+
+    def start_background_sync(self, interval=WHITELIST_SYNC_INTERVAL):
+        def loop():
+            while True:
+                time.sleep(jittered(interval))
+                self.sync()
+        threading.Thread(target=loop, name="policy-sync", daemon=True).start()
+
+def decide(device_id):
+    """ Decide localmente (sem round trip ao servidor); sem motor carregado, bloqueia """
+    if ENGINE is None:
+        return Decision(BLOCK, None, None, 0.0)
+    return ENGINE.decide(device_id)
+
+EjectResult = namedtuple('EjectResult', ['drive', 'ok', 'latency_ms', 'error'])
+
+DRIVE_LETTER_RE = re.compile(r'^[A-Za-z]:$')
+DEVICE_NODE_RE = re.compile(r'^/dev/[A-Za-z0-9]+$') # Discos no Linux (udev)
+
+def normalize_drive(drive):
+    """ Letra de unidade (E:) ou nó de dispositivo (/dev/sdb); None se inválido """
+    if DRIVE_LETTER_RE.match(drive):
+        return drive.upper()
+    if DEVICE_NODE_RE.match(drive):
+        return drive
+    return None
+
+# Script carregado uma única vez em cada processo PowerShell persistente.
+# Cada lote é uma chamada a Eject-Drives, que só dispara o Eject de todas as unidades
+# (a confirmação de que sumiram é feita pelo agente, fora do processo), ou a
+# Protect-Drives, que marca o disco como somente leitura e o remonta para valer na hora.
+# A saída redirecionada do PowerShell usa a code page OEM; o bootstrap força UTF-8.
+POWERSHELL_BOOTSTRAP = """
+[Console]::OutputEncoding = [Text.Encoding]::UTF8
+$ErrorActionPreference = 'Stop'
+$shell = New-Object -ComObject Shell.Application
+function Eject-Drives([string[]]$drives) {
+    $results = @()
+    foreach ($d in $drives) {
+        $sw = [Diagnostics.Stopwatch]::StartNew()
+        $ok = $false; $err = $null
+        try {
+            $item = $shell.Namespace(17).ParseName($d)
+            if ($item -eq $null) { throw 'unidade nao encontrada' }
+            $item.InvokeVerb('Eject')
+            $ok = $true
+        } catch { $err = $_.Exception.Message }
+        $results += @{ drive = $d; ok = $ok; ms = $sw.Elapsed.TotalMilliseconds; error = $err }
+    }
+    Write-Output ('@@RESULT ' + (ConvertTo-Json -Compress -InputObject @($results)))
+}
+function Protect-Drives([string[]]$drives) {
+    $results = @(); $done = @{}
+    foreach ($d in $drives) {
+        $sw = [Diagnostics.Stopwatch]::StartNew()
+        $ok = $false; $err = $null
+        try {
+            $disk = Get-Partition -DriveLetter $d.Substring(0, 1) | Get-Disk
+            if (-not $done.ContainsKey($disk.Number)) {
+                Set-Disk -Number $disk.Number -IsReadOnly $true
+                Set-Disk -Number $disk.Number -IsOffline $true
+                Set-Disk -Number $disk.Number -IsOffline $false
+                $done[$disk.Number] = $true
+            }
+            $ok = (Get-Disk -Number $disk.Number).IsReadOnly
+            if (-not $ok) { $err = 'disco continua gravavel' }
+        } catch { $err = $_.Exception.Message }
+        $results += @{ drive = $d; ok = $ok; ms = $sw.Elapsed.TotalMilliseconds; error = $err }
+    }
+    Write-Output ('@@RESULT ' + (ConvertTo-Json -Compress -InputObject @($results)))
+}
+"""
+
+def drive_mounted(drive):
+    return os.path.exists(drive + '\\')
+
+def confirm_ejected(results, start, timeout, mounted=drive_mounted):
+    """
+    Aguarda, todas juntas, as unidades cujo Eject foi disparado sumirem.
+    A espera total é a da unidade mais lenta (e não a soma delas); quem
+    continua montada depois de 'timeout' segundos vira falha.
+    """
+    pending = {r.drive for r in results if r.ok}
+    gone = {}
+    deadline = time.monotonic() + timeout
+    while pending:
+        for d in [d for d in pending if not mounted(d)]:
+            pending.discard(d)
+            gone[d] = (time.perf_counter() - start) * 1000
+        if not pending or time.monotonic() >= deadline:
+            break
+        time.sleep(0.05)
+
+    elapsed = (time.perf_counter() - start) * 1000
+    confirmed = []
+    for r in results:
+        if not r.ok:
+            confirmed.append(r)
+        elif r.drive in gone:
+            confirmed.append(EjectResult(r.drive, True, gone[r.drive], None))
+        else:
+            confirmed.append(EjectResult(r.drive, False, elapsed, "unidade continua montada"))
+    return confirmed
+
+class PowerShellSession:
+    """
+    Um processo PowerShell mantido vivo e alimentado via stdin.
+    Elimina o custo de inicialização do PowerShell (centenas de ms) a cada unidade;
+    o processo é recriado automaticamente se morrer ou travar.
+    """
+
+    def __init__(self):
+        self._proc = None
+        self._lines = None
+        try:
+            self._start() # Já deixa o processo pronto antes do primeiro dispositivo
+        except OSError as e:
+            log.error("⚠️ PowerShell indisponível para ejeção", extra=kv(error=e))
+            self._proc = None
+
+    def _start(self):
+        self._proc = subprocess.Popen(
+            ["powershell", "-NoLogo", "-NoProfile", "-NonInteractive", "-Command", "-"],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            text=True, encoding='utf-8', errors='replace', bufsize=1,
+            creationflags=getattr(subprocess, 'CREATE_NO_WINDOW', 0),
+        )
+        self._lines = queue.Queue()
+        proc, lines = self._proc, self._lines
+
+        def reader():
+            try:
+                for line in proc.stdout:
+                    lines.put(line)
+            finally:
+                lines.put(None) # Processo encerrado (ou leitura falhou): ninguém fica esperando o timeout
+
+        threading.Thread(target=reader, name="eject-reader", daemon=True).start()
+        self._send(POWERSHELL_BOOTSTRAP)
+
+    def _send(self, script):
+        # Com "-Command -" o PowerShell executa ao receber uma linha em branco
+        self._proc.stdin.write(script.strip() + "\n\n")
+        self._proc.stdin.flush()
+
+    def _stop(self):
+        if self._proc is not None:
+            self._proc.kill()
+            self._proc = None
+
+    def run(self, command, drives, timeout):
+        try:
+            if self._proc is None or self._proc.poll() is not None:
+                self._start()
+            self._send(command)
+
+            deadline = time.monotonic() + timeout
+            while True:
+                line = self._lines.get(timeout=max(0, deadline - time.monotonic()))
+                if line is None:
+                    raise RuntimeError("processo PowerShell encerrado")
+                if line.startswith('@@RESULT '):
+                    break
+        except (queue.Empty, OSError, RuntimeError) as e:
+            self._stop()
+            error = "timeout" if isinstance(e, queue.Empty) else str(e)
+            return [EjectResult(d, False, None, error) for d in drives]
+
+        data = json.loads(line[len('@@RESULT '):])
+        return [EjectResult(r['drive'], r['ok'], r['ms'], r['error']) for r in data]
+
+class PowerShellEjectBackend:
+    """
+    Pequeno pool de processos PowerShell persistentes. Um lote ocupa um
+    processo só enquanto o PowerShell trabalha: a confirmação da ejeção é
+    feita aqui, sem segurar o processo, e uma proteção lenta (Set-Disk)
+    deixa os outros processos livres para as ejeções.
+    """
+
+    def __init__(self, timeout=EJECT_TIMEOUT, confirm_timeout=EJECT_CONFIRM_TIMEOUT, pool_size=EJECT_POOL_SIZE):
+        self.timeout = timeout
+        self.confirm_timeout = confirm_timeout
+        self._idle = queue.Queue()
+        for _ in range(pool_size):
+            self._idle.put(PowerShellSession())
+
+    def _run(self, command, drives):
+        session = self._idle.get()
+        try:
+            return session.run(command, drives, self.timeout)
+        finally:
+            self._idle.put(session)
+
+    def eject_many(self, drives):
+        start = time.perf_counter()
+        drive_list = ",".join(f"'{d}'" for d in drives)
+        results = self._run(f"Eject-Drives @({drive_list})", drives)
+        return confirm_ejected(results, start, self.confirm_timeout)
+
+    def protect_many(self, drives):
+        drive_list = ",".join(f"'{d}'" for d in drives)
+        return self._run(f"Protect-Drives @({drive_list})", drives)
+
+class FakeEjectBackend:
+    """
+    Backend simulado para testes e ambientes sem Windows.
+    'fail' lista as unidades que devem falhar e 'delay' simula a latência por unidade.
+    """
+
+    def __init__(self, fail=(), delay=0):
+        self.fail = {d.upper() for d in fail}
+        self.delay = delay
+        self.ejected = []
+        self.protected = []
+
+    def _simulate(self, drives, done):
+        results = []
+        for d in drives:
+            start = time.perf_counter()
+            if self.delay:
+                time.sleep(self.delay)
+            ok = d.upper() not in self.fail
+            if ok:
+                done.append(d)
+            results.append(EjectResult(d, ok, (time.perf_counter() - start) * 1000, None if ok else "falha simulada"))
+        return results
+
+    def eject_many(self, drives):
+        return self._simulate(drives, self.ejected)
+
+    def protect_many(self, drives):
+        return self._simulate(drives, self.protected)
+
+EJECT_BACKENDS = {
+    'powershell': PowerShellEjectBackend,
+    'fake': FakeEjectBackend,
+}
+
+class EjectWorker:
+    """ Ponto único de ejeção/proteção: valida as letras e delega o lote ao backend configurado """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def _dispatch(self, operation, drives):
+        valid = [normalize_drive(d) for d in drives if normalize_drive(d)]
+        results = [EjectResult(d, False, None, "unidade inválida") for d in drives if not normalize_drive(d)]
+        if valid:
+            results = operation(valid) + results
+        return results
+
+    def eject_many(self, drives):
+        return self._dispatch(self.backend.eject_many, drives)
+
+    def protect_many(self, drives):
+        """ Deixa as unidades montadas, mas somente leitura (política READ_ONLY) """
+        return self._dispatch(self.backend.protect_many, drives)
+
+def get_ejector():
+    global EJECTOR
+    if EJECTOR is None:
+        EJECTOR = EjectWorker(EJECT_BACKENDS[EJECT_BACKEND]())
+    return EJECTOR
+
+def eject_usb(drive_letter):
+    """ Ejeta uma unidade; retorna True somente se a ejeção foi confirmada """
+    return get_ejector().eject_many([drive_letter])[0].ok
 
 def report_event(device_name, device_id, action):
-    """ Envia o log para o Dashboard """
-    if AGENT_ID is None: return
+    """ Enfileira o log para o Dashboard (o envio é feito em lote pela outbox) """
+    if AGENT_ID is None or OUTBOX is None: return
 
-    try:
-        data = {
-            "agent": AGENT_ID,
-            "device_name": device_name,
-            "device_id": device_id,
-            "action_taken": action,
-            "username": USERNAME,
-            "ip_address": get_real_ip() 
-        }
-        r = requests.post(f"{API_URL}/logs/", json=data, timeout=5)
-        if r.status_code == 201:
-            print(f"📡 EVENTO ENVIADO: {action} | Dispositivo: {device_name}")
-    except Exception as e:
-        print(f"❌ FALHA NO REPORT: {e}")
+    OUTBOX.put({
+        "agent": AGENT_ID,
+        "device_name": device_name,
+        "device_id": device_id,
+        "action_taken": action,
+        "username": USERNAME,
+        "ip_address": get_real_ip(),
+        "timestamp": datetime.now(timezone.utc).isoformat()
+    })
+
+def start_heartbeat(interval=HEARTBEAT_INTERVAL):
+    """ Envia sinais de vida periódicos; o servidor marca offline quem para de enviar """
+    def loop():
+        while True:
+            try:
+                # Sem retentativas: o próximo beat já substitui um perdido
+                API.post("/agents/heartbeat/", json={"agent": AGENT_ID, "ip_address": NETWORK.ip}, retries=0)
+            except Exception:
+                METRICS.inc('errors_total', stage='heartbeat')
+            time.sleep(jittered(interval))
+    threading.Thread(target=loop, name="heartbeat", daemon=True).start()
+
+# Evento já extraído do WMI: objetos COM não podem atravessar threads
+DeviceEvent = namedtuple('DeviceEvent', ['device_id', 'device_name', 'drives', 'detected_at'])
+
+def resolve_device_id(usb, conn=None):
+    """
+    ID estável do dispositivo: "VID:PID:SERIAL" lido do PNPDeviceID.
+    O Win32_DiskDrive traz o caminho USBSTOR (nomes de fabricante/produto);
+    quando possível, troca pelos VID/PID numéricos do dispositivo USB pai.
+    Sem identidade reconhecível, volta ao DeviceID bruto do WMI.
+    """
+    identity = parse_pnp_device_id(usb.PNPDeviceID)
+    if identity is None:
+        return usb.DeviceID
+    if conn is not None and usb.PNPDeviceID.upper().startswith('USBSTOR\\'):
+        try:
+            serial = identity.serial.replace('\\', '\\\\').replace("'", "\\'")
+            for parent in conn.query(f"SELECT PNPDeviceID FROM Win32_PnPEntity WHERE PNPDeviceID LIKE 'USB\\\\VID_%{serial}'"):
+                parent_identity = parse_pnp_device_id(parent.PNPDeviceID)
+                if parent_identity is not None:
+                    identity = parent_identity
+                    break
+        except Exception:
+            pass
+    return canonical(identity)
+
+def build_device_event(usb, conn=None):
+    """ Converte o objeto Win32_DiskDrive em um DeviceEvent (roda na thread do watcher) """
+    # Melhora o nome do dispositivo: usa Model e limpa caminhos técnicos
+    raw_name = usb.Model if usb.Model else usb.Caption
+    device_name = raw_name.replace("\\\\.\\", "").strip()
+
+    # Letras de unidade para ejeção física
+    drives = [
+        logical_disk.DeviceID
+        for partition in usb.associators("Win32_DiskDriveToDiskPartition")
+        for logical_disk in partition.associators("Win32_LogicalDiskToPartition")
+    ]
+    return DeviceEvent(resolve_device_id(usb, conn), device_name, drives, time.monotonic())
+
+# --- FONTES DE EVENTOS (WATCHERS) ---
+# Cada backend expõe events(): um gerador infinito (ou finito, no sintético) de DeviceEvent.
+
+class WmiWatcher:
+    """ Win32_DiskDrive com InterfaceType USB via WMI (Windows) """
+
+    def __init__(self):
+        if wmi is None:
+            raise RuntimeError("módulo wmi não instalado")
+
+    def events(self):
+        conn = wmi.WMI()
+        watcher = conn.watch_for(
+            notification_type="Creation",
+            wmi_class="Win32_DiskDrive",
+            InterfaceType="USB"
+        )
+        while True:
+            try:
+                usb = watcher()
+                with METRICS.timer('detect'):
+                    event = build_device_event(usb, conn)
+            except Exception as e:
+                METRICS.inc('errors_total', stage='detect')
+                log.error("⚠️ Erro no monitoramento", extra=kv(error=e))
+                time.sleep(5)
+                continue
+            yield event
+
+def build_udev_event(device):
+    """ Converte um disco USB do udev em DeviceEvent, com o mesmo ID canônico do Windows """
+    vendor, product, serial = (device.get(key) for key in ('ID_VENDOR_ID', 'ID_MODEL_ID', 'ID_SERIAL_SHORT'))
+    if vendor and product and serial:
+        device_id = canonical(DeviceIdentity(vendor.upper(), product.upper(), serial.upper()))
+    else:
+        device_id = device.get('ID_SERIAL') or device.device_node
+    device_name = " ".join(filter(None, (device.get('ID_VENDOR'), device.get('ID_MODEL')))).replace('_', ' ')
+    # O disco inteiro é a unidade de ejeção/proteção no Linux
+    return DeviceEvent(device_id, device_name or device.device_node, [device.device_node], time.monotonic())
+
+class UdevWatcher:
+    """ Discos de barramento USB anunciados pelo udev (Linux, requer pyudev) """
+
+    def __init__(self):
+        if pyudev is None:
+            raise RuntimeError("pyudev não instalado (pip install pyudev)")
+
+    def events(self):
+        monitor = pyudev.Monitor.from_netlink(pyudev.Context())
+        monitor.filter_by('block', device_type='disk')
+        for device in iter(monitor.poll, None):
+            if device.action == 'add' and device.get('ID_BUS') == 'usb':
+                with METRICS.timer('detect'):
+                    event = build_udev_event(device)
+                yield event
+
+class SyntheticWatcher:
+    """
+    Gerador sintético e reproduzível de inserções: a mesma seed gera sempre a
+    mesma sequência. Chegadas de Poisson a 'rate' eventos/s, mais rajadas de
+    'burst_size' inserções simultâneas a cada 'burst_every' segundos, sorteadas
+    entre 'devices' dispositivos. 'speed' acelera o relógio (0 = sem espera),
+    'count' limita o total e 'trace' repete um arquivo NDJSON gravado com record().
+    """
+
+    def __init__(self, rate=5.0, burst_size=0, burst_every=10.0, devices=50, count=None, seed=0, speed=1.0, trace=None):
+        if not trace and rate <= 0 and burst_size <= 0:
+            raise ValueError("rate ou burst_size precisa ser positivo")
+        self.rate = rate
+        self.burst_size = burst_size
+        self.burst_every = burst_every
+        self.devices = devices
+        self.count = count
+        self.seed = seed
+        self.speed = speed
+        self.trace = trace
+
+    @staticmethod
+    def device(index):
+        """ Dispositivo simulado: 8 fabricantes (1000..1007), um produto e serial por índice """
+        return (f"{0x1000 + index % 8:04X}:{index:04X}:SIM{index:08d}", f"Pendrive Simulado {index}", [f"{chr(ord('D') + index % 23)}:"])
+
+    def schedule(self):
+        """ (instante em segundos, device_id, device_name, drives) em ordem de chegada """
+        if self.trace:
+            with open(self.trace, 'r', encoding='utf-8') as f:
+                for line in f:
+                    item = json.loads(line)
+                    yield item['at'], item['device_id'], item['device_name'], item['drives']
+            return
+
+        rng = random.Random(self.seed)
+        now, emitted = 0.0, 0
+        next_burst = self.burst_every if self.burst_size > 0 else float('inf')
+        while self.count is None or emitted < self.count:
+            gap = rng.expovariate(self.rate) if self.rate > 0 else float('inf')
+            if now + gap >= next_burst:
+                now, amount = next_burst, self.burst_size
+                next_burst += self.burst_every
+            else:
+                now, amount = now + gap, 1
+            for _ in range(amount):
+                if self.count is not None and emitted >= self.count:
+                    return
+                yield (now, *self.device(rng.randrange(self.devices)))
+                emitted += 1
+
+    def record(self, path):
+        """ Grava a sequência atual (finita: exige count ou trace) para repetir depois """
+        with open(path, 'w', encoding='utf-8') as f:
+            for at, device_id, device_name, drives in self.schedule():
+                f.write(json.dumps({"at": at, "device_id": device_id, "device_name": device_name, "drives": drives}) + "\n")
+
+    def events(self):
+        start = time.monotonic()
+        for at, device_id, device_name, drives in self.schedule():
+            if self.speed:
+                delay = start + at / self.speed - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            yield DeviceEvent(device_id, device_name, drives, time.monotonic())
+
+WATCHER_BACKENDS = {
+    'wmi': WmiWatcher,
+    'udev': UdevWatcher,
+    'synthetic': SyntheticWatcher,
+}
+
+def parse_options(spec):
+    """ "rate=50,burst_size=200,trace=a.ndjson" -> kwargs (números e null viram JSON) """
+    options = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        key, _, value = item.partition('=')
+        try:
+            options[key.strip()] = json.loads(value)
+        except ValueError:
+            options[key.strip()] = value
+    return options
+
+def get_watcher(backend=WATCHER_BACKEND, options=WATCHER_OPTIONS):
+    return WATCHER_BACKENDS[backend](**parse_options(options))
+
+class DevicePipeline:
+    """
+    Produtor/consumidor do monitor: o watcher apenas enfileira eventos e volta
+    a escutar; decisão, ejeção e report rodam em workers. Um bloqueio nunca
+    espera a confirmação de outro dispositivo (o backend confirma fora do
+    processo de ejeção), e as unidades de um mesmo disco são ejetadas em um
+    único lote, confirmadas todas juntas. Notificações repetidas de um dispositivo autorizado
+    dentro da janela de debounce são descartadas (substitui o antigo sleep
+    fixo); dispositivos bloqueados são sempre ejetados, mesmo se reinseridos.
+    A decisão vem do motor de política, calculada uma vez por evento;
+    'on_verdict' recebe (evento, veredito, segundos desde a inserção).
+    """
+
+    def __init__(self, workers=PIPELINE_WORKERS, debounce=DEBOUNCE_WINDOW, on_verdict=None):
+        self.debounce = debounce
+        self.on_verdict = on_verdict
+        self._workers = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="usb-worker")
+        self._last_seen = {}
+        self._lock = threading.Lock()
+
+    def _is_duplicate(self, event):
+        with self._lock:
+            last = self._last_seen.get(event.device_id)
+            self._last_seen[event.device_id] = event.detected_at
+            if len(self._last_seen) > 1024:
+                # Limpeza preguiçosa para o mapa não crescer indefinidamente
+                cutoff = event.detected_at - self.debounce
+                self._last_seen = {k: t for k, t in self._last_seen.items() if t >= cutoff}
+            return last is not None and event.detected_at - last < self.debounce
+
+    def submit(self, event):
+        decision = decide(event.device_id)
+        if self._is_duplicate(event) and decision.verdict == ALLOW:
+            METRICS.inc('events_debounced_total')
+            return False
+        self._workers.submit(self.handle, event, decision)
+        return True
+
+    def eject(self, drives):
+        with METRICS.timer('eject'):
+            results = get_ejector().eject_many(drives)
+        for result in results:
+            if result.ok:
+                log.warning("⚡ Unidade ejetada", extra=kv(drive=result.drive, latency_ms=round(result.latency_ms)))
+            else:
+                METRICS.inc('errors_total', stage='eject')
+                log.error("❗ Falha ao ejetar", extra=kv(drive=result.drive, error=result.error))
+
+    def close(self):
+        """ Aguarda os eventos já enfileirados terminarem """
+        self._workers.shutdown(wait=True)
+
+    def handle(self, event, decision):
+        METRICS.observe('queue', time.monotonic() - event.detected_at) # Inserção até um worker pegar o evento
+        try:
+            self.enforce(event, decision)
+        except Exception as e:
+            METRICS.inc('errors_total', stage='pipeline')
+            log.error("⚠️ Erro ao processar dispositivo", extra=kv(device=event.device_name, error=e))
+        elapsed = time.monotonic() - event.detected_at
+        METRICS.observe('total', elapsed)
+        METRICS.inc('events_total', verdict=decision.verdict)
+        if self.on_verdict is not None:
+            self.on_verdict(event, decision.verdict, elapsed)
+
+    def report(self, event, verdict):
+        with METRICS.timer('report'):
+            report_event(event.device_name, event.device_id, verdict)
+
+    def enforce(self, event, decision):
+        if decision.verdict == ALLOW:
+            log.info("✅ Status: autorizado", extra=kv(device=event.device_name))
+            self.report(event, ALLOW)
+            return
+
+        if decision.verdict == READ_ONLY:
+            log.warning("🔏 Status: somente leitura", extra=kv(device=event.device_name))
+            failed = []
+            with METRICS.timer('protect'):
+                results = get_ejector().protect_many(event.drives)
+            for result in results:
+                if result.ok:
+                    log.info("🔒 Unidade protegida contra gravação", extra=kv(drive=result.drive, latency_ms=round(result.latency_ms)))
+                else:
+                    METRICS.inc('errors_total', stage='protect')
+                    log.error("❗ Falha ao proteger", extra=kv(drive=result.drive, error=result.error))
+                    failed.append(result.drive)
+            if not failed:
+                self.report(event, READ_ONLY)
+                return
+            # Falha fechada: se não deu para proteger, o dispositivo é ejetado
+            log.warning("🚫 Proteção falhou, ejetando", extra=kv(device=event.device_name))
+            self.eject(failed)
+            self.report(event, BLOCK)
+            return
+
+        log.warning("🚫 Status: bloqueado (Kill Switch acionado)", extra=kv(device=event.device_name))
+        self.eject(event.drives)
+        self.report(event, BLOCK)
 
 def start_monitor():
-    global AGENT_ID
-    print("\n" + "="*35)
-    print("      USB SENTINEL SOC - AGENT      ")
-    print("="*35)
+    global AGENT_ID, WHITELIST, OUTBOX, ENGINE
+    log.info("USB SENTINEL SOC - AGENT")
     
     AGENT_ID = get_or_create_agent()
     
     if AGENT_ID is None:
-        print("🛑 Falha crítica: O Agente não pôde se conectar ao Dashboard.")
+        log.critical("🛑 Falha crítica: o agente não pôde se conectar ao Dashboard")
         return
 
-    c = wmi.WMI()
-    watcher = c.watch_for(
-        notification_type="Creation", 
-        wmi_class="Win32_DiskDrive", 
-        InterfaceType="USB"
-    )
+    WHITELIST = WhitelistCache(os.path.join(DATA_DIR, 'whitelist.json'))
+    identity = load_agent_identity() or {}
+    ENGINE = PolicyEngine(WHITELIST, identity.get('policy', DEFAULT_POLICY))
+    ENGINE.sync()
+    ENGINE.start_background_sync()
+    log.info("🔐 Política ativa", extra=kv(policy=ENGINE.policy))
+
+    OUTBOX = EventOutbox(os.path.join(DATA_DIR, 'outbox.db'))
+    OUTBOX.start_background_flush()
+    METRICS.gauge('outbox_depth', OUTBOX.depth)
+
+    start_heartbeat()
+    start_metrics_reporter()
+    if METRICS_PORT is not None:
+        start_metrics_server(METRICS_PORT)
+
+    get_ejector() # Sobe os processos de ejeção antes do primeiro dispositivo
+    pipeline = DevicePipeline()
+    watcher = get_watcher()
     
-    print(f"🛡️ MONITOR ATIVO: {HOSTNAME}")
-    print(f"👤 USUÁRIO: {USERNAME} | 🌐 IP: {get_real_ip()}")
-    print(">> Aguardando conexões USB...\n")
+    log.info("🛡️ Monitor ativo, aguardando conexões USB", extra=kv(
+        hostname=HOSTNAME, watcher=WATCHER_BACKEND, user=USERNAME, ip=get_real_ip()))
 
-    while True:
-        try:
-            usb = watcher()
-            device_id = usb.DeviceID
-            
-            # Melhora o nome do dispositivo: usa Model e limpa caminhos técnicos
-            raw_name = usb.Model if usb.Model else usb.Caption
-            device_name = raw_name.replace("\\\\.\\", "").strip()
-
-            print(f"🔍 Dispositivo detectado: {device_name}")
-
-            if is_authorized(device_id):
-                print(f"✅ STATUS: AUTORIZADO")
-                report_event(device_name, device_id, "AUTHORIZED")
-            else:
-                print(f"🚫 STATUS: BLOQUEADO (Kill Switch acionado)")
-                
-                # Procura a letra da unidade para ejeção física
-                for partition in usb.associators("Win32_DiskDriveToDiskPartition"):
-                    for logical_disk in partition.associators("Win32_LogicalDiskToPartition"):
-                        drive = logical_disk.DeviceID
-                        if eject_usb(drive):
-                            print(f"⚡ Unidade {drive} ejetada com sucesso!")
-                
-                report_event(device_name, device_id, "BLOCKED")
-                
-            time.sleep(2) 
-        except Exception as e:
-            print(f"⚠️ Erro no monitoramento: {e}")
-            time.sleep(5)
+    for event in watcher.events():
+        log.info("🔍 Dispositivo detectado", extra=kv(device=event.device_name, device_id=event.device_id))
+        pipeline.submit(event)
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else None
+
+def run_simulation(options, policy=DEFAULT_POLICY, rules=("1000:*:*",)):
+    """
+    Roda o pipeline completo (decisão + ejeção simulada) sobre o gerador
+    sintético, sem servidor, e mede a latência inserção→veredito e a vazão.
+    Pensado para CI no Linux: python monitor.py --simulate "rate=200,count=2000"
+    """
+    global ENGINE, EJECTOR
+    options = {"count": 1000, **parse_options(options)}
+    whitelist = WhitelistCache(os.path.join(DATA_DIR, 'simulation-whitelist.json'))
+    for rule in rules:
+        whitelist.matcher.add(rule)
+    ENGINE = PolicyEngine(whitelist, policy)
+    EJECTOR = EjectWorker(FakeEjectBackend())
+
+    latencies, verdicts = [], {}
+    lock = threading.Lock()
+    def on_verdict(event, verdict, elapsed):
+        with lock:
+            latencies.append(elapsed)
+            verdicts[verdict] = verdicts.get(verdict, 0) + 1
+
+    pipeline = DevicePipeline(on_verdict=on_verdict)
+    start = time.monotonic()
+    submitted = sum(pipeline.submit(event) for event in SyntheticWatcher(**options).events())
+    pipeline.close()
+    elapsed = time.monotonic() - start
+
+    summary = {
+        "submitted": submitted,
+        "verdicts": verdicts,
+        "seconds": round(elapsed, 3),
+        "throughput_per_s": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3) if latencies else None,
+    }
+    print(json.dumps(summary)) # Resultado para a CI (stdout), independente do nível de log
+    return summary
 
 if __name__ == "__main__":
-    start_monitor()
\ No newline at end of file
+    if len(sys.argv) > 1 and sys.argv[1] == '--simulate':
+        # Um registro por evento distorceria a medição: por padrão só erros
+        setup_logging(os.environ.get('SENTINEL_LOG_LEVEL', 'ERROR'))
+        run_simulation(sys.argv[2] if len(sys.argv) > 2 else WATCHER_OPTIONS)
+    else:
+        setup_logging()
+        start_monitor()
\ No newline at end of file